@@ -0,0 +1,399 @@
+"""
+Benchmark of the ingestion path, run next to main.py, e.g.:
+
+    python benchmark.py --ticks 500
+    python benchmark.py --db postgres --ticks 200
+    python benchmark.py --baseline benchmarks/<label>-<time>.json
+
+Every tick runs the real pipeline of the worker (main.run_tick: fetch_data, the segment write and the batched
+database write) back to back against a local fake studiocapacity API and either the Postgres of the DB_* environment
+variables (in a separate "<DB_NAME>_benchmark" database) or a stand-in which renders every statement with psycopg2
+but doesn't send it anywhere. The ticks per second, rows per second, p50/p99 latency of every stage and the peak RSS
+are printed and stored as JSON, a baseline result from a previous version is compared against.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import random
+import shutil
+import asyncio
+import argparse
+import platform
+import resource
+import tempfile
+import threading
+import subprocess
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+from psycopg2.extensions import adapt
+
+# main requires the settings of a worker, the benchmark works without real ones.
+for name, value in (("LOCATION_SHORT_TITLE", "all"), ("DB_HOSTNAME", "localhost"), ("DB_NAME", "visitors"),
+                    ("DB_USERNAME", "postgres"), ("DB_PASSWORD", "postgres"), ("DB_PORT", "5432")):
+    os.environ.setdefault(name, value)
+
+import main
+from utilities import config, constants, opening_hours, profiling, rollups, spool, utils_db, utils_log
+from utilities.management import schema
+from utilities.management.db_connect import ConnectionPool, open_connection
+
+
+class FakeStudioCapacityAPI:
+    """
+    Local stand-in of the studiocapacity endpoint, answers every request with random loads of all studios.
+
+    Example:
+        api = FakeStudioCapacityAPI(studio_count=50)
+        url = api.start()
+        ...
+        api.stop()
+    """
+
+    def __init__(self, studio_count: int = 50, latency: float = 0.0):
+        """
+        Args:
+            studio_count (int, optional): The number of studios in the response, at least the ones in STUDIO_MAP.
+            latency (float, optional): Seconds every response is delayed, e.g. to mimic the real API. Defaults to 0.
+        """
+        studio_ids = sorted({int(studio["id"]) for studio in constants.STUDIO_MAP.values()} | set(range(1, studio_count + 1)))
+        self.studio_ids = studio_ids
+        self.latency = latency
+        self.requests = 0
+        self._server = None
+
+    def payload(self) -> bytes:
+        """Return a response body like the one of the real API."""
+        return json.dumps([
+            {"studio_id": studio_id, "current_load": random.randint(0, 150), "max_capacity": 150, "name": f"Studio {studio_id}"}
+            for studio_id in self.studio_ids
+        ]).encode("utf-8")
+
+    def start(self) -> str:
+        """
+        Serve the endpoint from a background thread.
+
+        Returns:
+            str: The URL of the endpoint.
+        """
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if api.latency:
+                    time.sleep(api.latency)
+                api.requests += 1
+                body = api.payload()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="fake-api", daemon=True).start()
+        return f"http://127.0.0.1:{self._server.server_address[1]}/ajax/studiocapacity?apiToken=benchmark"
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class StandInConnection:
+    """
+    Database stand-in for machines without Postgres.
+
+    The statements (multi-row inserts and rollup upserts) are rendered by psycopg2 exactly as for a server, so the
+    client side of the database write is measured, but they are not executed. Every commit waits commit_latency
+    seconds to mimic the round trip.
+    """
+
+    encoding = "UTF8"
+    closed = 0
+
+    def __init__(self, commit_latency: float = 0.0):
+        self.commit_latency = commit_latency
+        self.statements = 0
+        self.statement_bytes = 0
+
+    def cursor(self):
+        return StandInCursor(self)
+
+    def commit(self):
+        if self.commit_latency:
+            time.sleep(self.commit_latency)
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+# A ('<timestamp>', <visitor count>) row of a rendered multi-row insert.
+INSERTED_ROW = re.compile(rb"\('([^']*)',(\d+|NULL)\)")
+
+
+class StandInCursor:
+    """
+    Cursor of the StandInConnection. Every row of an insert counts as inserted.
+    """
+
+    def __init__(self, connection: StandInConnection):
+        self.connection = connection
+        self.rowcount = -1
+        self._returned = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def mogrify(self, query, args=None) -> bytes:
+        if isinstance(query, str):
+            query = query.encode("utf-8")
+        if args is None:
+            return query
+        return query % tuple(adapt(value).getquoted() for value in args)
+
+    def execute(self, query, args=None):
+        statement = self.mogrify(query, args)
+        self.connection.statements += 1
+        self.connection.statement_bytes += len(statement)
+        self._returned = []
+        if statement.startswith(b"INSERT INTO") and b" RETURNING " in statement:
+            self._returned = [
+                (timestamp.decode("utf-8"), None if visitor_count == b"NULL" else int(visitor_count))
+                for timestamp, visitor_count in INSERTED_ROW.findall(statement)
+            ]
+        self.rowcount = len(self._returned) if self._returned else statement.count(b"),(") + 1
+
+    def fetchall(self) -> list:
+        return self._returned
+
+
+def prepare_postgres(studios: dict, db_name: str) -> ConnectionPool:
+    """
+    Create the tables of the studios in the benchmark database and empty them.
+
+    Args:
+        studios (dict): The studio contexts as returned by main.get_studios.
+        db_name (str): The name of the benchmark database, it is created if it doesn't exist.
+
+    Returns:
+        ConnectionPool: The pool of the benchmark database.
+
+    Raises:
+        psycopg2.Error: If the database cannot be reached.
+    """
+    credentials = (main.DB_HOSTNAME, db_name, main.DB_USERNAME, main.DB_PASSWORD, main.DB_PORT)
+    connection = open_connection(*credentials)
+    try:
+        for studio in studios.values():
+            table_name = studio["table_name"]
+            schema.ensure_schema(connection, table_name)
+            tables = [table_name]
+            if constants.DB_ROLLUPS:
+                rollups.create_rollup_tables(connection, table_name)
+                tables += [rollups.rollup_table_name(table_name, suffix) for suffix, _, _ in rollups.ROLLUPS]
+            with connection.cursor() as cursor:
+                cursor.execute(f"TRUNCATE {', '.join(tables)}")
+            connection.commit()
+    finally:
+        connection.close()
+    return ConnectionPool(*credentials)
+
+
+def percentiles(values: list) -> dict:
+    """Return the p50 and p99 of the values, rounded to microseconds."""
+    p50, p99 = np.percentile(values, (50, 99)) if values else (0.0, 0.0)
+    return {"p50": round(float(p50), 3), "p99": round(float(p99), 3)}
+
+
+async def run_ticks(writer: utils_db.BatchWriter, studios: dict, url: str, ticks: int, stages_file_path: str) -> list:
+    """
+    Run the ticks back to back, with the tick times advancing by REQUEST_DENSITY.
+
+    Returns:
+        list: The stage timer of every tick.
+    """
+    start = datetime.now().replace(second=0, microsecond=0)
+    timers = []
+    for index in range(ticks):
+        now = datetime.fromtimestamp(start.timestamp() + index * constants.REQUEST_DENSITY)
+        timers.append(await main.run_tick(writer, studios, now, url=url, stages_file_path=stages_file_path))
+    return timers
+
+
+def run(ticks: int = 200, db: str = "stand-in", db_name: str = None, api_studios: int = 50, api_latency: float = 0.0,
+        commit_latency: float = 0.0) -> dict:
+    """
+    Run the benchmark in a temporary directory.
+
+    Args:
+        ticks (int, optional): The number of ticks. Defaults to 200.
+        db (str, optional): "stand-in" or "postgres". Defaults to "stand-in".
+        db_name (str, optional): The Postgres database. Defaults to "<DB_NAME>_benchmark".
+        api_studios (int, optional): The number of studios in the API response. Defaults to 50.
+        api_latency (float, optional): Seconds every API response is delayed. Defaults to 0.
+        commit_latency (float, optional): Seconds every commit of the stand-in takes. Defaults to 0.
+
+    Returns:
+        dict: The results.
+    """
+    work_dir = tempfile.mkdtemp(prefix="visitors-benchmark-")
+    console = utils_log.logger.console
+    # The segments, spool and logs of the benchmark don't mix with the ones of a worker.
+    previous_config = config.set_config(config.Config.from_env(root=work_dir))
+    utils_log.logger.console = False
+
+    api = FakeStudioCapacityAPI(api_studios, api_latency)
+    url = api.start()
+    pool = None
+    try:
+        studios = main.get_studios()
+        for studio in studios.values():
+            # Every tick samples every studio.
+            studio["calendar"] = opening_hours.OpeningCalendar({"week_day": {"open": 0, "close": 24}, "week_end": {"open": 0, "close": 24}})
+
+        if db == "postgres":
+            pool = prepare_postgres(studios, db_name or f"{main.DB_NAME}_benchmark")
+            writer = utils_db.BatchWriter(pool=pool, spool=spool.Spool(work_dir), rollups=constants.DB_ROLLUPS)
+        else:
+            writer = utils_db.BatchWriter(connection=StandInConnection(commit_latency), spool=spool.Spool(work_dir), rollups=constants.DB_ROLLUPS)
+
+        started = time.perf_counter()
+        timers = asyncio.run(run_ticks(writer, studios, url, ticks, os.path.join(work_dir, "logs", "stages.log")))
+        writer.close()
+        elapsed = time.perf_counter() - started
+        writer.spool.close()
+        for studio in studios.values():
+            studio["segment_writer"].close()
+        utils_log.flush()
+    finally:
+        api.stop()
+        if pool is not None:
+            pool.closeall()
+        config.set_config(previous_config)
+        utils_log.logger.console = console
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    records = [timer.to_record(datetime.now()) for timer in timers]
+    latency_ms = {"tick": percentiles([record["total_ms"] for record in records])}
+    for stage_name in profiling.STAGES:
+        latency_ms[stage_name] = percentiles([record["stages_ms"].get(stage_name, 0.0) for record in records])
+
+    return {
+        "label": get_label(),
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "settings": {
+            "db": db, "ticks": ticks, "studios": len(studios), "api_studios": len(api.studio_ids),
+            "api_latency": api_latency, "commit_latency": commit_latency, "storage_format": constants.STORAGE_FORMAT,
+            "db_flush_rows": writer.max_rows, "db_rollups": constants.DB_ROLLUPS,
+        },
+        "seconds": round(elapsed, 3),
+        "ticks_per_second": round(ticks / elapsed, 2),
+        "samples": sum(record["samples"] for record in records),
+        "rows": writer.rows_written,
+        "rows_per_second": round(writer.rows_written / elapsed, 2),
+        "latency_ms": latency_ms,
+        # ru_maxrss is in KiB on Linux. The fake API runs in the same process.
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def get_label() -> str:
+    """Return the short commit hash of the working tree, the version the results belong to."""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unversioned"
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Compare the results against the results of a previous version.
+
+    Args:
+        results (dict): The current results.
+        baseline (dict): The baseline results.
+        tolerance (float): The relative change which counts as a regression, e.g. 0.2 for 20 %.
+
+    Returns:
+        list: The descriptions of the regressions, empty if there are none.
+    """
+    regressions = []
+    checks = (
+        ("ticks_per_second", results["ticks_per_second"], baseline["ticks_per_second"], -1),
+        ("rows_per_second", results["rows_per_second"], baseline["rows_per_second"], -1),
+        ("tick p99", results["latency_ms"]["tick"]["p99"], baseline["latency_ms"]["tick"]["p99"], 1),
+        ("peak_rss_mb", results["peak_rss_mb"], baseline["peak_rss_mb"], 1),
+    )
+    for name, value, baseline_value, worse in checks:
+        if not baseline_value:
+            continue
+        change = (value - baseline_value) / baseline_value
+        print(f"{name}: {baseline_value} -> {value} ({change:+.1%})")
+        if change * worse > tolerance:
+            regressions.append(f"{name} regressed by {abs(change):.1%} ({baseline_value} -> {value}).")
+    return regressions
+
+
+def run_command(argv: list = None) -> int:
+    """
+    Parse the command line, run the benchmark and store the results.
+
+    Args:
+        argv (list, optional): The arguments. Defaults to sys.argv.
+
+    Returns:
+        int: The exit code, 1 if the results regressed against the baseline.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark of the ingestion path of the visitors worker.")
+    parser.add_argument("--ticks", type=int, default=200, help="The number of ticks. Defaults to 200.")
+    parser.add_argument("--db", choices=("stand-in", "postgres"), default="stand-in", help="The database, the postgres of the DB_* environment variables or a stand-in.")
+    parser.add_argument("--db-name", help="The Postgres database, defaults to <DB_NAME>_benchmark. Its visitors tables are emptied.")
+    parser.add_argument("--api-studios", type=int, default=50, help="The number of studios in the API response. Defaults to 50.")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="Seconds every API response is delayed. Defaults to 0.")
+    parser.add_argument("--commit-latency", type=float, default=0.0, help="Seconds every commit of the stand-in takes. Defaults to 0.")
+    parser.add_argument("--output", help="The JSON file of the results. Defaults to benchmarks/<label>-<time>.json.")
+    parser.add_argument("--baseline", help="The JSON results of a previous version to compare against.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="The relative change which fails the comparison. Defaults to 0.2.")
+    args = parser.parse_args(argv)
+
+    output = args.output or os.path.join(constants.PATH_TO_ROOT, "benchmarks", f"{get_label()}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    results = run(args.ticks, args.db, args.db_name, args.api_studios, args.api_latency, args.commit_latency)
+
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, mode="w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2)
+
+    print(f"{results['ticks_per_second']} ticks/s, {results['rows_per_second']} rows/s, peak RSS {results['peak_rss_mb']} MiB.")
+    for stage_name, latency in results["latency_ms"].items():
+        print(f"{stage_name}: p50 {latency['p50']} ms, p99 {latency['p99']} ms")
+    print(f"Stored the results in {output}.")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for regression in regressions:
+            print(regression)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run_command())
@@ -7,25 +7,44 @@ The main objective is to collect data as workers and store it in a location wher
 
 The ultimate goal is to enable other programs to analyze the fetched data.
 This application can be cloned multiple times, each dedicated to monitoring the number of visitors in a specific studio.
+Alternatively, LOCATION_SHORT_TITLE=ALL runs a single worker which collects every studio in STUDIO_MAP.
 """
 
 import os
+import math
 import time
-from datetime import datetime, timedelta
+import signal
+import asyncio
+import functools
+from datetime import datetime
 import sys
+import psycopg2
 
 from utilities import (
+    compaction,
+    config,
     constants,
+    decoding,
+    manifest,
+    metrics,
+    opening_hours,
+    profiling,
+    rollups,
+    runlength,
+    scheduler,
+    spool,
     utils,
+    utils_binary,
     utils_csv,
     utils_db,
     utils_log
 )
 
-from utilities.management.db_connect import connect_to_db
+from utilities.management import schema
+from utilities.management.db_connect import open_connection, ConnectionPool
+from utilities.management.worker_group import WorkerGroup
 
 HEADER = ["timestamp", "visitor_count"]
-DB_TABLE_NAME = f"visitors_{constants.LOCATION_SHORT_TITLE}"
 
 # --------------- DB CONNECTION ---------------
 
@@ -56,121 +75,422 @@ except AssertionError as e:
     sys.exit(1)
 
 # Global variables.
-db_connection = None
+db_pool = None
+db_writer = None
+worker_group = None
+studios = None
 # --------------- DB CONNECTION ---------------
 
 
-def main():
+def get_studios(settings: config.Config = None) -> dict:
     """
-    Fetch data from the API and save the result with a timestamp in the visitors.csv file.
+    Resolve the studios tracked by this worker.
+
+    Args:
+        settings (config.Config, optional): The configuration of the worker. Defaults to the active configuration.
+
+    Returns:
+        dict: The studio context (id, opening hours calendar, data directory, table and segment writer) per location
+        short title. Contains every studio in STUDIO_MAP in multi-studio mode, otherwise only the configured one.
+    """
+    settings = settings or config.get_config()
+    location_short_titles = list(constants.STUDIO_MAP) if settings.IS_MULTI_STUDIO else [settings.LOCATION_SHORT_TITLE]
+    exceptions = opening_hours.load_exceptions(settings.OPENING_HOURS_FILE)
+
+    studios = {}
+    for location_short_title in location_short_titles:
+        context = settings.studio(location_short_title)
+        studios[location_short_title] = {
+            "location_short_title": location_short_title,
+            "id": context.id,
+            "opening_hours": context.opening_hours,
+            "calendar": opening_hours.OpeningCalendar(context.opening_hours, opening_hours.get_exceptions(exceptions, location_short_title)),
+            "data_dir": context.data_dir,
+            "table_name": context.table_name,
+            # Keeps the current segment open between ticks.
+            "segment_writer": (
+                utils_binary.BinarySegmentWriter() if settings.STORAGE_FORMAT == "binary" else utils_csv.CSVSegmentWriter(HEADER)
+            ),
+        }
+    return studios
+
+
+def write_samples_to_csv(samples: list):
+    """
+    Save the samples of a tick to the CSV file of their studio.
+
+    Args:
+        samples (list): The samples, each a dict with the studio context, the time and the current load.
+    """
+    for sample in samples:
+        studio, now = sample["studio"], sample["now"]
+        with profiling.stage("file_lookup"):
+            segment_manifest = manifest.get_manifest(studio["data_dir"])
+
+            # Save the data to file
+            """
+            Before writing to file, check if a file for the current day already exists (manifest lookup).
+            """
+            file_name = utils.get_today_visitors_file_name_if_it_does_exist(now.year, now.month, now.day, studio["data_dir"])
+
+            # No visitor_file for today was found or the old one is too full, create a new one.
+            if file_name is None or segment_manifest.rows(file_name) >= constants.ENTRIES_UNTIL_FILE_SEGMENTATION:
+                file_name = utils.construct_visitor_file_name(now, studio["location_short_title"])
+                segment_manifest.add_segment(file_name)
+
+        file_path = os.path.join(studio["data_dir"], file_name)
+        timestamp = int(datetime.timestamp(now))
+
+        with profiling.stage("segment_write"):
+            studio["segment_writer"].write(file_path, timestamp, sample["current_load"])
+            segment_manifest.record(file_name, timestamp)
+
+
+def write_samples_to_binary(samples: list):
+    """
+    Save the samples of a tick to the monthly binary segment of their studio.
+
+    Args:
+        samples (list): The samples, each a dict with the studio context, the time and the current load.
+    """
+    for sample in samples:
+        studio, now = sample["studio"], sample["now"]
+        with profiling.stage("file_lookup"):
+            file_path = os.path.join(studio["data_dir"], utils_binary.construct_binary_file_name(now, studio["location_short_title"]))
+        with profiling.stage("segment_write"):
+            studio["segment_writer"].write(file_path, int(datetime.timestamp(now)), sample["current_load"])
+
+
+def write_samples_to_files(samples: list):
+    """
+    Save the samples of a tick to the segment files of the configured STORAGE_FORMAT.
+
+    Args:
+        samples (list): The samples, each a dict with the studio context, the time and the current load.
+    """
+    start = time.perf_counter()
+    if constants.STORAGE_FORMAT == "binary":
+        write_samples_to_binary(samples)
+    else:
+        write_samples_to_csv(samples)
+    metrics.segment_write_seconds.observe(time.perf_counter() - start)
+
+
+def write_samples_to_db(writer: utils_db.BatchWriter, samples: list):
+    """
+    Save the samples of a tick to the database table of their studio.
+
+    Args:
+        writer (utils_db.BatchWriter): The batched database writer.
+        samples (list): The samples, each a dict with the studio context, the time and the current load.
+    """
+    with profiling.stage("db_write"):
+        # The rows are spooled on disk before they are flushed, a database outage must not stop the sampling.
+        try:
+            writer.add_rows([
+                (sample["studio"]["table_name"], (sample["now"].strftime('%Y-%m-%d %H:%M'), sample["current_load"]))
+                for sample in samples
+            ])
+            writer.flush_if_due()
+        except psycopg2.Error as e:
+            utils_log.log(f"Could not write to the database, {writer.pending} rows are spooled: {e}", os.path.join(constants.LOCATION_LOG_DIR, "db.log"))
+
+
+async def save_samples(writer: utils_db.BatchWriter, samples: list):
+    """
+    Save the samples of a tick to the segment files and the database concurrently.
+
+    Args:
+        writer (utils_db.BatchWriter): The batched database writer.
+        samples (list): The samples, each a dict with the studio context, the time and the current load.
     """
-    entries_count = 0
-    now = datetime.now()
-
-    # Initial file name
-    file_name = utils.construct_visitor_file_name(now)
-    is_week_day = utils.check_is_week_day(now.weekday())
-    day = "week_day" if is_week_day else "week_end"
-
-    global connection
-    db_connection = connect_to_db(
-        db_host=DB_HOSTNAME,
-        db_name=DB_NAME,
-        db_user=DB_USERNAME,
-        db_password=DB_PASSWORD,
-        db_port=DB_PORT,
-        recursion_depth=0
+    await asyncio.gather(
+        asyncio.to_thread(profiling.profiler.profiled(write_samples_to_files), samples),
+        asyncio.to_thread(profiling.profiler.profiled(write_samples_to_db), writer, samples),
     )
 
-    # Initialize starting table if it does not exist
-    db_schema = "(timestamp TIMESTAMP, visitor_count INT)"
-    utils_db.create_table_if_not_exists(db_connection, table_name=DB_TABLE_NAME, fields=db_schema)
 
-    position_of_studio = None
+def select_changed_samples(changes: runlength.ChangeFilter, samples: list, interval: float) -> list:
+    """
+    Select the samples to store in change-only storage.
 
-    while True:
-        now = datetime.now()
-        formatted_timestamp = now.strftime('%Y-%m-%d %H:%M')
-        is_in_opening_hours = utils.check_if_in_opening_hours(now.hour, is_week_day)
+    Args:
+        changes (runlength.ChangeFilter): The change filter of the worker.
+        samples (list): The samples of a tick, each a dict with the studio context, the time and the current load.
+        interval (float): The seconds until the next tick.
 
-        # Check if the studio is open based on the current time (starts when the gym opens)
-        if is_in_opening_hours:
-            # Get the JSON response data only for the specific location
-            studios_location_data = utils.fetch_data(constants.URL)
+    Returns:
+        list: The samples which changed or are due for a heartbeat, preceded by the ends of the interrupted runs.
+    """
+    selected = []
+    for sample in samples:
+        studio = sample["studio"]
+        for timestamp, current_load in changes.filter(studio["location_short_title"], sample["now"].timestamp(), sample["current_load"], interval):
+            selected.append({"studio": studio, "now": datetime.fromtimestamp(timestamp), "current_load": current_load})
+    return selected
 
-            if position_of_studio is None:
-                for i, studio in enumerate(studios_location_data):
-                    if studio["studio_id"] == constants.STUDIO_ID:
-                        position_of_studio = i
 
-            studio_location_data = studios_location_data[position_of_studio]
-            assert studio_location_data is not None, f"Studio data for location {constants.LOCATION_ID} / {constants.LOCATION_SHORT_TITLE} was not found."
+def get_open_studios(studios: dict, now: datetime) -> list:
+    """
+    Return the location short titles of the studios which are open at the given time.
+    """
+    return [location_short_title for location_short_title, studio in studios.items() if studio["calendar"].is_open(now)]
 
-            entries_count += 1  # Increment entries count
 
-            # Construct a new file after every X entries because the old one was too full
-            if entries_count % constants.ENTRIES_UNTIL_FILE_SEGMENTATION == 0:
-                file_name = utils.construct_visitor_file_name(datetime.date())
-                entries_count = 0  # Reset entries count
+def calculate_closed_sleep_time_in_seconds(studios: dict, now: datetime) -> int:
+    """
+    Calculate how long to sleep because every studio is closed.
 
-            # Save the data to file
-            """
-            Before writing to file, check if a file for the current day already exists.
+    Args:
+        studios (dict): The studio contexts as returned by get_studios.
+        now (datetime): The current date and time.
 
-            1. Check all files in the current folder
-            2. Search for the current day in the file name
-            """
-            visitor_file_name_if_exists = utils.get_today_visitors_file_name_if_it_does_exist(now.year, now.month, now.day)
+    Returns:
+        int: 0 if any studio is open, otherwise the number of seconds until the first studio opens.
+    """
+    opening = opening_hours.next_opening([studio["calendar"] for studio in studios.values()], now)
+    if opening == now:
+        return 0
 
-            # No visitor_file for today was found, create a new one.
-            if visitor_file_name_if_exists is None:
-                visitor_file_name_if_exists = file_name
+    """
+    The studios are closed, sleep until the next opening.
+    """
+    if opening is None:
+        # Closed for the whole calendar (e.g. a long closure), look again after a day.
+        sleep_seconds = 24 * 60 * 60
+    else:
+        sleep_seconds = math.ceil((opening - now).total_seconds())
 
-            file_path = os.path.join(constants.LOCATION_DATA_DIR, visitor_file_name_if_exists)
+    # Calculate sleep hours and minutes
+    sleep_hours = sleep_seconds // 60 // 60
+    sleep_minutes = (int(sleep_seconds / 60)) - sleep_hours * 60
+    utils_log.log(f"Studio is closed, now sleep: {sleep_hours} hours and {sleep_minutes} minutes.")
+    return sleep_seconds
 
-            timestamp = int(datetime.timestamp(now))
-            current_load = studio_location_data.get("current_load")
 
-            utils_csv.write_to_csv(file_path, HEADER, timestamp, current_load)
+def prepare_database(connection, studios: dict):
+    """
+    Create the partitioned tables of the studios or migrate existing ones, and their rollup tables.
 
-            # Save the data to the database
-            """
-            Before writing to the database, make sure the database table exists.
-            """
-            utils_db.save_to_db(db_connection, table_name=DB_TABLE_NAME, fields="(timestamp, visitor_count)", values=(formatted_timestamp, current_load))
+    Args:
+        connection (psycopg2.extensions.connection): The database connection.
+        studios (dict): The studio contexts as returned by get_studios.
 
-            utils_log.log(message=f"Current load in {constants.LOCATION_SHORT_TITLE}: {current_load}.")
+    Raises:
+        psycopg2.Error: If the tables could not be created or migrated.
+    """
+    for studio in studios.values():
+        schema.ensure_schema(connection, table_name=studio["table_name"])
+        if constants.DB_ROLLUPS and rollups.create_rollup_tables(connection, table_name=studio["table_name"]):
+            # New rollup tables start with the existing history.
+            rollups.rebuild(connection, table_name=studio["table_name"])
 
-            # Sleep before making the next request
-            time.sleep(constants.REQUEST_DENSITY)
-        else:
-            """
-            The studio is closed, sleep until the next day.
-            """
-            opening_time = constants.OPENING_HOURS[day].get("open")
-            sleep_seconds = utils.calculate_sleep_time_in_seconds(now, opening_time)
 
-            # Calculate sleep hours and minutes
-            sleep_hours = sleep_seconds // 60 // 60
-            sleep_minutes = (int(sleep_seconds / 60)) - sleep_hours * 60
+def run_daily_maintenance(pool, studios: dict, today):
+    """
+    Compact the CSV segments of the closed days and pre-create the upcoming partitions of every studio.
+
+    Args:
+        pool (db_connect.ConnectionPool): The database connection pool, None to skip the partitions.
+        studios (dict): The studio contexts as returned by get_studios.
+        today (date): The current day, its segments are still written.
+    """
+    if constants.COMPACT_SEGMENTS and constants.STORAGE_FORMAT == "csv":
+        for studio in studios.values():
+            try:
+                # Yesterday's segment may still be open with buffered rows, the next sample opens a new one.
+                studio["segment_writer"].close()
+                manifest.get_manifest(studio["data_dir"]).save()
+                compaction.compact(studio["data_dir"], studio["location_short_title"], today, remove_sources=constants.COMPACT_REMOVE_SEGMENTS)
+            except (OSError, ValueError) as e:
+                # The segments stay untouched and are compacted on the next day.
+                utils_log.log(f"Could not compact the segments of {studio['location_short_title']}: {e}", os.path.join(constants.LOCATION_LOG_DIR, "compaction.log"))
+
+    if pool is not None:
+        try:
+            with pool.connection() as connection:
+                for studio in studios.values():
+                    schema.ensure_partitions(connection, studio["table_name"], today)
+        except psycopg2.Error as e:
+            # Rows beyond the existing partitions land in the default partition, try again on the next day.
+            utils_log.log(f"Could not create the upcoming partitions: {e}", os.path.join(constants.LOCATION_LOG_DIR, "db.log"))
+
+
+async def run_tick(writer: utils_db.BatchWriter, studios: dict, now: datetime, url: str = None, stages_file_path: str = None,
+                   poller: scheduler.AdaptiveInterval = None, changes: runlength.ChangeFilter = None, group: WorkerGroup = None):
+    """
+    Fetch the data of all studios once and save the load of every open studio.
+
+    The studiocapacity endpoint returns all studios at once, so a single request per tick serves every studio.
+
+    Args:
+        writer (utils_db.BatchWriter): The batched database writer.
+        studios (dict): The studio contexts as returned by get_studios.
+        now (datetime): The time of the tick.
+        url (str, optional): The URL of the API. Defaults to URL.
+        stages_file_path (str, optional): The file of the stage timings. Defaults to "stages.log".
+        poller (scheduler.AdaptiveInterval, optional): Chooses the interval until the next tick from the samples.
+            Defaults to the fixed REQUEST_DENSITY.
+        changes (runlength.ChangeFilter, optional): Stores only the samples whose load changed. Defaults to
+            storing every sample.
+        group (WorkerGroup, optional): Samples only the studios claimed in the worker group. Defaults to every
+            studio.
+
+    Returns:
+        profiling.StageTimer: The stage timings of the tick, with the number of "samples", the number of "stored"
+        rows and the "interval" until the next tick in its fields.
+    """
+    with profiling.tick(now, stages_file_path) as timer:
+        claimed = None
+        if group is not None:
+            with profiling.stage("claim"):
+                claimed = await asyncio.to_thread(group.claim)
+
+        # Get the JSON response data of all studios
+        studios_location_data = await asyncio.to_thread(profiling.profiler.profiled(utils.fetch_data), url or constants.URL)
+        if studios_location_data is None:
+            # The failure was logged, try again on the next tick.
+            timer.fields["samples"] = 0
+            return timer
+
+        try:
+            with profiling.stage("decode"):
+                loads_by_id = decoding.studio_decoder.index(studios_location_data)
+        except ValueError:
+            # The drift was logged, try again on the next tick.
+            timer.fields["samples"] = 0
+            return timer
+
+        samples = []
+        with profiling.stage("studio_lookup"):
+            for location_short_title in get_open_studios(studios, now):
+                if claimed is not None and location_short_title not in claimed:
+                    # Sampled by another member of the worker group.
+                    continue
+                studio = studios[location_short_title]
+                if studio["id"] not in loads_by_id:
+                    metrics.payload_drift_total.inc(kind="missing")
+                    utils_log.log(f"Studio data for location {studio['id']} / {location_short_title} was not found.", level=utils_log.WARNING)
+                    continue
+
+                samples.append({"studio": studio, "now": now, "current_load": loads_by_id[studio["id"]]})
+        interval = constants.REQUEST_DENSITY
+        if poller is not None:
+            interval = poller.observe(now, {sample["studio"]["location_short_title"]: sample["current_load"] for sample in samples})
+        stored = select_changed_samples(changes, samples, interval) if changes is not None else samples
+        timer.fields["samples"] = len(samples)
+        timer.fields["stored"] = len(stored)
+        timer.fields["interval"] = interval
+
+        await save_samples(writer, stored)
+        if group is not None:
+            # Handed over only once the samples of this tick are saved, the new owner starts with the next tick.
+            await asyncio.to_thread(group.release_surplus)
+
+        with profiling.stage("log"):
+            for sample in samples:
+                metrics.samples_total.inc(studio=sample["studio"]["location_short_title"])
+                metrics.last_sample_timestamp_seconds.set(time.time(), studio=sample["studio"]["location_short_title"])
+                utils_log.log(message=f"Current load in {sample['studio']['location_short_title']}: {sample['current_load']}, next sample in {interval:.0f} seconds.")
+    return timer
+
+
+async def collect(writer: utils_db.BatchWriter, studios: dict, group: WorkerGroup = None):
+    """
+    Fetch the data from the API on every wall-clock aligned tick and save the load of every open studio.
+
+    Args:
+        writer (utils_db.BatchWriter): The batched database writer.
+        studios (dict): The studio contexts as returned by get_studios.
+        group (WorkerGroup, optional): The worker group the studios are shared with. Defaults to none.
+    """
+    maintained_day = None
+    # With ADAPTIVE_POLLING the interval follows the rate of change of the load.
+    poller = scheduler.AdaptiveInterval() if constants.ADAPTIVE_POLLING else None
+    # With CHANGE_ONLY_STORAGE only the changes of the load are stored.
+    changes = runlength.ChangeFilter() if constants.CHANGE_ONLY_STORAGE else None
+
+    async def tick(now, stats):
+        nonlocal maintained_day
+        await run_tick(writer, studios, now, poller=poller, changes=changes, group=group)
+
+        # Once per day, after the samples are saved so the segments of today are never touched concurrently.
+        if maintained_day != now.date():
+            await asyncio.to_thread(run_daily_maintenance, writer.pool, studios, now.date())
+            maintained_day = now.date()
+
+    await scheduler.run_aligned(
+        tick,
+        interval=poller.interval if poller else constants.REQUEST_DENSITY,
+        closed_sleep_seconds=lambda now: calculate_closed_sleep_time_in_seconds(studios, now),
+        next_interval=(lambda: poller.interval) if poller else None
+    )
 
-            utils_log.log(f"Studio is closed, now sleep: {sleep_hours} hours and {sleep_minutes} minutes.")
-            time.sleep(sleep_seconds)
 
-            # After sleeping, create a new file
-            time_after_sleeping = now + timedelta(hours=sleep_hours, minutes=sleep_minutes)
+def main():
+    """
+    Fetch data from the API and save the result with a timestamp in the visitors.csv file.
 
-            file_name = utils.construct_visitor_file_name(time_after_sleeping)
-            is_week_day = utils.check_is_week_day(time_after_sleeping.weekday())
+    In multi-studio mode (LOCATION_SHORT_TITLE=ALL) every studio in STUDIO_MAP is saved to its own table and directory.
+    """
+    global db_pool, db_writer, worker_group, studios
+    # Fails on a missing LOCATION_SHORT_TITLE before waiting for the database.
+    studios = get_studios()
+    db_pool = ConnectionPool(DB_HOSTNAME, DB_NAME, DB_USERNAME, DB_PASSWORD, DB_PORT)
+
+    # Initialize the partitioned tables if they do not exist, existing unpartitioned tables are migrated. If the
+    # database is down, the samples are spooled and the tables are prepared before the first write.
+    db_writer = utils_db.BatchWriter(
+        pool=db_pool,
+        spool=spool.Spool(),
+        rollups=constants.DB_ROLLUPS,
+        prepare=functools.partial(prepare_database, studios=studios)
+    )
+    try:
+        db_writer.prepare_tables()
+        utils_log.log("Successfully established a connection to the database.", os.path.join(constants.LOCATION_LOG_DIR, "db.log"))
+    except psycopg2.Error as e:
+        utils_log.log(f"The database is not reachable, spooling the samples until it is back: {e}", os.path.join(constants.LOCATION_LOG_DIR, "db.log"), level=utils_log.ERROR)
+    metrics.pending_rows.set_function(lambda: db_writer.pending)
+    if constants.PROFILE_ON_START:
+        profiling.profiler.request(constants.PROFILE_TICKS)
+    if constants.METRICS_PORT:
+        metrics.start_server(constants.METRICS_PORT)
+        utils_log.log(f"Serving the metrics on port {constants.METRICS_PORT}.")
+    if constants.WORKER_GROUP:
+        # The advisory locks are held by a connection of their own, outside of the pool.
+        worker_group = WorkerGroup(
+            functools.partial(open_connection, DB_HOSTNAME, DB_NAME, DB_USERNAME, DB_PASSWORD, DB_PORT),
+            {location_short_title: studio["id"] for location_short_title, studio in studios.items()}
+        )
+    asyncio.run(collect(db_writer, studios, worker_group))
 
 
 if __name__ == "__main__":
+    # Stop gracefully on "docker stop" so the buffered rows are flushed.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    # "docker kill --signal=SIGUSR1" profiles the next PROFILE_TICKS ticks.
+    signal.signal(signal.SIGUSR1, lambda signum, frame: profiling.profiler.request(constants.PROFILE_TICKS))
     try:
         main()
     except Exception as e:
         # Handle the exception, e.g., print an error message
         print("An exception occurred:", str(e))
     finally:
-        # Close the database connection in the finally block
-        if db_connection:
-            db_connection.close()
+        # Flush the buffered rows and close the database connection in the finally block
+        if db_writer:
+            try:
+                db_writer.close()
+            except psycopg2.Error as e:
+                print(f"Could not flush the buffered rows, {db_writer.pending} rows stay spooled:", str(e))
+            db_writer.spool.close()
+        if worker_group:
+            # The studios are taken over by the other members on their next tick.
+            worker_group.leave()
+        if studios:
+            for studio in studios.values():
+                studio["segment_writer"].close()
+                manifest.get_manifest(studio["data_dir"]).save()
+        if db_pool:
+            utils_log.log(f"Database connection pool: {db_pool.stats()}.")
+            db_pool.closeall()
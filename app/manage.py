@@ -0,0 +1,104 @@
+"""
+Management commands of the worker, run next to main.py with the same environment variables, e.g.:
+
+    python manage.py rebuild-rollups
+    python manage.py rebuild-rollups --studio ffgr
+    python manage.py backfill --jobs 8
+"""
+
+import argparse
+
+import main
+from utilities import constants, rollups
+from utilities.management import backfill
+from utilities.management.db_connect import connect_to_db, ConnectionPool
+
+
+def get_location_short_titles(studio: str = None) -> list:
+    """
+    Return the location short titles of the studios a command works on.
+
+    Args:
+        studio (str, optional): A location short title. Defaults to the studios of this worker.
+    """
+    if studio:
+        return [studio.lower()]
+    return list(constants.STUDIO_MAP) if constants.IS_MULTI_STUDIO else [constants.LOCATION_SHORT_TITLE]
+
+
+def get_table_names(studio: str = None) -> list:
+    """
+    Return the visitors tables a command works on.
+
+    Args:
+        studio (str, optional): A location short title. Defaults to the studios of this worker.
+    """
+    return [f"visitors_{location_short_title}" for location_short_title in get_location_short_titles(studio)]
+
+
+def connect():
+    """Connect to the database of the worker."""
+    return connect_to_db(
+        db_host=main.DB_HOSTNAME,
+        db_name=main.DB_NAME,
+        db_user=main.DB_USERNAME,
+        db_password=main.DB_PASSWORD,
+        db_port=main.DB_PORT
+    )
+
+
+def rebuild_rollups(args):
+    """
+    Rebuild the rollup tables from the raw rows.
+    """
+    db_connection = connect()
+    try:
+        for table_name in get_table_names(args.studio):
+            rollups.rebuild(db_connection, table_name)
+    finally:
+        db_connection.close()
+
+
+def backfill_segments(args):
+    """
+    Load the CSV segments into the visitors tables, skipping the rows which are already there.
+    """
+    pool = ConnectionPool(main.DB_HOSTNAME, main.DB_NAME, main.DB_USERNAME, main.DB_PASSWORD, main.DB_PORT, max_idle=args.jobs)
+    try:
+        for location_short_title in get_location_short_titles(args.studio):
+            data_dir, _ = constants.get_location_dirs(location_short_title)
+            stats = backfill.backfill(pool, data_dir, location_short_title, jobs=args.jobs, restart=args.restart)
+            print(
+                f"{location_short_title}: inserted {stats['inserted']} of {stats['rows']} rows from {stats['segments'] - stats['skipped']} "
+                f"segments, {stats['skipped']} segments were loaded before, {stats['failed']} failed."
+            )
+    finally:
+        pool.closeall()
+
+
+def run(argv: list = None):
+    """
+    Parse the command line and run the command.
+
+    Args:
+        argv (list, optional): The arguments. Defaults to sys.argv.
+    """
+    parser = argparse.ArgumentParser(description="Management commands of the visitors worker.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    rebuild = commands.add_parser("rebuild-rollups", help="Rebuild the 5 minute, hourly and daily rollup tables from the raw rows.")
+    rebuild.add_argument("--studio", help="The location short title, defaults to the studios of this worker.")
+    rebuild.set_defaults(handler=rebuild_rollups)
+
+    load = commands.add_parser("backfill", help="Load the CSV segments into the visitors tables with COPY, rows which are already there are skipped.")
+    load.add_argument("--studio", help="The location short title, defaults to the studios of this worker.")
+    load.add_argument("--jobs", type=int, default=4, help="How many segments are loaded at once. Defaults to 4.")
+    load.add_argument("--restart", action="store_true", help="Load every segment again instead of continuing the last backfill.")
+    load.set_defaults(handler=backfill_segments)
+
+    args = parser.parse_args(argv)
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    run()
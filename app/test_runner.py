@@ -9,7 +9,24 @@ from utilities.tests import test_utils
 from utilities.tests import test_utils_log
 from utilities.tests import test_utils_db
 from utilities.tests import test_utils_csv
+from utilities.tests import test_scheduler
+from utilities.tests import test_http_client
+from utilities.tests import test_spool
+from utilities.tests import test_manifest
+from utilities.tests import test_utils_binary
+from utilities.tests import test_compaction
+from utilities.tests import test_analytics
+from utilities.tests import test_rollups
+from utilities.tests import test_metrics
+from utilities.tests import test_profiling
+from utilities.tests import test_decoding
+from utilities.tests import test_runlength
+from utilities.tests import test_opening_hours
+from utilities.tests import test_config
 from utilities.management.tests import test_db_connect
+from utilities.management.tests import test_schema
+from utilities.management.tests import test_backfill
+from utilities.management.tests import test_worker_group
 
 if __name__ == '__main__':
     # Create a test suite
@@ -20,8 +37,25 @@ if __name__ == '__main__':
     suite.addTests(unittest.defaultTestLoader.loadTestsFromModule(test_utils_log))
     suite.addTests(unittest.defaultTestLoader.loadTestsFromModule(test_utils_db))
     suite.addTests(unittest.defaultTestLoader.loadTestsFromModule(test_utils_csv))
+    suite.addTests(unittest.defaultTestLoader.loadTestsFromModule(test_scheduler))
+    suite.addTests(unittest.defaultTestLoader.loadTestsFromModule(test_http_client))
+    suite.addTests(unittest.defaultTestLoader.loadTestsFromModule(test_spool))
+    suite.addTests(unittest.defaultTestLoader.loadTestsFromModule(test_manifest))
+    suite.addTests(unittest.defaultTestLoader.loadTestsFromModule(test_utils_binary))
+    suite.addTests(unittest.defaultTestLoader.loadTestsFromModule(test_compaction))
+    suite.addTests(unittest.defaultTestLoader.loadTestsFromModule(test_analytics))
+    suite.addTests(unittest.defaultTestLoader.loadTestsFromModule(test_rollups))
+    suite.addTests(unittest.defaultTestLoader.loadTestsFromModule(test_metrics))
+    suite.addTests(unittest.defaultTestLoader.loadTestsFromModule(test_profiling))
+    suite.addTests(unittest.defaultTestLoader.loadTestsFromModule(test_decoding))
+    suite.addTests(unittest.defaultTestLoader.loadTestsFromModule(test_runlength))
+    suite.addTests(unittest.defaultTestLoader.loadTestsFromModule(test_opening_hours))
+    suite.addTests(unittest.defaultTestLoader.loadTestsFromModule(test_config))
 
     suite.addTests(unittest.defaultTestLoader.loadTestsFromModule(test_db_connect))
+    suite.addTests(unittest.defaultTestLoader.loadTestsFromModule(test_schema))
+    suite.addTests(unittest.defaultTestLoader.loadTestsFromModule(test_backfill))
+    suite.addTests(unittest.defaultTestLoader.loadTestsFromModule(test_worker_group))
 
     # Create a test runner and run the suite
     runner = unittest.TextTestRunner()
@@ -0,0 +1,259 @@
+"""Vectorized occupancy analytics over the stored history of a studio."""
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from . import compaction
+from . import constants
+from . import manifest
+from . import runlength
+from . import utils_binary
+
+SECONDS_PER_DAY = 24 * 60 * 60
+WEEKDAYS = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+
+# 01-01-1970 was a Thursday.
+EPOCH_WEEKDAY = 3
+
+
+def to_local_seconds(timestamps) -> np.ndarray:
+    """
+    Convert epoch timestamps to local wall-clock seconds, i.e. the local date and time counted as if it was UTC.
+
+    The UTC offset is looked up once per hour in the data instead of once per sample.
+
+    Args:
+        timestamps: The epoch timestamps.
+
+    Returns:
+        np.ndarray: The local wall-clock seconds (int64).
+    """
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    if len(timestamps) == 0:
+        return timestamps
+    hours, inverse = np.unique(timestamps // 3600, return_inverse=True)
+    offsets = np.array([
+        int(datetime.fromtimestamp(hour * 3600, timezone.utc).astimezone().utcoffset().total_seconds())
+        for hour in hours.tolist()
+    ], dtype=np.int64)
+    return timestamps + offsets[inverse.reshape(-1)]
+
+
+def _normalize(timestamps, visitor_counts) -> tuple:
+    """Sort by time, drop duplicated timestamps and turn missing loads into NaN."""
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    loads = np.asarray(visitor_counts, dtype=np.float64)
+    loads[loads < 0] = np.nan
+
+    timestamps, first = np.unique(timestamps, return_index=True)
+    return timestamps, loads[first]
+
+
+def load_history(data_dir: str = None, location_short_title: str = None, change_only: bool = None) -> tuple:
+    """
+    Load the whole stored history of a studio from its data directory.
+
+    Reads the compacted monthly files, the binary segments and the CSV segments which are not compacted yet.
+
+    Args:
+        data_dir (str, optional): The data directory. Defaults to LOCATION_DATA_DIR.
+        location_short_title (str, optional): The location short title. Defaults to LOCATION_SHORT_TITLE.
+        change_only (bool, optional): The history is stored change-only, reconstruct the regular series.
+            Defaults to CHANGE_ONLY_STORAGE.
+
+    Returns:
+        tuple: The local wall-clock seconds (int64) and the loads (float64, NaN if missing) in chronological order.
+    """
+    data_dir = data_dir or constants.LOCATION_DATA_DIR
+    location_short_title = location_short_title or constants.LOCATION_SHORT_TITLE
+
+    timestamps, visitor_counts = [], []
+    for read in (compaction.read_range, utils_binary.load_history):
+        source_timestamps, source_visitor_counts = read(data_dir, location_short_title)
+        timestamps.append(source_timestamps)
+        visitor_counts.append(source_visitor_counts)
+
+    prefix = f"visitors-{location_short_title}-"
+    for file_name in os.listdir(data_dir) if os.path.isdir(data_dir) else ():
+        if file_name.startswith(prefix) and manifest.parse_segment_date(file_name):
+            segment_timestamps, segment_visitor_counts = compaction.read_csv_segment(os.path.join(data_dir, file_name))
+            timestamps.append(np.asarray(segment_timestamps, dtype=np.int64))
+            visitor_counts.append(np.asarray(segment_visitor_counts, dtype=np.int16))
+
+    timestamps, loads = _normalize(np.concatenate(timestamps), np.concatenate(visitor_counts))
+    if constants.CHANGE_ONLY_STORAGE if change_only is None else change_only:
+        timestamps, loads = runlength.expand(timestamps, loads, end=time.time())
+    return to_local_seconds(timestamps), loads
+
+
+def load_history_from_db(db_connection, table_name: str, change_only: bool = None) -> tuple:
+    """
+    Load the whole history of a studio from its database table.
+
+    Args:
+        db_connection (psycopg2.extensions.connection): The database connection.
+        table_name (str): The name of the table, e.g. "visitors_ffgr".
+        change_only (bool, optional): The history is stored change-only, reconstruct the regular series.
+            Defaults to CHANGE_ONLY_STORAGE.
+
+    Returns:
+        tuple: The local wall-clock seconds (int64) and the loads (float64, NaN if missing) in chronological order.
+    """
+    with db_connection.cursor() as cursor:
+        # The timestamps are stored in local time without a zone, their epoch is the local wall-clock seconds.
+        cursor.execute(f"SELECT EXTRACT(EPOCH FROM timestamp)::BIGINT, COALESCE(visitor_count, -1) FROM {table_name} ORDER BY timestamp")
+        rows = cursor.fetchall()
+
+    records = np.array(rows, dtype=np.int64).reshape(-1, 2)
+    local_seconds, loads = _normalize(records[:, 0], records[:, 1])
+    if constants.CHANGE_ONLY_STORAGE if change_only is None else change_only:
+        local_seconds, loads = runlength.expand(local_seconds, loads, end=to_local_seconds([time.time()])[0])
+    return local_seconds, loads
+
+
+def slot_profile(local_seconds, loads, slot_seconds: int = 30 * 60, percentiles: tuple = (50, 90)) -> dict:
+    """
+    Aggregate the load per weekday and time-of-day slot.
+
+    Every statistic is computed for all slots at once, the percentiles from a single sort of the samples.
+
+    Args:
+        local_seconds: The local wall-clock seconds as returned by load_history.
+        loads: The loads, NaN if missing.
+        slot_seconds (int, optional): The length of a time-of-day slot. Defaults to 30 minutes.
+        percentiles (tuple, optional): The percentiles to compute. Defaults to the median and the 90th percentile.
+
+    Returns:
+        dict: The "mean", "count" and one array per percentile in "percentiles", each shaped (7, slots per day)
+        with Monday as the first row. Slots without samples are NaN. Also holds the "slot_seconds".
+    """
+    local_seconds = np.asarray(local_seconds, dtype=np.int64)
+    loads = np.asarray(loads, dtype=np.float64)
+    valid = ~np.isnan(loads)
+    local_seconds, loads = local_seconds[valid], loads[valid]
+
+    slots_per_day = SECONDS_PER_DAY // slot_seconds
+    weekdays = (local_seconds // SECONDS_PER_DAY + EPOCH_WEEKDAY) % 7
+    keys = weekdays * slots_per_day + (local_seconds % SECONDS_PER_DAY) // slot_seconds
+    size = 7 * slots_per_day
+
+    counts = np.bincount(keys, minlength=size)
+    sums = np.bincount(keys, weights=loads, minlength=size)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = sums / counts
+
+    # Sort by slot and load, every slot is a contiguous run in which the percentile is interpolated by position.
+    order = np.lexsort((loads, keys))
+    sorted_loads = loads[order]
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    has_samples = counts > 0
+
+    result = {}
+    for percentile in percentiles:
+        positions = starts + (np.maximum(counts, 1) - 1) * percentile / 100
+        lower = np.floor(positions).astype(np.int64)
+        upper = np.ceil(positions).astype(np.int64)
+        values = np.full(size, np.nan)
+        if len(sorted_loads):
+            lower_values = sorted_loads[np.minimum(lower, len(sorted_loads) - 1)]
+            upper_values = sorted_loads[np.minimum(upper, len(sorted_loads) - 1)]
+            interpolated = lower_values + (upper_values - lower_values) * (positions - lower)
+            values[has_samples] = interpolated[has_samples]
+        result[percentile] = values.reshape(7, slots_per_day)
+
+    return {
+        "slot_seconds": slot_seconds,
+        "count": counts.reshape(7, slots_per_day),
+        "mean": means.reshape(7, slots_per_day),
+        "percentiles": result,
+    }
+
+
+def busiest_windows(profile: dict, count: int = 3, window_slots: int = 1, quietest: bool = False) -> list:
+    """
+    Find the busiest (or quietest) windows of consecutive slots of the week.
+
+    Args:
+        profile (dict): The profile as returned by slot_profile.
+        count (int, optional): How many windows to return. Defaults to 3.
+        window_slots (int, optional): The length of a window in slots. Defaults to a single slot.
+        quietest (bool, optional): Return the quietest instead of the busiest windows. Defaults to False.
+
+    Returns:
+        list: The windows as dicts with the "weekday", the "start" and "end" time ("HH:MM") and the "mean" load,
+        ordered from the busiest (or quietest) one. Windows with a slot without samples are left out.
+    """
+    means = profile["mean"]
+    slot_seconds = profile["slot_seconds"]
+
+    # Rolling mean over window_slots consecutive slots of a day, a slot without samples invalidates the window.
+    missing = np.isnan(means)
+    cumulative = np.concatenate((np.zeros((7, 1)), np.cumsum(np.where(missing, 0, means), axis=1)), axis=1)
+    cumulative_missing = np.concatenate((np.zeros((7, 1)), np.cumsum(missing, axis=1)), axis=1)
+    window_means = (cumulative[:, window_slots:] - cumulative[:, :-window_slots]) / window_slots
+    window_means[cumulative_missing[:, window_slots:] - cumulative_missing[:, :-window_slots] > 0] = np.nan
+
+    flat = window_means.reshape(-1)
+    candidates = np.flatnonzero(~np.isnan(flat))
+    ranked = candidates[np.argsort(flat[candidates] if quietest else -flat[candidates], kind="stable")][:count]
+
+    windows = []
+    for index in ranked.tolist():
+        weekday, slot = divmod(index, window_means.shape[1])
+        start = timedelta(seconds=slot * slot_seconds)
+        end = timedelta(seconds=(slot + window_slots) * slot_seconds)
+        windows.append({
+            "weekday": WEEKDAYS[weekday],
+            "start": f"{start.seconds // 3600:02d}:{start.seconds // 60 % 60:02d}",
+            "end": f"{end.seconds // 3600 % 24 + end.days * 24:02d}:{end.seconds // 60 % 60:02d}",
+            "mean": float(flat[index]),
+        })
+    return windows
+
+
+def day_over_day(local_seconds, loads) -> dict:
+    """
+    Compare the mean load of every day with the day before.
+
+    Args:
+        local_seconds: The local wall-clock seconds as returned by load_history.
+        loads: The loads, NaN if missing.
+
+    Returns:
+        dict: The "days" (datetime64[D]), their "mean" and "peak" load, the "change" of the mean compared to the
+        previous calendar day and the relative "change_ratio". The change is NaN if the previous day has no samples.
+    """
+    local_seconds = np.asarray(local_seconds, dtype=np.int64)
+    loads = np.asarray(loads, dtype=np.float64)
+    valid = ~np.isnan(loads)
+    local_seconds, loads = local_seconds[valid], loads[valid]
+    if len(local_seconds) == 0:
+        empty = np.empty(0)
+        return {"days": np.empty(0, dtype="datetime64[D]"), "mean": empty, "peak": empty, "change": empty, "change_ratio": empty}
+
+    day_numbers = local_seconds // SECONDS_PER_DAY
+    first_day = day_numbers.min()
+    day_index = day_numbers - first_day
+    size = int(day_index.max()) + 1
+
+    counts = np.bincount(day_index, minlength=size)
+    sums = np.bincount(day_index, weights=loads, minlength=size)
+    peaks = np.full(size, -np.inf)
+    np.maximum.at(peaks, day_index, loads)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = sums / counts
+        change = np.concatenate(([np.nan], np.diff(means)))
+        change_ratio = change / np.concatenate(([np.nan], means[:-1]))
+
+    has_samples = counts > 0
+    days = (first_day + np.arange(size)).astype("datetime64[D]")
+    return {
+        "days": days[has_samples],
+        "mean": means[has_samples],
+        "peak": peaks[has_samples],
+        "change": change[has_samples],
+        "change_ratio": change_ratio[has_samples],
+    }
@@ -0,0 +1,298 @@
+"""Compaction of closed CSV segments into compressed monthly columnar files."""
+import os
+import json
+import zlib
+import struct
+from datetime import date
+
+import numpy as np
+
+from . import constants
+from . import manifest
+from . import utils_log
+
+# File trailer: footer length and magic.
+MAGIC = b"FFVC"
+VERSION = 1
+TRAILER = struct.Struct("<I4s")
+
+# Stored for samples without a load, same as in the binary segments.
+MISSING_LOAD = -1
+
+
+def construct_compacted_file_name(year: int, month: int, location_short_title: str = None) -> str:
+    """
+    Construct the file name of the compacted file of a month.
+
+    Args:
+        year (int): The year.
+        month (int): The month.
+        location_short_title (str, optional): The location short title. Defaults to LOCATION_SHORT_TITLE.
+
+    Returns:
+        str: The file name, e.g. "visitors-ffgr-2023-06.col".
+    """
+    location_short_title = location_short_title or constants.LOCATION_SHORT_TITLE
+    return f"visitors-{location_short_title}-{year}-{month:02d}.col"
+
+
+def read_footer(file_path: str) -> dict:
+    """
+    Read the footer statistics of a compacted file without reading its columns.
+
+    Args:
+        file_path (str): The path to the compacted file.
+
+    Returns:
+        dict: The footer with the "rows", the time range "first"/"last", the "min"/"max"/"mean" load, the compacted
+        "days" and the byte ranges of the "columns".
+
+    Raises:
+        ValueError: If the file is not a compacted file of a supported version.
+    """
+    with open(file_path, mode="rb") as compacted_file:
+        size = compacted_file.seek(0, os.SEEK_END)
+        if size < TRAILER.size:
+            raise ValueError(f"{file_path} is too short to be a compacted file.")
+        compacted_file.seek(size - TRAILER.size)
+        footer_length, magic = TRAILER.unpack(compacted_file.read(TRAILER.size))
+        if magic != MAGIC or footer_length > size - TRAILER.size:
+            raise ValueError(f"{file_path} is not a compacted file.")
+        compacted_file.seek(size - TRAILER.size - footer_length)
+        footer = json.loads(compacted_file.read(footer_length))
+
+    if footer.get("version") != VERSION:
+        raise ValueError(f"{file_path} is not a compacted file of version {VERSION}.")
+    return footer
+
+
+def read_columns(file_path: str, footer: dict = None) -> tuple:
+    """
+    Read and decompress the columns of a compacted file.
+
+    Args:
+        file_path (str): The path to the compacted file.
+        footer (dict, optional): The footer if it was read already.
+
+    Returns:
+        tuple: The timestamps (int64) and visitor counts (int16) as NumPy arrays.
+    """
+    footer = footer or read_footer(file_path)
+    columns = footer["columns"]
+    with open(file_path, mode="rb") as compacted_file:
+        compacted_file.seek(columns["timestamp"]["offset"])
+        timestamp_deltas = np.frombuffer(zlib.decompress(compacted_file.read(columns["timestamp"]["length"])), dtype="<i8")
+        compacted_file.seek(columns["visitor_count"]["offset"])
+        visitor_counts = np.frombuffer(zlib.decompress(compacted_file.read(columns["visitor_count"]["length"])), dtype="<i2")
+
+    # Timestamps are stored delta encoded, a regular 5 minute series compresses to almost nothing.
+    return np.cumsum(timestamp_deltas), visitor_counts
+
+
+def write_compacted_file(file_path: str, timestamps, visitor_counts, days: list, segments: dict = None):
+    """
+    Atomically write a compacted file with its footer statistics.
+
+    Args:
+        file_path (str): The path to the compacted file.
+        timestamps: The epoch timestamps in chronological order.
+        visitor_counts: The visitor counts, MISSING_LOAD for samples without a load.
+        days (list): The ISO dates of the compacted segments.
+        segments (dict, optional): The signature of every compacted CSV segment by file name.
+    """
+    timestamps = np.asarray(timestamps, dtype="<i8")
+    visitor_counts = np.asarray(visitor_counts, dtype="<i2")
+
+    timestamp_column = zlib.compress(np.diff(timestamps, prepend=0).astype("<i8").tobytes())
+    visitor_count_column = zlib.compress(visitor_counts.tobytes())
+
+    loads = visitor_counts[visitor_counts != MISSING_LOAD]
+    footer = {
+        "version": VERSION,
+        "rows": len(timestamps),
+        "first": int(timestamps[0]) if len(timestamps) else None,
+        "last": int(timestamps[-1]) if len(timestamps) else None,
+        "min": int(loads.min()) if len(loads) else None,
+        "max": int(loads.max()) if len(loads) else None,
+        "mean": float(loads.mean()) if len(loads) else None,
+        "days": sorted(days),
+        "segments": segments or {},
+        "columns": {
+            "timestamp": {"offset": 0, "length": len(timestamp_column), "encoding": "delta"},
+            "visitor_count": {"offset": len(timestamp_column), "length": len(visitor_count_column), "encoding": "plain"},
+        },
+    }
+    footer_data = json.dumps(footer).encode("utf-8")
+
+    tmp_path = f"{file_path}.tmp"
+    with open(tmp_path, mode="wb") as compacted_file:
+        compacted_file.write(timestamp_column)
+        compacted_file.write(visitor_count_column)
+        compacted_file.write(footer_data)
+        compacted_file.write(TRAILER.pack(len(footer_data), MAGIC))
+        compacted_file.flush()
+        os.fsync(compacted_file.fileno())
+    os.replace(tmp_path, file_path)
+
+
+def read_csv_segment(file_path: str) -> tuple:
+    """
+    Read the samples of a CSV segment as written by utils_csv.
+
+    Args:
+        file_path (str): The path to the CSV segment.
+
+    Returns:
+        tuple: The timestamps and visitor counts as lists, an empty load is read as MISSING_LOAD.
+    """
+    timestamps, visitor_counts = [], []
+    with open(file_path, mode="r", newline="") as csv_file:
+        next(csv_file, None)  # Header
+        for line in csv_file:
+            timestamp, _, visitor_count = line.strip().partition(",")
+            if not timestamp.isdigit():
+                # A torn last row, e.g. when the process died in the middle of a write.
+                continue
+            timestamps.append(int(timestamp))
+            visitor_counts.append(int(visitor_count) if visitor_count.isdigit() else MISSING_LOAD)
+    return timestamps, visitor_counts
+
+
+def segment_signature(file_path: str) -> list:
+    """
+    Return the size and modification time of a CSV segment, a segment with another signature got new rows.
+    """
+    stat = os.stat(file_path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def compact(data_dir: str = None, location_short_title: str = None, today: date = None, remove_sources: bool = False) -> int:
+    """
+    Compact the CSV segments of every closed day into the compressed file of its month.
+
+    Runs incrementally: the footer records the signature of every compacted segment, segments which are in the
+    file already and didn't change are skipped. A segment which got rows since it was compacted (e.g. written late)
+    is merged again, its samples replace the ones of the same timestamp. The compacted file is replaced atomically
+    before any CSV segment is removed, an interrupted run is completed by the next one without losing or
+    duplicating samples.
+
+    The segments must be flushed before, e.g. by closing the segment writers.
+
+    Args:
+        data_dir (str, optional): The data directory. Defaults to LOCATION_DATA_DIR.
+        location_short_title (str, optional): The location short title. Defaults to LOCATION_SHORT_TITLE.
+        today (date, optional): Segments of this day and later are still written and stay untouched. Defaults to today.
+        remove_sources (bool, optional): Remove the CSV segments once they are compacted. Defaults to False.
+
+    Returns:
+        int: The number of days with newly compacted segments.
+    """
+    data_dir = data_dir or constants.LOCATION_DATA_DIR
+    location_short_title = location_short_title or constants.LOCATION_SHORT_TITLE
+    today = today or date.today()
+
+    # (year, month) -> ISO date -> file names of the closed segments.
+    months = {}
+    prefix = f"visitors-{location_short_title}-"
+    for file_name in os.listdir(data_dir) if os.path.isdir(data_dir) else ():
+        segment_date = manifest.parse_segment_date(file_name)
+        if segment_date is None or segment_date >= today or not file_name.startswith(prefix):
+            continue
+        months.setdefault((segment_date.year, segment_date.month), {}).setdefault(segment_date.isoformat(), []).append(file_name)
+
+    compacted_days = 0
+    removed = False
+    for (year, month), days in sorted(months.items()):
+        file_name = construct_compacted_file_name(year, month, location_short_title)
+        file_path = os.path.join(data_dir, file_name)
+
+        timestamps, visitor_counts = np.empty(0, dtype="<i8"), np.empty(0, dtype="<i2")
+        compacted, segments = [], {}
+        if os.path.exists(file_path):
+            footer = read_footer(file_path)
+            compacted, segments = footer["days"], footer.get("segments", {})
+            timestamps, visitor_counts = read_columns(file_path, footer)
+
+        signatures = {
+            segment_file_name: segment_signature(os.path.join(data_dir, segment_file_name))
+            for segment_file_names in days.values() for segment_file_name in segment_file_names
+        }
+        new_days = sorted(
+            day for day, segment_file_names in days.items()
+            if any(segments.get(segment_file_name) != signatures[segment_file_name] for segment_file_name in segment_file_names)
+        )
+        if new_days:
+            new_timestamps, new_visitor_counts = [], []
+            for day in new_days:
+                for segment_file_name in sorted(days[day]):
+                    segment_timestamps, segment_visitor_counts = read_csv_segment(os.path.join(data_dir, segment_file_name))
+                    new_timestamps.extend(segment_timestamps)
+                    new_visitor_counts.extend(segment_visitor_counts)
+                    segments[segment_file_name] = signatures[segment_file_name]
+
+            # The samples of the segments come last, the stable unique keeps the first of a timestamp in reverse.
+            all_timestamps = np.concatenate([timestamps, np.asarray(new_timestamps, dtype="<i8")])
+            all_visitor_counts = np.concatenate([visitor_counts, np.asarray(new_visitor_counts, dtype="<i2")])
+            _, last = np.unique(all_timestamps[::-1], return_index=True)
+            order = len(all_timestamps) - 1 - last
+            write_compacted_file(
+                file_path,
+                all_timestamps[order],
+                all_visitor_counts[order],
+                sorted(set(compacted) | set(new_days)),
+                segments,
+            )
+            compacted_days += len(new_days)
+            utils_log.log(f"Compacted {len(new_days)} days into {file_name}.", os.path.join(constants.LOCATION_LOG_DIR, "compaction.log"))
+
+        if remove_sources:
+            # Only segments which are in the compacted file as they are now, also the ones of a previous run which
+            # was interrupted after writing the compacted file.
+            for segment_file_name, signature in signatures.items():
+                if segments.get(segment_file_name) == signature:
+                    os.remove(os.path.join(data_dir, segment_file_name))
+                    removed = True
+
+    if removed:
+        segment_manifest = manifest.get_manifest(data_dir)
+        segment_manifest.refresh()
+        segment_manifest.save()
+    return compacted_days
+
+
+def read_range(data_dir: str = None, location_short_title: str = None, start: int = None, end: int = None) -> tuple:
+    """
+    Read the compacted samples of a time range.
+
+    Files are selected by their footer time range, files which don't overlap the range are not decompressed.
+
+    Args:
+        data_dir (str, optional): The data directory. Defaults to LOCATION_DATA_DIR.
+        location_short_title (str, optional): The location short title. Defaults to LOCATION_SHORT_TITLE.
+        start (int, optional): The first epoch timestamp to include.
+        end (int, optional): The epoch timestamp to stop before.
+
+    Returns:
+        tuple: The timestamps and visitor counts as NumPy arrays in chronological order.
+    """
+    data_dir = data_dir or constants.LOCATION_DATA_DIR
+    prefix = f"visitors-{location_short_title or constants.LOCATION_SHORT_TITLE}-"
+
+    timestamps, visitor_counts = [], []
+    for file_name in sorted(os.listdir(data_dir) if os.path.isdir(data_dir) else ()):
+        if not (file_name.startswith(prefix) and file_name.endswith(".col")):
+            continue
+        file_path = os.path.join(data_dir, file_name)
+        footer = read_footer(file_path)
+        if not footer["rows"] or (start is not None and footer["last"] < start) or (end is not None and footer["first"] >= end):
+            continue
+
+        file_timestamps, file_visitor_counts = read_columns(file_path, footer)
+        lower = np.searchsorted(file_timestamps, start, side="left") if start is not None else 0
+        upper = np.searchsorted(file_timestamps, end, side="left") if end is not None else len(file_timestamps)
+        timestamps.append(file_timestamps[lower:upper])
+        visitor_counts.append(file_visitor_counts[lower:upper])
+
+    if not timestamps:
+        return np.empty(0, dtype="<i8"), np.empty(0, dtype="<i2")
+    return np.concatenate(timestamps), np.concatenate(visitor_counts)
@@ -0,0 +1,282 @@
+"""Configuration of a worker, read from the environment or a JSON file on first use."""
+import os
+import json
+from functools import cached_property
+
+from . import constants
+
+
+def minutes(value) -> int:
+    """Parse a number of minutes to seconds."""
+    return int(value) * 60
+
+
+def integer(value) -> int:
+    return int(value)
+
+
+def number(value) -> float:
+    return float(value)
+
+
+def flag(value) -> bool:
+    return str(value).lower() in ("1", "true", "yes")
+
+
+def choice(*choices):
+    """Return a parser which accepts one of the choices (case-insensitive)."""
+    def parse(value) -> str:
+        value = str(value).lower()
+        if value not in choices:
+            raise ValueError(f"Expected one of {choices}, got {value!r}.")
+        return value
+    return parse
+
+
+# The settings with their parser and default, an invalid value falls back to the default.
+SETTINGS = {
+    # Frequency of API requests (in minutes).
+    "REQUEST_DENSITY": (minutes, 5),
+    # Adapt the interval to the rate of change of the load, between the floor and the ceiling (in minutes).
+    "ADAPTIVE_POLLING": (flag, "false"),
+    "REQUEST_DENSITY_FLOOR": (minutes, 1),
+    "REQUEST_DENSITY_CEILING": (minutes, 15),
+    # The change of the load in visitors the adaptive interval aims for between two samples.
+    "ADAPTIVE_TARGET_CHANGE": (number, 3),
+    # How many entries in the CSV file until a new one is created.
+    "ENTRIES_UNTIL_FILE_SEGMENTATION": (integer, 1000),
+    # Timeouts of the API requests in seconds (establishing the connection / waiting for the response).
+    "REQUEST_CONNECT_TIMEOUT": (number, 5),
+    "REQUEST_READ_TIMEOUT": (number, 15),
+    # How often a failed API request is retried (with exponential backoff and jitter).
+    "REQUEST_RETRIES": (integer, 3),
+    # How many buffered rows / how old the oldest buffered row (in seconds) may get until the rows are written
+    # to the database in one batch. With 0 seconds every tick is committed at once.
+    "DB_FLUSH_ROWS": (integer, 500),
+    "DB_FLUSH_SECONDS": (number, 0),
+    # Seconds to wait for a database connection to be established, an unreachable server fails instead of hanging.
+    "DB_CONNECT_TIMEOUT": (integer, 10),
+    # How many future monthly partitions of the visitors tables are created ahead of time.
+    "DB_PARTITIONS_AHEAD": (integer, 3),
+    # Index method of the timestamp index: "btree" (fast point and range lookups) or "brin" (tiny, for append-only data).
+    "DB_TIMESTAMP_INDEX": (choice("btree", "brin"), "btree"),
+    # Port of the Prometheus metrics endpoint (http://<host>:<port>/metrics), 0 disables it.
+    "METRICS_PORT": (integer, 0),
+    # Write the per-stage timings of every tick as JSON lines to "stages.log".
+    "STAGE_TIMINGS": (flag, "true"),
+    # Profile the first ticks after startup, SIGUSR1 profiles the following ticks at any time.
+    "PROFILE_ON_START": (flag, "false"),
+    # How many ticks are captured in a profile.
+    "PROFILE_TICKS": (integer, 10),
+    # How many rows / seconds the open CSV segment buffers before flushing to disk (1 row = flush every row).
+    "CSV_FLUSH_ROWS": (integer, 1),
+    "CSV_FLUSH_SECONDS": (number, 0),
+    # File format of the samples: "csv" (daily text segments) or "binary" (monthly fixed-width segments).
+    "STORAGE_FORMAT": (choice(*constants.STORAGE_FORMATS), "csv"),
+    # Store a sample only when the load changes or the last stored row of the studio is STORAGE_HEARTBEAT old
+    # (in minutes). The readers reconstruct the regular series of REQUEST_DENSITY samples.
+    "CHANGE_ONLY_STORAGE": (flag, "false"),
+    "STORAGE_HEARTBEAT": (minutes, 60),
+    # Apply the opening hours of "holiday" on the public holidays of Hesse, studios without them keep their regular hours.
+    "PUBLIC_HOLIDAYS": (flag, "true"),
+    # How many days of opening intervals are precomputed.
+    "CALENDAR_DAYS": (lambda value: max(int(value), 1), 28),
+    # Share the studios with the other workers of the same database (e.g. replicas of LOCATION_SHORT_TITLE=ALL),
+    # every studio is sampled by exactly one of them and taken over when it stops.
+    "WORKER_GROUP": (flag, "false"),
+    # Compact the CSV segments of closed days into compressed monthly files.
+    "COMPACT_SEGMENTS": (flag, "false"),
+    # Remove the compacted CSV segments, the backfill only reads CSV segments.
+    "COMPACT_REMOVE_SEGMENTS": (flag, "false"),
+    # The minimum level of the log messages and the size of the queue of the log writer thread.
+    "LOG_LEVEL": (choice("debug", "info", "warning", "error"), "info"),
+    "LOG_QUEUE_SIZE": (integer, 10000),
+    # Rotate a log file once it exceeds LOG_MAX_BYTES (and every day), LOG_BACKUP_COUNT compressed files are kept.
+    "LOG_MAX_BYTES": (integer, 5 * 1024 * 1024),
+    "LOG_ROTATE_DAILY": (flag, "true"),
+    "LOG_BACKUP_COUNT": (integer, 7),
+    # At most LOG_RATE_LIMIT similar messages (same text apart from numbers) per LOG_RATE_WINDOW seconds.
+    "LOG_RATE_LIMIT": (integer, 20),
+    "LOG_RATE_WINDOW": (number, 60),
+}
+
+
+class StudioContext:
+    """
+    The static context of a studio: its id, opening hours, table and directories.
+
+    The directories are not created here, the writers create them on their first write.
+    """
+
+    def __init__(self, location_short_title: str, root: str):
+        """
+        Args:
+            location_short_title (str): The location short title, e.g. "ffgr".
+            root (str): The root directory of the studio directories.
+
+        Raises:
+            KeyError: If the studio is not in STUDIO_MAP.
+        """
+        studio = constants.STUDIO_MAP[location_short_title]
+        self.location_short_title = location_short_title
+        self.id = int(studio["id"])
+        self.title = studio["title"]
+        self.opening_hours = studio["opening_hours"]
+        self.table_name = f"visitors_{location_short_title}"
+        self.data_dir = os.path.join(root, location_short_title, "data")
+        self.log_dir = os.path.join(root, location_short_title, "logs")
+
+
+class Config:
+    """
+    The settings of a worker. Every setting is parsed on first access, nothing is read or created on construction.
+
+    Several configurations (e.g. with different roots) and the contexts of several studios can coexist in one
+    process. The modules read the settings of the active configuration through constants, e.g.
+    constants.REQUEST_DENSITY.
+
+    Example:
+        config = Config.from_file("ffgr.json")
+        config.REQUEST_DENSITY  # 300
+        config.studio("ffhb").data_dir
+    """
+
+    def __init__(self, values: dict = None, root: str = None):
+        """
+        Args:
+            values (dict, optional): The raw settings by name, e.g. the environment. Defaults to none, the defaults.
+            root (str, optional): The root directory of the studio directories ("/app" inside the Docker container).
+                Defaults to PATH_TO_ROOT of the values, else the working directory.
+        """
+        self.values = values if values is not None else {}
+        self._root = root
+        self._studios = {}
+
+    @classmethod
+    def from_env(cls, environ: dict = None, root: str = None):
+        """
+        Read the settings from the environment variables.
+        """
+        return cls(os.environ if environ is None else environ, root)
+
+    @classmethod
+    def from_file(cls, file_path: str, environ: dict = None, root: str = None):
+        """
+        Read the settings from a JSON object of setting names and values, e.g. {"LOCATION_SHORT_TITLE": "ffgr"}.
+        Settings which are not in the file are read from the environment.
+
+        Raises:
+            OSError: If the file could not be read.
+            ValueError: If the file is not a JSON object.
+        """
+        with open(file_path, mode="r", encoding="utf-8") as config_file:
+            values = json.load(config_file)
+        if not isinstance(values, dict):
+            raise ValueError(f"Expected a JSON object of settings in {file_path}.")
+        return cls({**(os.environ if environ is None else environ), **values}, root)
+
+    def __getattr__(self, name: str):
+        """Parse a setting on first access, afterwards it is a plain attribute."""
+        if name not in SETTINGS:
+            raise AttributeError(f"Unknown setting {name}.")
+        parse, default = SETTINGS[name]
+        try:
+            value = parse(self.values.get(name, default))
+        except (TypeError, ValueError):
+            value = parse(default)  # Use the default value
+        setattr(self, name, value)
+        return value
+
+    @cached_property
+    def PATH_TO_ROOT(self) -> str:
+        return self._root or self.values.get("PATH_TO_ROOT") or os.getcwd()
+
+    @cached_property
+    def LOCATION_SHORT_TITLE(self) -> str:
+        """
+        Indicates the location to be tracked based on STUDIO_MAP, "all" for every studio.
+
+        Raises:
+            ValueError: If LOCATION_SHORT_TITLE was not provided.
+        """
+        location_short_title = self.values.get("LOCATION_SHORT_TITLE")
+        if not location_short_title:
+            raise ValueError("LOCATION_SHORT_TITLE was not provided.")
+        return str(location_short_title).lower()
+
+    @cached_property
+    def IS_MULTI_STUDIO(self) -> bool:
+        """Multi-studio mode: one process fetches once per tick and records every studio in STUDIO_MAP."""
+        return self.LOCATION_SHORT_TITLE == constants.ALL_STUDIOS
+
+    @cached_property
+    def LOCATION_DATA_DIR(self) -> str:
+        return os.path.join(self.PATH_TO_ROOT, self.LOCATION_SHORT_TITLE, "data")
+
+    @cached_property
+    def LOCATION_LOG_DIR(self) -> str:
+        return os.path.join(self.PATH_TO_ROOT, self.LOCATION_SHORT_TITLE, "logs")
+
+    @cached_property
+    def STUDIO(self):
+        return constants.STUDIO_MAP.get(self.LOCATION_SHORT_TITLE)
+
+    @cached_property
+    def OPENING_HOURS(self):
+        return self.STUDIO["opening_hours"] if self.STUDIO else None
+
+    @cached_property
+    def STUDIO_ID(self):
+        return int(self.STUDIO["id"]) if self.STUDIO else None
+
+    @cached_property
+    def DB_ROLLUPS(self) -> bool:
+        """Maintain the 5 minute, hourly and daily rollup tables of the visitors tables on ingest."""
+        # With change-only storage the rollups would count the stored rows, a load would be weighted by how often
+        # it changed instead of how long it lasted.
+        return flag(self.values.get("DB_ROLLUPS", "true")) and not self.CHANGE_ONLY_STORAGE
+
+    @cached_property
+    def OPENING_HOURS_FILE(self) -> str:
+        """Exceptions to the opening hours (special closures and hours), a JSON file of hours per studio and date."""
+        return self.values.get("OPENING_HOURS_FILE") or os.path.join(self.PATH_TO_ROOT, "opening_hours.json")
+
+    def studio(self, location_short_title: str) -> StudioContext:
+        """
+        Return the context of a studio.
+
+        Raises:
+            KeyError: If the studio is not in STUDIO_MAP.
+        """
+        location_short_title = location_short_title.lower()
+        context = self._studios.get(location_short_title)
+        if context is None:
+            context = self._studios[location_short_title] = StudioContext(location_short_title, self.PATH_TO_ROOT)
+        return context
+
+
+# The configuration the modules read through constants, created on first use.
+_active = None
+
+
+def get_config() -> Config:
+    """
+    Return the active configuration, read from CONFIG_FILE if that is set, else from the environment.
+    """
+    global _active
+    if _active is None:
+        config_file = os.environ.get("CONFIG_FILE")
+        _active = Config.from_file(config_file) if config_file else Config.from_env()
+    return _active
+
+
+def set_config(config: Config) -> Config:
+    """
+    Activate a configuration, e.g. for a benchmark in a temporary directory.
+
+    Returns:
+        Config: The previously active configuration, None if none was used yet.
+    """
+    global _active
+    previous, _active = _active, config
+    return previous
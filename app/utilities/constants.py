@@ -1,49 +1,18 @@
 import os
-import sys
-from . import utils_log
 
 
-# Constant values such as settings inferred from environment.
+# Constant values and the settings of the worker.
+#
+# The settings are read from the active configuration (see config.py) on first access, e.g. constants.REQUEST_DENSITY.
+# Importing this module reads no environment variables and creates no directories.
 
-# Path to the root directory ("/app" inside the Docker container).
-PATH_TO_ROOT = os.getcwd()
+# File formats of the samples: "csv" (daily text segments) or "binary" (monthly fixed-width segments).
+STORAGE_FORMATS = ("csv", "binary")
 
+# Special location short title: a single worker collects every studio in STUDIO_MAP.
+ALL_STUDIOS = "all"
 
-# ----------------------- SETTINGS -----------------------
-# Frequency of API requests in seconds.
-try:
-    REQUEST_DENSITY = int(os.getenv("REQUEST_DENSITY", 5)) * 60
-except ValueError:
-    REQUEST_DENSITY = 5 * 60  # Use a default value of 5 minutes
-
-# How many entries in the CSV file until a new one is created.
-try:
-    ENTRIES_UNTIL_FILE_SEGMENTATION = int(os.getenv("ENTRIES_UNTIL_FILE_SEGMENTATION", 1000))
-except ValueError:
-    ENTRIES_UNTIL_FILE_SEGMENTATION = 1000  # Use a default value of 1000
-
-
-# Required Environment variables:
-try:
-    LOCATION_SHORT_TITLE = os.getenv("LOCATION_SHORT_TITLE").lower()  # Indicates the location to be tracked based on the gym-mapping.json file.
-    assert LOCATION_SHORT_TITLE is not None, "LOCATION_SHORT_TITLE was not provided."
-
-    # Create the data directory if it doesn't exist.
-    LOCATION_DATA_DIR = os.path.join(PATH_TO_ROOT, LOCATION_SHORT_TITLE, "data",)
-    if not os.path.exists(LOCATION_DATA_DIR):
-        os.makedirs(LOCATION_DATA_DIR, exist_ok=True)
-
-    # Create the log directory if it doesn't exist.
-    LOCATION_LOG_DIR = os.path.join(PATH_TO_ROOT, LOCATION_SHORT_TITLE, "logs")
-    if not os.path.exists(LOCATION_LOG_DIR):
-        os.makedirs(LOCATION_LOG_DIR, exist_ok=True)
-
-except AssertionError as e:
-    error_file_path = os.path.join(LOCATION_LOG_DIR, "logs.error")
-    utils_log.log(f"Location Short Title: {LOCATION_SHORT_TITLE} --> {e}", error_file_path)
-    sys.exit(1)
-
-# ----------------------- SETTINGS -----------------------
+URL = f"https://bodycultureapp.de/ajax/studiocapacity?apiToken=5"
 
 
 # Studios are identified by their LOCATION SHORT NAME:
@@ -80,7 +49,33 @@ STUDIO_MAP = {
     },
 }
 
-STUDIO = STUDIO_MAP.get(LOCATION_SHORT_TITLE)
-OPENING_HOURS = STUDIO["opening_hours"]
-STUDIO_ID = int(STUDIO.get("id"))
-URL = f"https://bodycultureapp.de/ajax/studiocapacity?apiToken=5"
+
+def get_location_dirs(location_short_title: str) -> tuple:
+    """
+    Return the data and log directory of a location. The directories are created on their first write.
+
+    Args:
+        location_short_title (str): The location short title, e.g. "ffgr".
+
+    Returns:
+        tuple: The (data_dir, log_dir) paths of the location.
+    """
+    root = _get_config().PATH_TO_ROOT
+    location_short_title = location_short_title.lower()
+    return os.path.join(root, location_short_title, "data"), os.path.join(root, location_short_title, "logs")
+
+
+def _get_config():
+    # Imported here, config imports this module.
+    from . import config
+    return config.get_config()
+
+
+def __getattr__(name: str):
+    """Read a setting from the active configuration."""
+    if name.startswith("__"):
+        raise AttributeError(name)
+    try:
+        return getattr(_get_config(), name)
+    except AttributeError:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
@@ -0,0 +1,145 @@
+"""Decoding of the studiocapacity responses: a validated studio id index which detects drift of the payload."""
+import os
+import json
+
+from . import constants
+from . import metrics
+from . import utils_log
+
+try:
+    # Optional, several times faster than the json module on the API responses.
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON_BACKEND = "orjson" if orjson is not None else "json"
+
+# The kinds of drift between two responses, counted in collector_payload_drift_total.
+DRIFT_KINDS = ("reorder", "studios", "schema", "invalid", "duplicate", "missing")
+
+
+def loads(body: bytes):
+    """
+    Parse a JSON response body with the fastest available backend.
+
+    Raises:
+        ValueError: If the body is not valid JSON.
+    """
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+def validate_record(record):
+    """
+    Validate the fields of a studio record which are used.
+
+    Args:
+        record: A record of the response, e.g. {"studio_id": 3, "current_load": 59, ...}.
+
+    Returns:
+        tuple: The studio id and the current load (None if the API doesn't know it), None if the record is invalid.
+    """
+    if not isinstance(record, dict):
+        return None
+    studio_id, current_load = record.get("studio_id"), record.get("current_load")
+    if isinstance(studio_id, str) and studio_id.isdigit():
+        studio_id = int(studio_id)
+    if not isinstance(studio_id, int) or isinstance(studio_id, bool):
+        return None
+    if current_load is not None and (not isinstance(current_load, int) or isinstance(current_load, bool) or current_load < 0):
+        return None
+    return studio_id, current_load
+
+
+class StudioDecoder:
+    """
+    Indexes the responses by studio id and reports drift of the payload compared to the previous response.
+
+    The index makes the lookup of a studio independent of its position in the list, a reordered list or a
+    disappeared studio never records the load of another studio.
+
+    Example:
+        decoder = StudioDecoder()
+        loads_by_id = decoder.index(payload)
+        loads_by_id.get(3)
+    """
+
+    def __init__(self, log_file_path: str = None):
+        """
+        Args:
+            log_file_path (str, optional): The file to log the drift to. Defaults to "requests.log".
+        """
+        self.log_file_path = log_file_path
+        self.order = None  # The studio ids of the previous response in their order.
+        self.fields = None  # The fields of the records of the previous response.
+
+    def index(self, payload) -> dict:
+        """
+        Index the valid records of a response by studio id.
+
+        Args:
+            payload: The parsed response, a list of studio records.
+
+        Returns:
+            dict: The current load per studio id.
+
+        Raises:
+            ValueError: If the payload is not a list.
+        """
+        if not isinstance(payload, list):
+            self.report("schema", f"Expected a list of studios, got {type(payload).__name__}.")
+            raise ValueError(f"Unexpected payload of type {type(payload).__name__}.")
+
+        loads_by_id, order, fields = {}, [], set()
+        invalid = duplicates = 0
+        for record in payload:
+            studio = validate_record(record)
+            if studio is None:
+                invalid += 1
+                continue
+            studio_id, current_load = studio
+            if studio_id in loads_by_id:
+                duplicates += 1
+                continue
+            loads_by_id[studio_id] = current_load
+            order.append(studio_id)
+            fields.update(record)
+
+        if invalid:
+            self.report("invalid", f"{invalid} records without a valid studio_id or current_load.", invalid)
+        if duplicates:
+            self.report("duplicate", f"{duplicates} records of a studio_id which was already in the response.", duplicates)
+        self.detect_drift(tuple(order), frozenset(fields))
+        return loads_by_id
+
+    def detect_drift(self, order: tuple, fields: frozenset):
+        """
+        Compare the studio ids and fields of a response to the previous response.
+        """
+        if self.order is not None and order != self.order:
+            if set(order) == set(self.order):
+                self.report("reorder", "The studios are in another order than in the previous response.")
+            else:
+                added, removed = set(order) - set(self.order), set(self.order) - set(order)
+                self.report("studios", f"Studios added: {sorted(added)}, removed: {sorted(removed)}.")
+        if self.fields is not None and fields != self.fields:
+            self.report("schema", f"Fields added: {sorted(fields - self.fields)}, removed: {sorted(self.fields - fields)}.")
+        self.order, self.fields = order, fields
+
+    def report(self, kind: str, message: str, count: int = 1):
+        """
+        Count and log drift of the payload.
+
+        Args:
+            kind (str): One of DRIFT_KINDS.
+            message (str): The details.
+            count (int, optional): The number of occurrences. Defaults to 1.
+        """
+        metrics.payload_drift_total.inc(count, kind=kind)
+        log_file_path = self.log_file_path or os.path.join(constants.LOCATION_LOG_DIR, "requests.log")
+        utils_log.log(f"Payload drift ({kind}): {message}", log_file_path, level=utils_log.WARNING)
+
+
+# The decoder of the process, remembers the previous response.
+studio_decoder = StudioDecoder()
@@ -0,0 +1,145 @@
+"""Reusable HTTP client for the API requests."""
+import os
+import time
+import random
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from . import constants
+from . import decoding
+from . import metrics
+from . import profiling
+from . import utils_log
+
+# Responses which are worth retrying, every other error status fails immediately.
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class HttpClient:
+    """
+    HTTP client with a pooled keep-alive session, timeouts, jittered retries and conditional requests.
+
+    The session keeps the TCP/TLS connection to the API open between ticks, so only the first request pays
+    for the handshake. Responses carrying an ETag or Last-Modified header are cached, following requests are
+    sent conditionally and an unchanged payload (304 Not Modified) is served from the cache.
+
+    Example:
+        client = HttpClient()
+        studios = client.get_json(constants.URL)
+        client.last_latency  # Seconds the request took.
+    """
+
+    def __init__(self, connect_timeout: float = None, read_timeout: float = None, retries: int = None,
+                 backoff_factor: float = 0.5, backoff_max: float = 30.0, pool_maxsize: int = 4, log_file_path: str = None):
+        """
+        Args:
+            connect_timeout (float, optional): Seconds to wait for the connection. Defaults to REQUEST_CONNECT_TIMEOUT.
+            read_timeout (float, optional): Seconds to wait for the response. Defaults to REQUEST_READ_TIMEOUT.
+            retries (int, optional): How often a failed request is retried. Defaults to REQUEST_RETRIES.
+            backoff_factor (float, optional): Base of the exponential backoff in seconds. Defaults to 0.5.
+            backoff_max (float, optional): Upper bound of a single backoff in seconds. Defaults to 30.
+            pool_maxsize (int, optional): Connections kept alive per host. Defaults to 4.
+            log_file_path (str, optional): The file to log to. Defaults to "requests.log".
+        """
+        self.timeout = (
+            connect_timeout if connect_timeout is not None else constants.REQUEST_CONNECT_TIMEOUT,
+            read_timeout if read_timeout is not None else constants.REQUEST_READ_TIMEOUT,
+        )
+        self.retries = retries if retries is not None else constants.REQUEST_RETRIES
+        self.backoff_factor = backoff_factor
+        self.backoff_max = backoff_max
+        self.log_file_path = log_file_path or os.path.join(constants.LOCATION_LOG_DIR, "requests.log")
+
+        self.session = requests.Session()
+        self.session.headers.update({"Accept": "application/json"})
+        # Retries are handled by the client itself to add jitter and log every attempt.
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        # url -> (validators, payload) of the last successful response.
+        self._cache = {}
+
+        # Latency of the last attempt in seconds, and totals over all attempts.
+        self.last_latency = None
+        self.request_count = 0
+        self.total_latency = 0.0
+        self.retry_count = 0
+
+    def backoff(self, attempt: int) -> float:
+        """
+        Return the seconds to wait before the retry after the given (0-based) attempt.
+
+        Uses "full jitter": a random delay between 0 and the capped exponential backoff, so that several workers
+        don't retry in lockstep.
+        """
+        return random.uniform(0, min(self.backoff_max, self.backoff_factor * 2 ** attempt))
+
+    def get_json(self, url: str):
+        """
+        Make a GET request and return the parsed JSON body.
+
+        Args:
+            url (str): The URL of the API endpoint.
+
+        Returns:
+            The JSON response, served from the cache if the server answered 304 Not Modified.
+
+        Raises:
+            requests.RequestException: If the request still fails after all retries.
+        """
+        validators, cached_payload = self._cache.get(url, ({}, None))
+
+        for attempt in range(self.retries + 1):
+            start = time.perf_counter()
+            try:
+                try:
+                    with profiling.stage("fetch"):
+                        response = self.session.get(url, headers=validators, timeout=self.timeout)
+                finally:
+                    # Every attempt counts, a timeout is the slowest one.
+                    self._record_latency(time.perf_counter() - start)
+
+                if response.status_code == 304 and cached_payload is not None:
+                    return cached_payload
+
+                if response.status_code in RETRY_STATUS_CODES and attempt < self.retries:
+                    raise requests.HTTPError(f"{response.status_code} Server Error for url: {url}", response=response)
+
+                response.raise_for_status()
+                with profiling.stage("decode"):
+                    payload = decoding.loads(response.content)
+
+                # Remember the validators to make the next request conditional.
+                validators = {}
+                if response.headers.get("ETag"):
+                    validators["If-None-Match"] = response.headers["ETag"]
+                if response.headers.get("Last-Modified"):
+                    validators["If-Modified-Since"] = response.headers["Last-Modified"]
+                if validators:
+                    self._cache[url] = (validators, payload)
+
+                return payload
+
+            except (requests.ConnectionError, requests.Timeout, requests.HTTPError) as e:
+                status_code = getattr(e.response, "status_code", None)
+                retryable = status_code is None or status_code in RETRY_STATUS_CODES
+                if not retryable or attempt == self.retries:
+                    raise
+
+                delay = self.backoff(attempt)
+                self.retry_count += 1
+                metrics.retries_total.inc()
+                utils_log.log(f"Request attempt {attempt + 1} failed ({e}), retrying in {delay:.2f} seconds.", self.log_file_path)
+                time.sleep(delay)
+
+    def _record_latency(self, latency: float):
+        """Record the latency of a single attempt, failed or not."""
+        self.last_latency = latency
+        self.request_count += 1
+        self.total_latency += latency
+
+    def close(self):
+        """Close the pooled connections."""
+        self.session.close()
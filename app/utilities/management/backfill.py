@@ -0,0 +1,247 @@
+# backfill.py
+"""Module for backfilling the visitors tables from the CSV segments with COPY."""
+
+import os
+import re
+import glob
+import json
+import time
+import threading
+from datetime import date, datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import psycopg2
+
+from .. import constants
+from .. import rollups
+from .. import utils_log
+from . import schema
+
+# Progress of the backfill in the data directory, the segments which are completely loaded.
+STATE_FILE_NAME = "backfill.json"
+
+# The creation time in the name of a segment, e.g. "visitors-ffgr-15-06-2023-10-30.csv".
+SEGMENT_TIME = re.compile(r"-(\d{2})-(\d{2})-(\d{4})-\d{2}-\d{2}\.csv$")
+
+# NULL in COPY's text format.
+COPY_NULL = "\\N"
+
+
+def find_segments(data_dir: str, location_short_title: str) -> list:
+    """
+    Return the paths of the CSV segments of a studio, ordered by name.
+    """
+    return sorted(glob.glob(os.path.join(data_dir, f"visitors-{location_short_title}-*.csv")))
+
+
+def segment_day(file_path: str):
+    """
+    Return the day of a segment from its name, None if the name doesn't contain one.
+    """
+    match = SEGMENT_TIME.search(os.path.basename(file_path))
+    if match is None:
+        return None
+    day, month, year = (int(group) for group in match.groups())
+    return date(year, month, day)
+
+
+def to_copy_row(line: str):
+    """
+    Convert a "<unix timestamp>,<visitor count>" row of a segment to a row of COPY's text format.
+
+    The timestamp is converted to the local minute like the rows the worker inserts.
+
+    Returns:
+        str: The row, None for the header and torn rows.
+    """
+    timestamp, separator, visitor_count = line.strip().partition(",")
+    if not timestamp.isdigit() or not separator:
+        # The header or a torn last row, e.g. when the process died in the middle of a write.
+        return None
+    minute = datetime.fromtimestamp(int(timestamp)).strftime("%Y-%m-%d %H:%M")
+    return f"{minute}\t{visitor_count if visitor_count.isdigit() else COPY_NULL}\n"
+
+
+class CopySource:
+    """
+    File-like object which converts the rows of a CSV segment while COPY reads them, the segment is never
+    loaded into memory as a whole.
+    """
+
+    def __init__(self, csv_file):
+        self._lines = iter(csv_file)
+        self._buffer = ""
+        self.rows = 0
+
+    def read(self, size: int = -1) -> str:
+        while size is None or size < 0 or len(self._buffer) < size:
+            line = next(self._lines, None)
+            if line is None:
+                break
+            row = to_copy_row(line)
+            if row is not None:
+                self._buffer += row
+                self.rows += 1
+        if size is None or size < 0:
+            data, self._buffer = self._buffer, ""
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+class BackfillState:
+    """
+    The segments which are completely loaded, with their size and modification time when they were loaded.
+
+    A segment which changed since (e.g. today's segment which is still written) is loaded again, the
+    deduplication skips its rows which are already in the table.
+    """
+
+    def __init__(self, data_dir: str):
+        self.path = os.path.join(data_dir, STATE_FILE_NAME)
+        self._lock = threading.Lock()
+        try:
+            with open(self.path, mode="r", encoding="utf-8") as state_file:
+                self.segments = json.load(state_file).get("segments", {})
+        except (OSError, ValueError):
+            self.segments = {}
+
+    @staticmethod
+    def signature(file_path: str) -> list:
+        """Return the size and modification time of a segment."""
+        stat = os.stat(file_path)
+        return [stat.st_size, stat.st_mtime_ns]
+
+    def is_done(self, file_path: str) -> bool:
+        """Check whether the segment was loaded and didn't change since."""
+        entry = self.segments.get(os.path.basename(file_path))
+        return entry is not None and entry["signature"] == self.signature(file_path)
+
+    def mark_done(self, file_path: str, signature: list, inserted: int):
+        """Record a loaded segment with its signature from before it was read and save the state."""
+        with self._lock:
+            self.segments[os.path.basename(file_path)] = {"signature": signature, "inserted": inserted}
+            self.save()
+
+    def reset(self):
+        """Forget the progress, every segment is loaded again."""
+        with self._lock:
+            self.segments = {}
+            self.save()
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, mode="w", encoding="utf-8") as state_file:
+            json.dump({"segments": self.segments}, state_file)
+        os.replace(tmp_path, self.path)
+
+
+def load_segment(connection, table_name: str, file_path: str, with_rollups: bool = False) -> tuple:
+    """
+    Load a segment into the table, rows with a timestamp which is already in the table are skipped.
+
+    The rows are streamed into a temporary staging table with COPY and inserted with a single INSERT ... SELECT.
+    The unique key of the timestamps skips the rows which are already in the table, the worker keeps writing and
+    the segments are loaded in parallel without locking the table.
+
+    Args:
+        connection (psycopg2.extensions.connection): The database connection.
+        table_name (str): The name of the visitors table.
+        file_path (str): The path to the segment.
+        with_rollups (bool, optional): Add the inserted rows to the rollup tables. Defaults to False.
+
+    Returns:
+        tuple: The number of rows read and inserted.
+
+    Raises:
+        psycopg2.Error: If the segment could not be loaded. The transaction is rolled back.
+    """
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("CREATE TEMP TABLE backfill_staging (timestamp TIMESTAMP, visitor_count INT) ON COMMIT DROP")
+            with open(file_path, mode="r", newline="") as csv_file:
+                source = CopySource(csv_file)
+                cursor.copy_expert("COPY backfill_staging (timestamp, visitor_count) FROM STDIN", source)
+
+            cursor.execute(
+                f"INSERT INTO {table_name} (timestamp, visitor_count) "
+                "SELECT DISTINCT ON (timestamp) timestamp, visitor_count FROM backfill_staging "
+                "ORDER BY timestamp, visitor_count IS NULL ON CONFLICT DO NOTHING RETURNING timestamp, visitor_count"
+            )
+            inserted = cursor.fetchall()
+            if with_rollups and inserted:
+                rollups.upsert(cursor, table_name, inserted)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    return source.rows, len(inserted)
+
+
+def backfill(pool, data_dir: str, location_short_title: str, table_name: str = None, jobs: int = 4, restart: bool = False) -> dict:
+    """
+    Load the CSV segments of a studio into its visitors table, e.g. after database outages.
+
+    The segments are loaded in parallel, each in its own transaction. The progress is saved after every segment,
+    an interrupted backfill continues with the segments which are not loaded yet.
+
+    Args:
+        pool (db_connect.ConnectionPool): The database connection pool.
+        data_dir (str): The data directory of the studio.
+        location_short_title (str): The location short title, e.g. "ffgr".
+        table_name (str, optional): The visitors table. Defaults to "visitors_<location_short_title>".
+        jobs (int, optional): How many segments are loaded at once. Defaults to 4.
+        restart (bool, optional): Forget the progress of earlier runs. Defaults to False.
+
+    Returns:
+        dict: The number of "segments", "skipped" (loaded before), "failed" segments, "rows" read and "inserted".
+    """
+    table_name = table_name or f"visitors_{location_short_title}"
+    log_file_path = os.path.join(constants.LOCATION_LOG_DIR, "db.log")
+    start = time.perf_counter()
+
+    state = BackfillState(data_dir)
+    if restart:
+        state.reset()
+    segments = find_segments(data_dir, location_short_title)
+    pending = [file_path for file_path in segments if not state.is_done(file_path)]
+    stats = {"segments": len(segments), "skipped": len(segments) - len(pending), "failed": 0, "rows": 0, "inserted": 0}
+    if not pending:
+        return stats
+
+    with pool.connection() as connection:
+        schema.ensure_schema(connection, table_name)
+        # Rows of older months would otherwise pile up in the default partition.
+        days = [day for day in map(segment_day, pending) if day is not None]
+        if days:
+            schema.create_partitions(connection, table_name, min(days), max(days))
+        if constants.DB_ROLLUPS and rollups.create_rollup_tables(connection, table_name):
+            rollups.rebuild(connection, table_name)
+
+    def load(file_path: str) -> tuple:
+        signature = BackfillState.signature(file_path)
+        with pool.connection() as connection:
+            rows, inserted = load_segment(connection, table_name, file_path, constants.DB_ROLLUPS)
+        state.mark_done(file_path, signature, inserted)
+        return rows, inserted
+
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        futures = {executor.submit(load, file_path): file_path for file_path in pending}
+        for future in as_completed(futures):
+            try:
+                rows, inserted = future.result()
+            except (psycopg2.Error, OSError) as e:
+                # The segment stays pending, the next run tries again.
+                stats["failed"] += 1
+                utils_log.log(f"Could not backfill {os.path.basename(futures[future])}: {e}", log_file_path, level=utils_log.ERROR)
+                continue
+            stats["rows"] += rows
+            stats["inserted"] += inserted
+
+    seconds = time.perf_counter() - start
+    utils_log.log(
+        f"Backfilled {stats['inserted']} of {stats['rows']} rows from {len(pending)} segments into {table_name} in {seconds:.1f} seconds "
+        f"({stats['skipped']} segments loaded before, {stats['failed']} failed).",
+        log_file_path
+    )
+    return stats
@@ -4,13 +4,79 @@
 import os
 import sys
 import time
+import threading
+from contextlib import contextmanager
+
 import psycopg2
+from psycopg2 import sql
 from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
 from .. import utils_log, utils_db
 from .. import constants
 
 
-def connect_to_db(db_host, db_name, db_user, db_password, db_port, recursion_depth=0):
+def create_database_if_not_exists(db_host, db_name, db_user, db_password, db_port) -> bool:
+    """
+    Create the database through the default "postgres" database if it doesn't exist yet.
+
+    Args:
+        db_host (str): The hostname of the database server.
+        db_name (str): The name of the database.
+        db_user (str): The username for connecting to the database.
+        db_password (str): The password for connecting to the database.
+        db_port (int): The port number for the database server.
+
+    Returns:
+        bool: True if the database was created, False if it already existed.
+
+    Raises:
+        psycopg2.Error: If the database server cannot be reached.
+    """
+    db_log_file_path = os.path.join(constants.LOCATION_LOG_DIR, "db.log")
+
+    # Default database name is guaranteed to exist.
+    db_connection = psycopg2.connect(host=db_host, database="postgres", user=db_user, password=db_password, port=db_port, connect_timeout=constants.DB_CONNECT_TIMEOUT)
+    try:
+        # Another worker might have created it in the meantime.
+        if utils_db.check_if_database_exists(db_connection=db_connection, db_name=db_name):
+            return False
+
+        # CREATE DATABASE cannot run inside a transaction.
+        db_connection.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        with db_connection.cursor() as cursor:
+            cursor.execute(sql.SQL("CREATE DATABASE {}").format(sql.Identifier(db_name)))
+        utils_log.log(f"Successfully created database {db_name}.", file_path=db_log_file_path)
+        return True
+    finally:
+        db_connection.close()
+
+
+def open_connection(db_host, db_name, db_user, db_password, db_port):
+    """
+    Open a connection straight to the target database, and create the database only if that attempt fails.
+
+    Args:
+        db_host (str): The hostname of the database server.
+        db_name (str): The name of the database.
+        db_user (str): The username for connecting to the database.
+        db_password (str): The password for connecting to the database.
+        db_port (int): The port number for the database server.
+
+    Returns:
+        psycopg2.extensions.connection: The database connection.
+
+    Raises:
+        psycopg2.Error: If the connection cannot be established.
+    """
+    try:
+        return psycopg2.connect(host=db_host, database=db_name, user=db_user, password=db_password, port=db_port, connect_timeout=constants.DB_CONNECT_TIMEOUT)
+    except psycopg2.OperationalError:
+        # Either the server is unreachable or the database doesn't exist yet. Only the latter is fixed by creating it.
+        if not create_database_if_not_exists(db_host, db_name, db_user, db_password, db_port):
+            raise
+    return psycopg2.connect(host=db_host, database=db_name, user=db_user, password=db_password, port=db_port, connect_timeout=constants.DB_CONNECT_TIMEOUT)
+
+
+def connect_to_db(db_host, db_name, db_user, db_password, db_port):
     """
     Connects to the database.
 
@@ -20,7 +86,6 @@ def connect_to_db(db_host, db_name, db_user, db_password, db_port, recursion_dep
         db_user (str): The username for connecting to the database.
         db_password (str): The password for connecting to the database.
         db_port (int): The port number for the database server.
-        recursion_depth (int, optional): The recursion depth for creating a new database. Defaults to 0.
 
     Returns:
         psycopg2.extensions.connection: The database connection.
@@ -34,77 +99,152 @@ def connect_to_db(db_host, db_name, db_user, db_password, db_port, recursion_dep
     retries = 10
     db_log_file_path = os.path.join(constants.LOCATION_LOG_DIR, "db.log")
 
-    # Default database name is guaranteed to exist.
     for attempt in range(retries):
         try:
-            # Initial connection
-            db_connection = psycopg2.connect(
-                host=db_host,
-                database="postgres" if recursion_depth == 0 else db_name,
-                user=db_user,
-                password=db_password,
-                port=db_port
-            )
-            connection_succeed = db_connection.closed == 0
-            if connection_succeed:
-                utils_log.log("Successfully established a connection to the database.", file_path=db_log_file_path)
-
-                # Now create a new database if it doesn't exist
-                database_does_not_exist = not utils_db.check_if_database_exists(db_connection=db_connection, db_name=db_name)
-                if database_does_not_exist:
-                    db_connection.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
-
-                    # Obtain a database cursor
-                    with db_connection.cursor() as cursor:
-                        # Create a new database
-                        cursor.execute(f"CREATE DATABASE {db_name}")
-
-                        db_connection.autocommit = False
-
-                        # Close the connection and establish a new one
-                        db_connection.close()
-
-                        # The database now exists, create a new connection to the newly created database
-                        utils_log.log(f"Successfully created database {db_name}.", file_path=db_log_file_path)
-
-                        # Recursive call to connect to the new database
-                        return connect_to_db(
-                            db_host=db_host,
-                            db_name=db_name,
-                            db_user=db_user,
-                            db_password=db_password,
-                            db_port=db_port,
-                            recursion_depth=recursion_depth + 1
-                        )
-                else:
-                    utils_log.log(f"Database {db_name} already exists. Continuing writing to that database.", file_path=db_log_file_path)
-                    db_connection.close()
-
-                    # Return connection to already existing database. 
-                    new_connection =  psycopg2.connect(
-                        host=db_host,
-                        database=db_name,
-                        user=db_user,
-                        password=db_password,
-                        port=db_port
-                    )
-                    return new_connection
-
-            else:
-                utils_log.log(f"Connection failed. Sleeping for {retry_delay} seconds.", file_path=db_log_file_path)
-                # Sleep and retry later
-                time.sleep(retry_delay)
-                retry_delay *= 2  # Exponential backoff
-
-        except psycopg2.DatabaseError as e:
-            utils_log.log(f"Error creating database {db_name}: {str(e)}", file_path=db_log_file_path)
-            retry_delay *= 2  # Exponential backoff
-            time.sleep(retry_delay)  # Database connection attempt failed, sleep and retry later
+            db_connection = open_connection(db_host, db_name, db_user, db_password, db_port)
+            utils_log.log("Successfully established a connection to the database.", file_path=db_log_file_path)
+            return db_connection
 
         except psycopg2.Error as e:
             utils_log.log(f"Error connecting to the database (sleep {retry_delay} seconds.): {str(e)}", file_path=db_log_file_path)
-            retry_delay *= 2  # Exponential backoff
             time.sleep(retry_delay)  # Database connection attempt failed, sleep and retry later
+            retry_delay *= 2  # Exponential backoff
 
     utils_log.log(f"Failed to establish a database connection after {retries} attempts.", file_path=db_log_file_path)
     sys.exit(1)
+
+
+class ConnectionPool:
+    """
+    Pool of database connections which are checked for liveness before they are handed out.
+
+    A connection which was broken in the meantime (e.g. by a database restart) is replaced transparently.
+
+    Example:
+        pool = ConnectionPool(db_host, db_name, db_user, db_password, db_port)
+        with pool.connection() as connection:
+            ...
+        pool.stats()
+    """
+
+    def __init__(self, db_host, db_name, db_user, db_password, db_port, max_idle: int = 2):
+        """
+        Args:
+            db_host (str): The hostname of the database server.
+            db_name (str): The name of the database.
+            db_user (str): The username for connecting to the database.
+            db_password (str): The password for connecting to the database.
+            db_port (int): The port number for the database server.
+            max_idle (int, optional): How many idle connections are kept open. Defaults to 2.
+        """
+        self.credentials = (db_host, db_name, db_user, db_password, db_port)
+        self.max_idle = max_idle
+        self.log_file_path = os.path.join(constants.LOCATION_LOG_DIR, "db.log")
+
+        self._idle = []
+        self._in_use = 0
+        self._lock = threading.Lock()
+
+        # Statistics.
+        self.opened = 0
+        self.reused = 0
+        self.reconnects = 0
+
+    @staticmethod
+    def ping(connection) -> bool:
+        """
+        Check if the connection is still alive with a round trip to the server.
+        """
+        if connection.closed:
+            return False
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            connection.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        """
+        Check out a live connection, open a new one if no idle connection passes the liveness ping.
+
+        Raises:
+            psycopg2.Error: If a new connection cannot be established.
+        """
+        while True:
+            with self._lock:
+                connection = self._idle.pop() if self._idle else None
+            if connection is None:
+                break
+            if self.ping(connection):
+                with self._lock:
+                    self._in_use += 1
+                    self.reused += 1
+                return connection
+
+            # The connection died while it was idle, e.g. the database was restarted.
+            self.reconnects += 1
+            utils_log.log("Discarded a broken database connection, reconnecting.", file_path=self.log_file_path)
+            if not connection.closed:
+                connection.close()
+
+        connection = open_connection(*self.credentials)
+        with self._lock:
+            self._in_use += 1
+            self.opened += 1
+        return connection
+
+    def adopt(self, connection):
+        """
+        Add an already open connection (e.g. from connect_to_db) to the idle connections.
+        """
+        with self._lock:
+            self._idle.append(connection)
+            self.opened += 1
+
+    def putconn(self, connection):
+        """
+        Return a connection to the pool. Broken connections and connections beyond max_idle are closed.
+        """
+        with self._lock:
+            self._in_use -= 1
+            keep = not connection.closed and len(self._idle) < self.max_idle
+            if keep:
+                self._idle.append(connection)
+        if not keep and not connection.closed:
+            connection.close()
+
+    @contextmanager
+    def connection(self):
+        """
+        Context manager which checks out a connection and returns it to the pool afterwards.
+        """
+        connection = self.getconn()
+        try:
+            yield connection
+        finally:
+            self.putconn(connection)
+
+    def stats(self) -> dict:
+        """
+        Return the pool statistics.
+        """
+        with self._lock:
+            return {
+                "idle": len(self._idle),
+                "in_use": self._in_use,
+                "opened": self.opened,
+                "reused": self.reused,
+                "reconnects": self.reconnects,
+            }
+
+    def closeall(self):
+        """
+        Close every idle connection.
+        """
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            if not connection.closed:
+                connection.close()
@@ -0,0 +1,308 @@
+# schema.py
+"""Module for managing the time-partitioned schema of the visitors tables."""
+
+import os
+import time
+import statistics
+from datetime import date, datetime, timedelta
+
+from .. import utils_log
+from .. import constants
+from .. import rollups
+
+# Same columns as the original unpartitioned tables.
+COLUMNS = "(timestamp TIMESTAMP, visitor_count INT)"
+
+# pg_class.relkind of a partitioned and of a regular table.
+PARTITIONED_TABLE = "p"
+REGULAR_TABLE = "r"
+
+
+def add_months(day: date, months: int) -> date:
+    """
+    Return the first day of the month which is the given number of months after the month of the day.
+    """
+    month_index = day.year * 12 + day.month - 1 + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+def partition_name(table_name: str, month: date) -> str:
+    """
+    Return the name of the partition of a month, e.g. "visitors_ffgr_y2023m06".
+    """
+    return f"{table_name}_y{month.year}m{month.month:02d}"
+
+
+def get_table_kind(connection, table_name: str):
+    """
+    Return the kind of the table.
+
+    Args:
+        connection (psycopg2.extensions.connection): The database connection.
+        table_name (str): The name of the table.
+
+    Returns:
+        str: PARTITIONED_TABLE, REGULAR_TABLE or None if the table doesn't exist.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE relname = %s AND relkind IN ('p', 'r')", (table_name,))
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def unique_key_name(table_name: str) -> str:
+    """
+    Return the name of the unique index of the sample timestamps, e.g. "visitors_ffgr_timestamp_key".
+    """
+    return f"{table_name}_timestamp_key"
+
+
+def _create_timestamp_indexes(cursor, table_name: str, index_method: str):
+    """Create the unique key of the timestamps and the configured timestamp index (inside a transaction)."""
+    # A sample per studio and minute, the rows are inserted with ON CONFLICT DO NOTHING. An index on the parent
+    # is created on every (future) partition, it includes the partition key as required for a unique index.
+    cursor.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {unique_key_name(table_name)} ON {table_name} (timestamp)")
+    # The unique key is a btree index of the timestamps, only a brin index is created in addition.
+    if index_method != "btree":
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {table_name}_timestamp_idx ON {table_name} USING {index_method} (timestamp)")
+
+
+def _create_partitioned_table(cursor, table_name: str, index_method: str):
+    """Create the partitioned parent table, its default partition and the timestamp indexes (inside a transaction)."""
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS {table_name} {COLUMNS} PARTITION BY RANGE (timestamp)")
+    # Catches rows outside of the pre-created partitions instead of rejecting them.
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS {table_name}_default PARTITION OF {table_name} DEFAULT")
+    _create_timestamp_indexes(cursor, table_name, index_method)
+
+
+def _create_partitions(cursor, table_name: str, first_month: date, last_month: date) -> int:
+    """Create the missing monthly partitions from the first to the last month (inside a transaction)."""
+    created = 0
+    month = add_months(first_month, 0)  # First day of the month.
+    while month <= last_month:
+        name = partition_name(table_name, month)
+        cursor.execute("SELECT to_regclass(%s)", (name,))
+        if cursor.fetchone()[0] is None:
+            start, end = month.isoformat(), add_months(month, 1).isoformat()
+            # Rows of the month which landed in the default partition are moved, otherwise attaching would fail.
+            cursor.execute(f"CREATE TABLE {name} (LIKE {table_name})")
+            cursor.execute(
+                f"WITH moved AS (DELETE FROM {table_name}_default WHERE timestamp >= %s AND timestamp < %s RETURNING *) "
+                f"INSERT INTO {name} SELECT * FROM moved",
+                (start, end)
+            )
+            cursor.execute(f"ALTER TABLE {table_name} ATTACH PARTITION {name} FOR VALUES FROM ('{start}') TO ('{end}')")
+            created += 1
+        month = add_months(month, 1)
+    return created
+
+
+def create_partitions(connection, table_name: str, first_day: date, last_day: date) -> int:
+    """
+    Create the missing partitions of the months from the first to the last day, e.g. before loading history.
+
+    Args:
+        connection (psycopg2.extensions.connection): The database connection.
+        table_name (str): The name of the partitioned table.
+        first_day (date): A day of the first month.
+        last_day (date): A day of the last month.
+
+    Returns:
+        int: The number of created partitions.
+    """
+    with connection.cursor() as cursor:
+        created = _create_partitions(cursor, table_name, add_months(first_day, 0), add_months(last_day, 0))
+    connection.commit()
+    if created:
+        utils_log.log(f"Created {created} partitions of {table_name}.", os.path.join(constants.LOCATION_LOG_DIR, "db.log"))
+    return created
+
+
+def ensure_partitions(connection, table_name: str, today: date = None, months_ahead: int = None) -> int:
+    """
+    Pre-create the partitions of the current and the following months.
+
+    Args:
+        connection (psycopg2.extensions.connection): The database connection.
+        table_name (str): The name of the partitioned table.
+        today (date, optional): The current day. Defaults to today.
+        months_ahead (int, optional): How many future months get a partition. Defaults to DB_PARTITIONS_AHEAD.
+
+    Returns:
+        int: The number of created partitions.
+    """
+    today = today or date.today()
+    months_ahead = months_ahead if months_ahead is not None else constants.DB_PARTITIONS_AHEAD
+    return create_partitions(connection, table_name, today, add_months(today, months_ahead))
+
+
+def migrate_to_partitioned(connection, table_name: str, index_method: str = None):
+    """
+    Migrate an unpartitioned table in place to a partitioned table with the same name.
+
+    The rows are copied into monthly partitions in a single transaction which locks the table, readers and writers
+    wait for the migration instead of seeing a half migrated table. On error everything is rolled back.
+
+    Args:
+        connection (psycopg2.extensions.connection): The database connection.
+        table_name (str): The name of the unpartitioned table.
+        index_method (str, optional): "btree" or "brin". Defaults to DB_TIMESTAMP_INDEX.
+
+    Raises:
+        psycopg2.Error: If the migration failed.
+    """
+    index_method = index_method or constants.DB_TIMESTAMP_INDEX
+    db_log_file_path = os.path.join(constants.LOCATION_LOG_DIR, "db.log")
+    unpartitioned_table_name = f"{table_name}_unpartitioned"
+
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f"LOCK TABLE {table_name} IN ACCESS EXCLUSIVE MODE")
+            cursor.execute(f"ALTER TABLE {table_name} RENAME TO {unpartitioned_table_name}")
+            _create_partitioned_table(cursor, table_name, index_method)
+
+            cursor.execute(f"SELECT MIN(timestamp), MAX(timestamp), COUNT(*) FROM {unpartitioned_table_name}")
+            first, last, row_count = cursor.fetchone()
+            if first is not None:
+                _create_partitions(cursor, table_name, first.date(), last.date())
+
+            # Duplicates of a timestamp are dropped, a row with a visitor count is kept.
+            cursor.execute(
+                f"INSERT INTO {table_name} (timestamp, visitor_count) SELECT DISTINCT ON (timestamp) timestamp, visitor_count "
+                f"FROM {unpartitioned_table_name} ORDER BY timestamp, visitor_count IS NULL"
+            )
+            cursor.execute(f"DROP TABLE {unpartitioned_table_name}")
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+
+    utils_log.log(f"Migrated {row_count} rows of {table_name} into monthly partitions.", db_log_file_path)
+
+
+def remove_duplicates(connection, table_name: str, index_method: str = None) -> int:
+    """
+    Remove the duplicate samples of a table which predates the unique key and create the key.
+
+    Before the unique key, retries, spool replays and overlapping workers inserted a timestamp several times. Of
+    the rows of a timestamp the first one with a visitor count is kept. Runs once, in a single transaction which
+    blocks the writers. The rollup tables counted the duplicates and are rebuilt.
+
+    Args:
+        connection (psycopg2.extensions.connection): The database connection.
+        table_name (str): The name of the partitioned table.
+        index_method (str, optional): "btree" or "brin". Defaults to DB_TIMESTAMP_INDEX.
+
+    Returns:
+        int: The number of removed rows.
+
+    Raises:
+        psycopg2.Error: If the migration failed. The transaction is rolled back.
+    """
+    index_method = index_method or constants.DB_TIMESTAMP_INDEX
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f"LOCK TABLE {table_name} IN SHARE ROW EXCLUSIVE MODE")
+            cursor.execute(
+                f"DELETE FROM {table_name} WHERE (tableoid, ctid) IN ("
+                "SELECT tableoid, ctid FROM ("
+                "SELECT tableoid, ctid, row_number() OVER (PARTITION BY timestamp ORDER BY visitor_count IS NULL, ctid) AS position "
+                f"FROM {table_name}) AS samples WHERE position > 1)"
+            )
+            removed = cursor.rowcount
+            _create_timestamp_indexes(cursor, table_name, index_method)
+            if index_method == "btree":
+                # Covered by the unique key.
+                cursor.execute(f"DROP INDEX IF EXISTS {table_name}_timestamp_idx")
+            cursor.execute("SELECT to_regclass(%s)", (rollups.rollup_table_name(table_name, rollups.ROLLUPS[0][0]),))
+            has_rollups = cursor.fetchone()[0] is not None
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+
+    utils_log.log(f"Removed {removed} duplicate rows of {table_name} and created its unique key.", os.path.join(constants.LOCATION_LOG_DIR, "db.log"))
+    if removed and has_rollups:
+        rollups.rebuild(connection, table_name)
+    return removed
+
+
+def ensure_schema(connection, table_name: str, today: date = None):
+    """
+    Create the partitioned table or migrate an existing unpartitioned one, and pre-create the future partitions.
+    Tables without the unique key of the timestamps are deduplicated.
+
+    Args:
+        connection (psycopg2.extensions.connection): The database connection.
+        table_name (str): The name of the table, e.g. "visitors_ffgr".
+        today (date, optional): The current day. Defaults to today.
+
+    Raises:
+        psycopg2.Error: If the schema could not be created or migrated.
+    """
+    table_kind = get_table_kind(connection, table_name)
+    connection.rollback()  # End the transaction of the lookup, the migration locks the table in its own.
+
+    if table_kind == REGULAR_TABLE:
+        before = benchmark_range_query(connection, table_name)
+        migrate_to_partitioned(connection, table_name)
+        after = benchmark_range_query(connection, table_name)
+        utils_log.log(
+            f"Range query of the last week on {table_name}: {before['median_ms']:.2f} ms before and "
+            f"{after['median_ms']:.2f} ms after partitioning.",
+            os.path.join(constants.LOCATION_LOG_DIR, "db.log")
+        )
+    elif table_kind is None:
+        with connection.cursor() as cursor:
+            _create_partitioned_table(cursor, table_name, constants.DB_TIMESTAMP_INDEX)
+        connection.commit()
+    else:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT to_regclass(%s)", (unique_key_name(table_name),))
+            has_unique_key = cursor.fetchone()[0] is not None
+        connection.rollback()
+        if not has_unique_key:
+            remove_duplicates(connection, table_name)
+
+    ensure_partitions(connection, table_name, today)
+
+
+def benchmark_range_query(connection, table_name: str, start: datetime = None, end: datetime = None, repeat: int = 5) -> dict:
+    """
+    Measure the latency of a time-range query as the dashboards run it.
+
+    Args:
+        connection (psycopg2.extensions.connection): The database connection.
+        table_name (str): The name of the table.
+        start (datetime, optional): The start of the range. Defaults to a week before end.
+        end (datetime, optional): The end of the range. Defaults to now.
+        repeat (int, optional): How often the query runs. Defaults to 5.
+
+    Returns:
+        dict: The "median_ms" and "min_ms" wall-clock latency, the number of "rows" and the "plan" node types
+        of the query, e.g. ["Append", "Index Scan"] after and ["Seq Scan"] before partitioning.
+    """
+    end = end or datetime.now()
+    start = start or end - timedelta(days=7)
+    query = f"SELECT timestamp, visitor_count FROM {table_name} WHERE timestamp >= %s AND timestamp < %s"
+
+    latencies = []
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {query}", (start, end))
+        plan = cursor.fetchone()[0]
+        for _ in range(repeat):
+            started = time.perf_counter()
+            cursor.execute(query, (start, end))
+            rows = len(cursor.fetchall())
+            latencies.append((time.perf_counter() - started) * 1000)
+    connection.rollback()
+
+    node_types = []
+    nodes = [plan[0]["Plan"]] if plan else []
+    while nodes:
+        node = nodes.pop(0)
+        if node["Node Type"] not in node_types:
+            node_types.append(node["Node Type"])
+        nodes.extend(node.get("Plans", []))
+
+    return {"median_ms": statistics.median(latencies), "min_ms": min(latencies), "rows": rows, "plan": node_types}
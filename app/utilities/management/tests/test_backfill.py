@@ -0,0 +1,172 @@
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from unittest import TestCase
+from unittest.mock import patch, MagicMock, ANY
+from datetime import date, datetime
+
+import psycopg2
+
+from .. import backfill
+
+
+class FakeCursor:
+    """Cursor which reads the COPY data and inserts every staged row."""
+
+    def __init__(self, fail_copy=False):
+        self.queries = []
+        self.copied = ""
+        self.fail_copy = fail_copy
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def execute(self, query, params=None):
+        self.queries.append(" ".join(query.split()))
+
+    def copy_expert(self, query, source):
+        if self.fail_copy:
+            raise psycopg2.DataError("invalid input syntax")
+        self.queries.append(query)
+        while True:
+            data = source.read(16)  # Small chunks, like the COPY buffer over many rows.
+            if not data:
+                break
+            self.copied += data
+
+    def fetchall(self):
+        rows = []
+        for line in self.copied.splitlines():
+            timestamp, visitor_count = line.split("\t")
+            rows.append((datetime.strptime(timestamp, "%Y-%m-%d %H:%M"), None if visitor_count == "\\N" else int(visitor_count)))
+        return rows
+
+
+class FakePool:
+    """Pool which hands out connections with a fresh FakeCursor."""
+
+    def __init__(self):
+        self.cursors = []
+
+    @contextmanager
+    def connection(self):
+        connection = MagicMock()
+
+        def cursor():
+            fake_cursor = FakeCursor()
+            self.cursors.append(fake_cursor)
+            return fake_cursor
+        connection.cursor.side_effect = cursor
+        yield connection
+
+
+@patch("utilities.utils_log.log")
+@patch("builtins.print")
+class TestBackfill(TestCase):
+    """
+    Tests related to the backfill of the visitors tables from the CSV segments.
+    """
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.data_dir)
+        self.start = int(datetime(2023, 6, 15, 10, 30).timestamp())
+
+    def write_segment(self, file_name: str, rows: list) -> str:
+        file_path = os.path.join(self.data_dir, file_name)
+        with open(file_path, "w") as csv_file:
+            csv_file.write("timestamp,visitor_count\n")
+            csv_file.writelines(f"{timestamp},{'' if load is None else load}\n" for timestamp, load in rows)
+        return file_path
+
+    def test_segments(self, *args):
+        """Test that only the segments of the studio are found and their day is read from the name."""
+        self.write_segment("visitors-ffgr-15-06-2023-10-30.csv", [])
+        self.write_segment("visitors-ffhb-15-06-2023-10-30.csv", [])
+        segments = backfill.find_segments(self.data_dir, "ffgr")
+
+        self.assertEqual([os.path.basename(file_path) for file_path in segments], ["visitors-ffgr-15-06-2023-10-30.csv"])
+        self.assertEqual(backfill.segment_day(segments[0]), date(2023, 6, 15))
+        self.assertIsNone(backfill.segment_day("manifest.json"))
+
+    def test_copy_rows(self, *args):
+        """Test that rows are converted to local minutes, empty loads to NULL and torn rows skipped."""
+        self.assertEqual(backfill.to_copy_row(f"{self.start},59\n"), "2023-06-15 10:30\t59\n")
+        self.assertEqual(backfill.to_copy_row(f"{self.start},\n"), "2023-06-15 10:30\t\\N\n")
+        self.assertIsNone(backfill.to_copy_row("timestamp,visitor_count\n"))
+        self.assertIsNone(backfill.to_copy_row("16868"), msg="Expect a torn row to be skipped.")
+
+    def test_load_segment(self, *args):
+        """Test that a segment is streamed with COPY and inserted skipping the timestamps which are already in the table."""
+        file_path = self.write_segment("visitors-ffgr-15-06-2023-10-30.csv", [(self.start, 59), (self.start + 300, None)])
+        cursor = FakeCursor()
+        connection = MagicMock()
+        connection.cursor.return_value = cursor
+
+        with patch("utilities.rollups.upsert") as upsert:
+            rows, inserted = backfill.load_segment(connection, "visitors_ffgr", file_path, with_rollups=True)
+
+        self.assertEqual((rows, inserted), (2, 2))
+        self.assertEqual(cursor.copied, "2023-06-15 10:30\t59\n2023-06-15 10:35\t\\N\n")
+        self.assertFalse(any(query.startswith("LOCK TABLE") for query in cursor.queries), msg="Expect the unique key to guard the table instead of a lock.")
+        self.assertTrue(cursor.queries[-1].startswith("INSERT INTO visitors_ffgr"))
+        self.assertIn("ON CONFLICT DO NOTHING RETURNING", cursor.queries[-1])
+        upsert.assert_called_once_with(cursor, "visitors_ffgr", cursor.fetchall())
+        connection.commit.assert_called_once()
+
+    def test_load_segment_rolls_back(self, *args):
+        """Test that a failed COPY rolls the transaction back."""
+        file_path = self.write_segment("visitors-ffgr-15-06-2023-10-30.csv", [(self.start, 59)])
+        connection = MagicMock()
+        connection.cursor.return_value = FakeCursor(fail_copy=True)
+
+        with self.assertRaises(psycopg2.DataError):
+            backfill.load_segment(connection, "visitors_ffgr", file_path)
+        connection.rollback.assert_called_once()
+        connection.commit.assert_not_called()
+
+    @patch("utilities.rollups.upsert")
+    @patch("utilities.rollups.create_rollup_tables", return_value=False)
+    @patch("utilities.management.schema.create_partitions")
+    @patch("utilities.management.schema.ensure_schema")
+    def test_backfill_resumes(self, ensure_schema, create_partitions, *args):
+        """Test that loaded segments are skipped on the next run unless they changed or the backfill restarts."""
+        first = self.write_segment("visitors-ffgr-14-05-2023-10-30.csv", [(self.start - 86400 * 32, 10)])
+        self.write_segment("visitors-ffgr-15-06-2023-10-30.csv", [(self.start, 59), (self.start + 300, 61)])
+
+        stats = backfill.backfill(FakePool(), self.data_dir, "ffgr")
+        self.assertEqual(stats, {"segments": 2, "skipped": 0, "failed": 0, "rows": 3, "inserted": 3})
+        create_partitions.assert_called_once_with(ANY, "visitors_ffgr", date(2023, 5, 14), date(2023, 6, 15))
+
+        stats = backfill.backfill(FakePool(), self.data_dir, "ffgr")
+        self.assertEqual(stats["skipped"], 2, msg="Expect the loaded segments to be skipped.")
+        self.assertEqual(stats["rows"], 0)
+
+        # A segment which grew since is loaded again.
+        with open(first, "a") as csv_file:
+            csv_file.write(f"{self.start - 86400 * 32 + 300},12\n")
+        os.utime(first, ns=(0, os.stat(first).st_mtime_ns + 1))
+        stats = backfill.backfill(FakePool(), self.data_dir, "ffgr")
+        self.assertEqual((stats["skipped"], stats["rows"]), (1, 2))
+
+        stats = backfill.backfill(FakePool(), self.data_dir, "ffgr", restart=True)
+        self.assertEqual((stats["skipped"], stats["rows"]), (0, 4))
+
+    @patch("utilities.rollups.upsert")
+    @patch("utilities.rollups.create_rollup_tables", return_value=False)
+    @patch("utilities.management.schema.create_partitions")
+    @patch("utilities.management.schema.ensure_schema")
+    def test_failed_segment_stays_pending(self, *args):
+        """Test that a segment which could not be loaded is tried again on the next run."""
+        self.write_segment("visitors-ffgr-15-06-2023-10-30.csv", [(self.start, 59)])
+        with patch.object(backfill, "load_segment", side_effect=psycopg2.OperationalError("connection lost")):
+            stats = backfill.backfill(FakePool(), self.data_dir, "ffgr")
+        self.assertEqual(stats["failed"], 1)
+
+        stats = backfill.backfill(FakePool(), self.data_dir, "ffgr")
+        self.assertEqual((stats["skipped"], stats["inserted"]), (0, 1))
+
@@ -2,8 +2,9 @@ from unittest import TestCase
 from unittest.mock import patch, MagicMock
 import os
 import psycopg2
+from psycopg2 import sql
 from ... import constants
-from ..db_connect import connect_to_db
+from ..db_connect import connect_to_db, ConnectionPool
 
 
 @patch("utilities.utils_log.log")
@@ -24,6 +25,16 @@ class TestDB(TestCase):
 
         self.file_path = os.path.join(constants.LOCATION_LOG_DIR, "db.log")
 
+    def connect_to_db(self):
+        """Call connect_to_db with the test credentials."""
+        return connect_to_db(
+            db_host=self.db_host,
+            db_name=self.db_name,
+            db_user=self.db_user,
+            db_password=self.db_password,
+            db_port=self.db_port
+        )
+
     @patch("time.sleep")
     def test_db_connect_if_db_exists(self, *args):
         """
@@ -33,53 +44,29 @@ class TestDB(TestCase):
         patched_check_if_db_exists = args[3]
         patched_log = args[4]
 
-        # Mock objects
         mocked_connection = MagicMock()
-        mocked_cursor = MagicMock()
-
-        # Configure the return value of the connection.cursor() method
-        mocked_connection.cursor.return_value = mocked_cursor
-        mocked_connection.closed = 0  # Indicate that the connection attempt has succeeded
-
         patched_connect.return_value = mocked_connection
 
-        # Database already exists.
-        patched_check_if_db_exists.return_value = True
-
         # Call the connect_to_db function
-        mocked_connection_return_value = connect_to_db(
-            db_host=self.db_host,
-            db_name=self.db_name,
-            db_user=self.db_user,
-            db_password=self.db_password,
-            db_port=self.db_port,
-            recursion_depth=0
-        )
+        mocked_connection_return_value = self.connect_to_db()
 
-        # Verify that the patched_connect method was called exactly once with the expected parameters
-        # In this case the db, does already exist, so we return a new connection pointing to it.
-        patched_connect.assert_called_with(
+        # Fast path: a single connection straight to the target database.
+        patched_connect.assert_called_once_with(
             host=self.db_host,
-            database=self.db_name,  # Default db name
+            database=self.db_name,
             user=self.db_user,
             password=self.db_password,
             port=self.db_port,
+            connect_timeout=constants.DB_CONNECT_TIMEOUT,
         )
 
         # Verify that no database creation steps are performed
-        mocked_cursor.assert_not_called()
-        mocked_connection.commit.assert_not_called()
-
-        # Called when the previous connection was closed.
-        mocked_connection.close.assert_called_once()
+        patched_check_if_db_exists.assert_not_called()
+        mocked_connection.cursor.assert_not_called()
+        mocked_connection.close.assert_not_called()
 
         # Verify that the log function is called with the expected message
-        patched_log.assert_called_with(
-            f'Database {self.db_name} already exists. Continuing writing to that database.',
-            file_path=self.file_path
-        )
-
-        self.assertEqual(patched_connect.call_count, 2, msg="Expect that patched_connect was called twice.")
+        patched_log.assert_called_with("Successfully established a connection to the database.", file_path=self.file_path)
 
         # Verify that the method returns the established connection
         self.assertEqual(
@@ -93,71 +80,38 @@ class TestDB(TestCase):
         """
         Test the connection to the database when the database does not exist.
         """
+        patched_sleep = args[0]
         patched_connect = args[1]
         patched_check_if_db_exists = args[3]
-        patched_log = args[4]
 
         # Mock objects
-        mocked_connection = MagicMock()
+        postgres_connection = MagicMock()
         mocked_cursor = MagicMock()
-        mocked_cursor_context_manager = MagicMock()
-
-        # Set the __enter__ method of the mocked cursor to the mocked cursor context manager
-        mocked_cursor.__enter__.return_value = mocked_cursor_context_manager
-
-        # Configure the return value of the connection.cursor() method
-        mocked_connection.cursor.return_value = mocked_cursor
-
-        # Set the closed attribute of the connection to indicate a successful connection attempt
-        mocked_connection.closed = 0
+        postgres_connection.cursor.return_value.__enter__.return_value = mocked_cursor
+        target_connection = MagicMock()
 
-        patched_connect.side_effect = [mocked_connection, mocked_connection, mocked_connection]
+        # 1. target database does not exist, 2. 'postgres' database, 3. the newly created target database
+        patched_connect.side_effect = [
+            psycopg2.OperationalError(f'FATAL:  database "{self.db_name}" does not exist'),
+            postgres_connection,
+            target_connection,
+        ]
+        patched_check_if_db_exists.return_value = False
 
-        patched_check_if_db_exists.side_effect = [False, True]
+        mocked_connection_return_value = self.connect_to_db()
 
-        # Call the connect_to_db function
-        mocked_connection_return_value = connect_to_db(
-            db_host=self.db_host,
-            db_name=self.db_name,
-            db_user=self.db_user,
-            db_password=self.db_password,
-            db_port=self.db_port,
-            recursion_depth=0
-        )
+        self.assertEqual(patched_connect.call_count, 3, msg="Expect that psycopg2.connect was called three times.")
+        self.assertEqual(patched_connect.call_args_list[1].kwargs["database"], "postgres", msg="Expect the database to be created through 'postgres'.")
 
-        # Verify that the patched_connect method was called with the expected parameters
-        patched_connect.assert_called_with(
-            host=self.db_host,
-            database=self.db_name,  # Default db name
-            user=self.db_user,
-            password=self.db_password,
-            port=self.db_port,
-        )
+        # The database name is quoted as an identifier instead of formatted into the query.
+        mocked_cursor.execute.assert_called_once_with(sql.SQL("CREATE DATABASE {}").format(sql.Identifier(self.db_name)))
+        postgres_connection.close.assert_called_once()
+        patched_sleep.assert_not_called()
 
-        # Verify that the cursor and execute methods are called for database creation
-        self.assertEqual(
-            mocked_connection.close.call_count,
-            2,
-            msg="Expect that the connection was closed twice. First when connecting to 'postgres' db and creating a new db, and second when connecting to the new db."
-        )
-        self.assertEqual(
-            patched_connect.call_count,
-            3,
-            msg="Expect that psycopg2.connect was called three times."
-        )
-        mocked_cursor_context_manager.execute.assert_called_once_with(f"CREATE DATABASE {self.db_name.replace('-', '_')}")
-
-        # Verify that the log function is called with the expected message
-        patched_log.assert_called_with(
-            f'Database {self.db_name} already exists. Continuing writing to that database.',
-            file_path=self.file_path
-        )
-
-        # Verify that the method returns the established connection
         self.assertEqual(
             mocked_connection_return_value,
-            mocked_connection,
-            msg="Expect the returned connection to be the same as the mocked connection."
+            target_connection,
+            msg="Expect the connection to the newly created database."
         )
 
     @patch("sys.exit")
@@ -165,92 +119,24 @@ class TestDB(TestCase):
     def test_wait_for_db_delay(self, *args):
         """
         Test the exponential backoff when the database is not online.
-
-        The function performs the following steps:
-        - Mocks the necessary objects and methods.
-        - Sets up the side effects for the patched_connect function to simulate connection failures and success.
-        - Calls the connect_to_db function.
-        - Verifies that sys.exit() is called when a DatabaseError occurs.
-        - Verifies that the log function is called with the expected messages.
-        - Verifies the number of times the log, connect, and sleep functions are called.
         """
         patched_sleep = args[0]
         patched_connect = args[2]
-        patched_check_if_db_exists = args[4]
         patched_log = args[5]
 
-        # Create MagicMock instances to mock the original connection instances
-        connection_mock_closed = MagicMock()
-        connection_mock_closed.closed = 1
-
-        connection_mock_opened = MagicMock()
-        connection_mock_opened.closed = 0
-
-        # The side_effect attribute of a mock object allows you to define the behavior when the patched_connect
-        # function is called. In this case, it will raise psycopg2.DatabaseError once and then return the mock_instance.
+        mocked_connection = MagicMock()
 
-        # 2nd [connection_mock_opened] indicate the connection to 'postgres' 
-        # 3rd [connection_mock_opened] indicate the connection to target_db
-        side_effects = [psycopg2.DatabaseError] + [psycopg2.Error] + [connection_mock_closed] + [connection_mock_opened] + [connection_mock_opened]
+        # Server offline: the fast path fails and so does the connection to 'postgres'.
+        side_effects = [psycopg2.OperationalError, psycopg2.OperationalError] * 2 + [mocked_connection]
         patched_connect.side_effect = side_effects
 
-        # Check if DB exists should be skipped (already exists)
-        patched_check_if_db_exists.return_value = True
-
-        connect_to_db(
-            db_host=self.db_host,
-            db_name=self.db_name,
-            db_user=self.db_user,
-            db_password=self.db_password,
-            db_port=self.db_port,
-            recursion_depth=0,
-        )
-
-        # Verify that sys.exit() is called with the appropriate error code when a DatabaseError occurs
-        # patched_sys_exit.assert_called_once_with(1, msg="Expected sys.exit() to be called with error code 1.")
-
-        # Verify that the log function is called with the expected message
-        patched_log.assert_called_with(
-            f'Database {self.db_name} already exists. Continuing writing to that database.',
-            file_path=self.file_path
-        )
-
-        # Verify the number of times the log function is called
-        self.assertEqual(
-            patched_log.call_count,
-            5,
-            msg="Expected log function to be called 5 times."
-        )
-
-        # Verify the number of times the patched_connect function is called
-        self.assertEqual(
-            patched_connect.call_count,
-            len(side_effects),
-            msg="Expected patched_connect function to be called the same number of times as the side effects."
-        )
-
-        # Verify the number of times the patched_sleep function is called
-        self.assertEqual(
-            patched_sleep.call_count,
-            3,
-            msg="Expected patched_sleep function to be called 3 times."
-        )
-
-
-        # Verify that sys.exit() is called with the appropriate error code when a DatabaseError occurs
-        # patched_sys_exit.assert_called_once_with(1)
-
-        # Verify that the log function is called with the expected message
-        patched_log.assert_called_with(f'Database {self.db_name} already exists. Continuing writing to that database.', file_path=self.file_path)
-
-        # Verify the number of times the log function is called
-        self.assertEqual(patched_log.call_count, 5)
+        mocked_connection_return_value = self.connect_to_db()
 
-        # Verify the number of times the patched_connect function is called
-        self.assertEqual(patched_connect.call_count, len(side_effects))
-
-        # Verify the number of times the patched_sleep function is called
-        self.assertEqual(patched_sleep.call_count, 3)
+        self.assertEqual(patched_connect.call_count, len(side_effects), msg="Expect psycopg2.connect to be called for every side effect.")
+        self.assertEqual([call.args[0] for call in patched_sleep.call_args_list], [1, 2], msg="Expect an exponential backoff.")
+        self.assertEqual(patched_log.call_count, 3, msg="Expected log function to be called 3 times.")
+        patched_log.assert_called_with("Successfully established a connection to the database.", file_path=self.file_path)
+        self.assertEqual(mocked_connection_return_value, mocked_connection)
 
     @patch("sys.exit")
     @patch("time.sleep")
@@ -258,55 +144,83 @@ class TestDB(TestCase):
         patched_sleep = args[0]
         patched_sys_exit = args[1]
         patched_connect = args[2]
+        patched_check_if_db_exists = args[4]
         patched_log = args[5]
 
-        mocked_connection_closed = MagicMock()
-        mocked_connection_closed.closed = 1  # closed connection 
+        # The server answers, but refuses the connection (e.g. wrong password): the database exists,
+        # so nothing is created and the error is retried.
+        def connect(**kwargs):
+            if kwargs["database"] != "postgres":
+                raise psycopg2.OperationalError("password authentication failed")
+            return MagicMock()
 
-        # return 10 times a closed connection 
-        patched_log.side_effects = [mocked_connection_closed] * 10
+        patched_connect.side_effect = connect
+        patched_check_if_db_exists.return_value = True
 
-        connect_to_db(
-            db_host=self.db_host,
-            db_name=self.db_name,
-            db_user=self.db_user,
-            db_password=self.db_password,
-            db_port=self.db_port,
-            recursion_depth=0,
-        )
+        self.connect_to_db()
 
         retries = 10
 
-        # Verify the number of times the patched_connect function is called
-        self.assertEqual(
-            patched_connect.call_count,
-            retries,
-            msg=f"Expected patched_connect function to be called {retries} times."
-        )
-
-        # Verify the number of times the patched_sleep function is called
-        self.assertEqual(
-            patched_sleep.call_count,
-            retries,
-            msg=f"Expected patched_sleep function to be called {retries} times."
-        )
-
-        # Verify the number of times the log function is called
-        self.assertEqual(
-            patched_log.call_count,
-            retries + 1,
-            msg=f"Expected log function to be called {retries + 1} times."
-        )
-
-        # Verify that sys.exit() is called once
-        self.assertEqual(
-            patched_sys_exit.call_count,
-            1,
-            msg="Expected sys.exit() to be called once."
-        )
-
-        # Verify that the log function is called with the expected message
+        self.assertEqual(patched_sleep.call_count, retries, msg=f"Expected patched_sleep function to be called {retries} times.")
+        self.assertEqual(patched_log.call_count, retries + 1, msg=f"Expected log function to be called {retries + 1} times.")
+        self.assertEqual(patched_sys_exit.call_count, 1, msg="Expected sys.exit() to be called once.")
         patched_log.assert_called_with(
             f"Failed to establish a database connection after {retries} attempts.",
             file_path=self.file_path,
-        )
\ No newline at end of file
+        )
+
+
+@patch("utilities.utils_log.log")
+@patch("builtins.print")
+@patch("utilities.management.db_connect.open_connection")
+class TestConnectionPool(TestCase):
+    def setUp(self):
+        self.pool = ConnectionPool("db", "fitness_fabrik", "admin", "admin123", 5432)
+
+    @staticmethod
+    def make_connection(alive: bool = True):
+        """Create a mocked connection which does or doesn't answer the liveness ping."""
+        connection = MagicMock()
+        connection.closed = 0
+        if not alive:
+            connection.cursor.return_value.__enter__.return_value.execute.side_effect = psycopg2.OperationalError("server closed the connection")
+        return connection
+
+    def test_connections_are_reused(self, *args):
+        """Test that a returned connection is pinged and reused instead of opening a new one."""
+        patched_open_connection = args[0]
+        patched_open_connection.return_value = self.make_connection()
+
+        with self.pool.connection() as first:
+            self.assertEqual(self.pool.stats()["in_use"], 1)
+        with self.pool.connection() as second:
+            pass
+
+        self.assertIs(first, second, msg="Expect the idle connection to be reused.")
+        patched_open_connection.assert_called_once_with("db", "fitness_fabrik", "admin", "admin123", 5432)
+        first.cursor.return_value.__enter__.return_value.execute.assert_called_once_with("SELECT 1")
+        self.assertEqual(self.pool.stats(), {"idle": 1, "in_use": 0, "opened": 1, "reused": 1, "reconnects": 0})
+
+    def test_broken_connection_is_replaced(self, *args):
+        """Test that a connection which died while idle (database restart) is replaced transparently."""
+        patched_open_connection = args[0]
+        broken_connection = self.make_connection(alive=False)
+        new_connection = self.make_connection()
+        patched_open_connection.return_value = new_connection
+
+        self.pool.adopt(broken_connection)
+        with self.pool.connection() as connection:
+            self.assertIs(connection, new_connection, msg="Expect a new connection instead of the broken one.")
+
+        broken_connection.close.assert_called_once()
+        self.assertEqual(self.pool.stats()["reconnects"], 1, msg="Expect the reconnect to be counted.")
+
+    def test_closed_connections_are_not_pooled(self, *args):
+        """Test that a connection closed while checked out is not returned to the idle connections."""
+        patched_open_connection = args[0]
+        patched_open_connection.return_value = self.make_connection()
+
+        with self.pool.connection() as connection:
+            connection.closed = 2
+
+        self.assertEqual(self.pool.stats()["idle"], 0, msg="Expect the closed connection to be dropped.")
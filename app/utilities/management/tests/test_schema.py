@@ -0,0 +1,149 @@
+from unittest import TestCase
+from unittest.mock import patch, MagicMock
+from datetime import date, datetime
+
+from .. import schema
+
+
+class FakeCursor:
+    """Cursor which records the executed queries and answers the lookups."""
+
+    def __init__(self, existing_relations=(), table_kind=None, table_range=(None, None, 0)):
+        self.queries = []
+        self.existing_relations = set(existing_relations)
+        self.table_kind = table_kind
+        self.table_range = table_range
+        self._result = None
+        self.rowcount = -1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def execute(self, query, params=None):
+        self.queries.append(" ".join(query.split()))
+        if query.startswith("SELECT relkind"):
+            self._result = (self.table_kind,) if self.table_kind else None
+        elif query.startswith("SELECT to_regclass"):
+            self._result = (params[0] if params[0] in self.existing_relations else None,)
+        elif query.startswith("SELECT MIN"):
+            self._result = self.table_range
+        elif query.startswith("DELETE"):
+            self.rowcount = 3
+        elif query.startswith("EXPLAIN"):
+            self._result = ([{"Plan": {"Node Type": "Append", "Plans": [{"Node Type": "Index Scan"}]}}],)
+
+    def fetchone(self):
+        return self._result
+
+    def fetchall(self):
+        return []
+
+
+@patch("utilities.utils_log.log")
+@patch("builtins.print")
+class TestSchema(TestCase):
+    """
+    Tests related to the partitioned schema of the visitors tables.
+    """
+
+    def connect(self, cursor):
+        connection = MagicMock()
+        connection.cursor.return_value = cursor
+        return connection
+
+    def test_add_months(self, *args):
+        """Test that months are added across years and normalized to the first day."""
+        self.assertEqual(schema.add_months(date(2023, 11, 17), 0), date(2023, 11, 1))
+        self.assertEqual(schema.add_months(date(2023, 11, 17), 3), date(2024, 2, 1))
+        self.assertEqual(schema.partition_name("visitors_ffgr", date(2023, 6, 1)), "visitors_ffgr_y2023m06")
+
+    def test_ensure_schema_creates_partitioned_table(self, *args):
+        """Test that a missing table is created partitioned, indexed and with the upcoming partitions."""
+        cursor = FakeCursor()
+        connection = self.connect(cursor)
+
+        schema.ensure_schema(connection, "visitors_ffgr", today=date(2023, 6, 17))
+
+        self.assertIn("CREATE TABLE IF NOT EXISTS visitors_ffgr (timestamp TIMESTAMP, visitor_count INT) PARTITION BY RANGE (timestamp)", cursor.queries)
+        self.assertIn("CREATE TABLE IF NOT EXISTS visitors_ffgr_default PARTITION OF visitors_ffgr DEFAULT", cursor.queries)
+        self.assertIn("CREATE UNIQUE INDEX IF NOT EXISTS visitors_ffgr_timestamp_key ON visitors_ffgr (timestamp)", cursor.queries)
+        self.assertFalse(any("visitors_ffgr_timestamp_idx" in query for query in cursor.queries), msg="Expect the unique key to serve as the btree index.")
+
+        attached = [query for query in cursor.queries if "ATTACH PARTITION" in query]
+        self.assertEqual(len(attached), 1 + schema.constants.DB_PARTITIONS_AHEAD, msg="Expect the current and the upcoming months.")
+        self.assertEqual(attached[0], "ALTER TABLE visitors_ffgr ATTACH PARTITION visitors_ffgr_y2023m06 FOR VALUES FROM ('2023-06-01') TO ('2023-07-01')")
+
+    def test_ensure_partitions_skips_existing(self, *args):
+        """Test that only missing partitions are created and rows of the default partition are moved."""
+        cursor = FakeCursor(existing_relations={"visitors_ffgr_y2023m06"})
+        connection = self.connect(cursor)
+
+        created = schema.ensure_partitions(connection, "visitors_ffgr", today=date(2023, 6, 17), months_ahead=1)
+
+        self.assertEqual(created, 1)
+        self.assertTrue(any(query.startswith("WITH moved AS (DELETE FROM visitors_ffgr_default") for query in cursor.queries))
+        self.assertIn("ALTER TABLE visitors_ffgr ATTACH PARTITION visitors_ffgr_y2023m07 FOR VALUES FROM ('2023-07-01') TO ('2023-08-01')", cursor.queries)
+        connection.commit.assert_called_once()
+
+    def test_migrate_unpartitioned_table(self, *args):
+        """Test that an unpartitioned table is migrated in a single locked transaction."""
+        cursor = FakeCursor(table_kind=schema.REGULAR_TABLE, table_range=(datetime(2023, 4, 3, 10, 0), datetime(2023, 5, 20, 18, 0), 42))
+        connection = self.connect(cursor)
+
+        schema.ensure_schema(connection, "visitors_ffgr", today=date(2023, 6, 17))
+
+        lock = cursor.queries.index("LOCK TABLE visitors_ffgr IN ACCESS EXCLUSIVE MODE")
+        self.assertEqual(cursor.queries[lock + 1], "ALTER TABLE visitors_ffgr RENAME TO visitors_ffgr_unpartitioned")
+        self.assertIn("ALTER TABLE visitors_ffgr ATTACH PARTITION visitors_ffgr_y2023m04 FOR VALUES FROM ('2023-04-01') TO ('2023-05-01')", cursor.queries)
+        self.assertIn("ALTER TABLE visitors_ffgr ATTACH PARTITION visitors_ffgr_y2023m05 FOR VALUES FROM ('2023-05-01') TO ('2023-06-01')", cursor.queries)
+        copy = cursor.queries.index(
+            "INSERT INTO visitors_ffgr (timestamp, visitor_count) SELECT DISTINCT ON (timestamp) timestamp, visitor_count "
+            "FROM visitors_ffgr_unpartitioned ORDER BY timestamp, visitor_count IS NULL"
+        )
+        self.assertEqual(cursor.queries[copy + 1], "DROP TABLE visitors_ffgr_unpartitioned")
+
+    @patch("utilities.rollups.rebuild")
+    def test_remove_duplicates(self, patched_rebuild, *args):
+        """Test that a partitioned table without the unique key is deduplicated once and its rollups are rebuilt."""
+        cursor = FakeCursor(existing_relations={"visitors_ffgr_5min"}, table_kind=schema.PARTITIONED_TABLE)
+        connection = self.connect(cursor)
+
+        schema.ensure_schema(connection, "visitors_ffgr", today=date(2023, 6, 17))
+
+        lock = cursor.queries.index("LOCK TABLE visitors_ffgr IN SHARE ROW EXCLUSIVE MODE")
+        self.assertTrue(cursor.queries[lock + 1].startswith("DELETE FROM visitors_ffgr WHERE (tableoid, ctid) IN"))
+        self.assertEqual(cursor.queries[lock + 2], "CREATE UNIQUE INDEX IF NOT EXISTS visitors_ffgr_timestamp_key ON visitors_ffgr (timestamp)")
+        self.assertIn("DROP INDEX IF EXISTS visitors_ffgr_timestamp_idx", cursor.queries)
+        patched_rebuild.assert_called_once_with(connection, "visitors_ffgr")
+
+        # Deduplicated tables are left alone.
+        cursor = FakeCursor(existing_relations={"visitors_ffgr_timestamp_key"}, table_kind=schema.PARTITIONED_TABLE)
+        schema.ensure_schema(self.connect(cursor), "visitors_ffgr", today=date(2023, 6, 17))
+        self.assertFalse(any(query.startswith("DELETE") for query in cursor.queries))
+
+    def test_failed_migration_is_rolled_back(self, *args):
+        """Test that a failed migration leaves the table untouched."""
+        cursor = FakeCursor(table_kind=schema.REGULAR_TABLE)
+        cursor.execute = MagicMock(side_effect=Exception("lock timeout"))
+        connection = self.connect(cursor)
+
+        with self.assertRaises(Exception):
+            schema.migrate_to_partitioned(connection, "visitors_ffgr")
+
+        connection.rollback.assert_called_once()
+        connection.commit.assert_not_called()
+
+    def test_benchmark_range_query(self, *args):
+        """Test that the benchmark reports the latency, rows and plan of the range query."""
+        cursor = FakeCursor()
+        connection = self.connect(cursor)
+
+        result = schema.benchmark_range_query(connection, "visitors_ffgr", repeat=3)
+
+        self.assertEqual(result["plan"], ["Append", "Index Scan"])
+        self.assertEqual(result["rows"], 0)
+        self.assertGreaterEqual(result["median_ms"], result["min_ms"])
+        self.assertEqual(sum(query.startswith("SELECT timestamp, visitor_count FROM visitors_ffgr WHERE") for query in cursor.queries), 3)
@@ -0,0 +1,167 @@
+from unittest import TestCase
+from unittest.mock import patch
+import itertools
+import psycopg2
+from ..worker_group import WorkerGroup, STUDIO_LOCKS, MEMBER_LOCKS
+
+STUDIO_IDS = {"ffda": 1, "ffgr": 3, "ffhb": 2, "ffwi": 4, "ffof": 5}
+
+
+class FakeLockServer:
+    """
+    The advisory locks of a database: the pid of the session holding every lock, released when the session ends.
+    """
+
+    def __init__(self):
+        self.locks = {}
+        self.pids = itertools.count(100)
+
+    def connect(self):
+        return FakeConnection(self)
+
+
+class FakeConnection:
+    def __init__(self, server: FakeLockServer):
+        self.server = server
+        self.pid = next(server.pids)
+        self.closed = False
+        self.broken = False
+        self.autocommit = False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def close(self):
+        self.closed = True
+        self.server.locks = {key: pid for key, pid in self.server.locks.items() if pid != self.pid}
+
+
+class FakeCursor:
+    def __init__(self, connection: FakeConnection):
+        self.connection = connection
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def execute(self, query: str, params: tuple = ()):
+        if self.connection.broken:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+        locks, pid = self.connection.server.locks, self.connection.pid
+        if query.startswith("SELECT pg_try_advisory_lock"):
+            if locks.setdefault(params, pid) == pid:
+                self.rows = [(True,)]
+            else:
+                self.rows = [(False,)]
+        elif query.startswith("SELECT pg_advisory_unlock"):
+            self.rows = [(locks.pop(params, None) == pid,)]
+        elif query.startswith("SELECT count(*)"):
+            self.rows = [(sum(1 for key in locks if key[0] == params[0]),)]
+        elif query.startswith("SELECT objid"):
+            self.rows = [(key[1],) for key, holder in locks.items() if key[0] == params[0] and holder == pid]
+
+    def fetchall(self):
+        return self.rows
+
+
+@patch("utilities.utils_log.log")
+class TestWorkerGroup(TestCase):
+    """
+    Tests related to sharing the studios between the members of a worker group.
+    """
+
+    def setUp(self):
+        self.server = FakeLockServer()
+
+    def member(self, studio_ids: dict = None) -> WorkerGroup:
+        return WorkerGroup(self.server.connect, studio_ids or STUDIO_IDS, log_file_path="group.log")
+
+    def tick(self, *members) -> list:
+        """Claim, sample and release like run_tick, one member after the other."""
+        claimed = [member.claim() for member in members]
+        for member in members:
+            member.release_surplus()
+        return claimed
+
+    def assert_partition(self, claimed: list):
+        """Assert that every studio is sampled by exactly one member."""
+        studios = [studio for member_claimed in claimed for studio in member_claimed]
+        self.assertCountEqual(studios, STUDIO_IDS, msg="Expect every studio to be sampled exactly once.")
+
+    def test_single_member(self, *args):
+        """Test that a single member samples every studio."""
+        member = self.member()
+        self.assertEqual(member.claim(), set(STUDIO_IDS))
+        self.assertTrue(member.connection.autocommit, msg="Expect the locks not to keep a transaction open.")
+        self.assertEqual(member.slot, 0)
+
+    def test_rebalance_on_join(self, *args):
+        """Test that a joining member gets its share after the others released their surplus."""
+        first = self.member()
+        self.tick(first)
+
+        second = self.member()
+        # The new member finds every studio taken, the first one releases its surplus after its tick.
+        claimed = self.tick(first, second)
+        self.assert_partition(claimed)
+        self.assertEqual((len(claimed[0]), len(claimed[1])), (5, 0))
+
+        claimed = self.tick(first, second)
+        self.assert_partition(claimed)
+        self.assertEqual(sorted(len(member_claimed) for member_claimed in claimed), [2, 3], msg="Expect a fair share.")
+        self.assertEqual(second.slot, 1)
+
+        # Stable once balanced.
+        self.assertEqual(self.tick(first, second), claimed)
+
+    def test_takeover_on_leave(self, *args):
+        """Test that the studios of a stopped member are taken over on the next tick."""
+        members = [self.member() for _ in range(3)]
+        self.tick(*members)
+        claimed = self.tick(*members)
+        self.assert_partition(claimed)
+
+        pid = members[1].connection.pid
+        members[1].leave()
+        self.assertNotIn(pid, self.server.locks.values(), msg="Expect the locks to be released with the connection.")
+        claimed = self.tick(members[0], members[2])
+        self.assert_partition(claimed)
+        self.assertEqual(sorted(len(member_claimed) for member_claimed in claimed), [2, 3])
+
+    def test_connection_lost(self, *args):
+        """Test that a member without its connection samples nothing and rejoins."""
+        first, second = self.member(), self.member()
+        self.tick(first, second)
+        self.tick(first, second)
+
+        first.connection.broken = True
+        # The session died with the connection, its locks are released by the server.
+        self.server.locks = {key: pid for key, pid in self.server.locks.items() if pid != first.connection.pid}
+        self.assertEqual(first.claim(), set(), msg="Expect no studios without the lock connection.")
+        self.assertIsNone(first.connection)
+
+        claimed = self.tick(second, first)
+        self.assert_partition(claimed)
+        self.assertEqual(claimed[0], set(STUDIO_IDS), msg="Expect the remaining member to take over every studio.")
+
+    def test_lost_lock_is_not_sampled(self, *args):
+        """Test that the locks are verified on every tick."""
+        member = self.member()
+        member.claim()
+        del self.server.locks[(STUDIO_LOCKS, STUDIO_IDS["ffgr"])]
+        other = self.member()
+        self.assertEqual(other.claim(), {"ffgr"})
+        self.assertNotIn("ffgr", member.claim())
+
+    def test_standby(self, *args):
+        """Test an active and a standby worker of a single studio."""
+        active, standby = self.member({"ffgr": 3}), self.member({"ffgr": 3})
+        self.assertEqual(self.tick(active, standby), [{"ffgr"}, set()])
+        self.assertEqual(self.tick(active, standby), [{"ffgr"}, set()], msg="Expect the standby to stay idle.")
+
+        active.leave()
+        self.assertEqual(standby.claim(), {"ffgr"})
+        self.assertIn((MEMBER_LOCKS, 1), self.server.locks)
@@ -0,0 +1,160 @@
+# worker_group.py
+"""Module for coordinating identical workers through Postgres advisory locks, every studio is sampled by one worker."""
+
+import os
+import math
+
+import psycopg2
+
+from .. import constants
+from .. import metrics
+from .. import utils_log
+
+# The first key of the advisory locks of the studios, the second key is the studio id.
+STUDIO_LOCKS = 0x76697369  # "visi"
+# The first key of the advisory locks of the members, the second key is the slot of the member.
+MEMBER_LOCKS = STUDIO_LOCKS + 1
+
+
+class WorkerGroup:
+    """
+    A member of a group of identical workers which share the studios.
+
+    Every member holds a session-level advisory lock per studio it samples, on a connection of its own. Each tick
+    a member first claims unlocked studios until it has its share (the studios divided by the members, rounded
+    up), samples its studios, and then releases the studios beyond its share. Releasing at the end of a tick and
+    claiming at the start of the next one hands a studio over without a missed or a duplicated tick.
+
+    When a member dies, Postgres releases its locks with its session and the remaining members claim its studios
+    on their next tick. A member which lost its connection samples nothing until it has joined again.
+
+    Example:
+        group = WorkerGroup(lambda: open_connection(...), {"ffgr": 3, "ffhb": 2})
+        claimed = group.claim()
+        ...  # Sample the claimed studios.
+        group.release_surplus()
+    """
+
+    def __init__(self, connect, studio_ids: dict, log_file_path: str = None):
+        """
+        Args:
+            connect (callable): Opens a new database connection, e.g. a partial of db_connect.open_connection.
+            studio_ids (dict): The studio id per location short title of every studio of the group.
+            log_file_path (str, optional): The file to log the claims and releases to. Defaults to "group.log".
+        """
+        self.connect = connect
+        self.studio_ids = studio_ids
+        self.log_file_path = log_file_path or os.path.join(constants.LOCATION_LOG_DIR, "group.log")
+
+        self.connection = None
+        self.slot = None
+        self.claimed = []  # The claimed location short titles in the order they were claimed.
+
+    def _query(self, query: str, params: tuple = ()) -> list:
+        with self.connection.cursor() as cursor:
+            cursor.execute(query, params)
+            return cursor.fetchall()
+
+    def join(self):
+        """
+        Open the lock connection and take a member slot.
+
+        Raises:
+            psycopg2.Error: If the database is not reachable.
+        """
+        self.connection = self.connect()
+        # Lock calls must not keep a transaction open.
+        self.connection.autocommit = True
+        slot = 0
+        while not self._query("SELECT pg_try_advisory_lock(%s, %s)", (MEMBER_LOCKS, slot))[0][0]:
+            slot += 1
+        self.slot = slot
+        self.claimed = []
+        utils_log.log(f"Joined the worker group in slot {slot}.", self.log_file_path)
+
+    def leave(self):
+        """
+        Close the lock connection, which releases every lock of the member.
+        """
+        if self.connection is not None and not self.connection.closed:
+            self.connection.close()
+        self.connection, self.slot, self.claimed = None, None, []
+        metrics.claimed_studios.set(0)
+
+    @property
+    def members(self) -> int:
+        """The number of members of the group, including this one."""
+        rows = self._query(
+            "SELECT count(*) FROM pg_locks WHERE locktype = 'advisory' AND classid = %s::oid AND objsubid = 2 AND granted "
+            "AND database = (SELECT oid FROM pg_database WHERE datname = current_database())",
+            (MEMBER_LOCKS,)
+        )
+        return max(rows[0][0], 1)
+
+    def share(self, members: int) -> int:
+        """Return how many studios a member samples."""
+        return math.ceil(len(self.studio_ids) / members)
+
+    def _held(self) -> set:
+        """Return the studio ids whose locks the session holds."""
+        rows = self._query(
+            "SELECT objid::bigint FROM pg_locks WHERE locktype = 'advisory' AND classid = %s::oid AND objsubid = 2 "
+            "AND granted AND pid = pg_backend_pid()",
+            (STUDIO_LOCKS,)
+        )
+        return {row[0] for row in rows}
+
+    def claim(self) -> set:
+        """
+        Claim unlocked studios until the member has its share.
+
+        Returns:
+            set: The location short titles the member samples in this tick, empty while the database is unreachable.
+        """
+        try:
+            if self.connection is None or self.connection.closed:
+                self.join()
+
+            # The locks are verified, a lock which was lost with the session must not be sampled.
+            held = self._held()
+            self.claimed = [location_short_title for location_short_title in self.claimed if self.studio_ids[location_short_title] in held]
+
+            members = self.members
+            share = self.share(members)
+            # Members start at different studios, so they don't compete for the same locks.
+            candidates = sorted(self.studio_ids)
+            offset = (self.slot * share) % len(candidates) if candidates else 0
+            for location_short_title in candidates[offset:] + candidates[:offset]:
+                if len(self.claimed) >= share:
+                    break
+                if location_short_title in self.claimed:
+                    continue
+                if self._query("SELECT pg_try_advisory_lock(%s, %s)", (STUDIO_LOCKS, self.studio_ids[location_short_title]))[0][0]:
+                    self.claimed.append(location_short_title)
+                    utils_log.log(f"Claimed {location_short_title} ({len(self.claimed)} of {share} studios, {members} members).", self.log_file_path)
+        except psycopg2.Error as e:
+            utils_log.log(f"Lost the connection of the worker group, sampling no studios until it is back: {e}", self.log_file_path, level=utils_log.ERROR)
+            self.leave()
+            return set()
+
+        metrics.group_members.set(members)
+        metrics.claimed_studios.set(len(self.claimed))
+        return set(self.claimed)
+
+    def release_surplus(self):
+        """
+        Release the most recently claimed studios beyond the member's share, e.g. after another member joined.
+        """
+        if self.connection is None or self.connection.closed:
+            return
+        try:
+            share = self.share(self.members)
+            while len(self.claimed) > share:
+                location_short_title = self.claimed.pop()
+                self._query("SELECT pg_advisory_unlock(%s, %s)", (STUDIO_LOCKS, self.studio_ids[location_short_title]))
+                utils_log.log(f"Released {location_short_title} to the other members ({share} studios per member).", self.log_file_path)
+        except psycopg2.Error as e:
+            utils_log.log(f"Lost the connection of the worker group: {e}", self.log_file_path, level=utils_log.ERROR)
+            self.leave()
+            return
+        metrics.claimed_studios.set(len(self.claimed))
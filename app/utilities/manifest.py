@@ -0,0 +1,215 @@
+"""Index of the daily CSV segments of a data directory."""
+import os
+import json
+from datetime import date, datetime
+
+from . import constants
+
+MANIFEST_FILE_NAME = "manifest.json"
+
+# One manifest per data directory, shared within the process.
+manifests = {}
+
+
+def parse_segment_date(file_name: str):
+    """
+    Parse the date of a visitors segment from its file name.
+
+    Args:
+        file_name (str): The file name, e.g. "visitors-ffgr-17-06-2023-20-00.csv".
+
+    Returns:
+        date: The date of the segment, None if the file is not a visitors segment.
+    """
+    split_file_name = file_name.split("-")
+    if len(split_file_name) != 7 or split_file_name[0] != "visitors" or not file_name.endswith(".csv"):
+        return None
+    try:
+        return date(int(split_file_name[4]), int(split_file_name[3]), int(split_file_name[2]))
+    except ValueError:
+        return None
+
+
+def get_manifest(data_dir: str = None):
+    """
+    Return the manifest of the data directory and load it on first use.
+
+    Args:
+        data_dir (str, optional): The data directory. Defaults to LOCATION_DATA_DIR.
+    """
+    data_dir = data_dir or constants.LOCATION_DATA_DIR
+    manifest = manifests.get(data_dir)
+    if manifest is None:
+        manifest = manifests[data_dir] = SegmentManifest(data_dir)
+    return manifest
+
+
+class SegmentManifest:
+    """
+    Persisted index from date to the CSV segments of that day, with their row counts and time ranges.
+
+    Lookups are dict accesses instead of listing the directory. Segments are added on rotation and rows are counted
+    in memory, the manifest is written to "manifest.json" only when a segment is added and on close. On load the
+    rows of the open (latest) segment are counted from its file, so counts which were not saved before a crash are
+    recovered. On load and when a lookup misses (about once per day) or the segment is gone, the manifest refreshes
+    itself from the directory, only unknown files are read. Lookups never write, the data directory is created by
+    the first segment.
+
+    Example:
+        manifest = get_manifest(data_dir)
+        file_name = manifest.get_segment(date.today())
+        manifest.record(file_name, timestamp)
+    """
+
+    def __init__(self, data_dir: str):
+        """
+        Args:
+            data_dir (str): The data directory containing the segments.
+        """
+        self.data_dir = data_dir
+        self.path = os.path.join(data_dir, MANIFEST_FILE_NAME)
+
+        self.segments = {}  # file_name -> {"date", "rows", "first", "last"}
+        self._dates = {}  # ISO date -> file names in order of creation
+        self._dirty = False  # Changed since it was saved.
+
+        try:
+            with open(self.path, mode="r", encoding="utf-8") as manifest_file:
+                for file_name, segment in json.load(manifest_file)["segments"].items():
+                    self._index(file_name, segment)
+        except (FileNotFoundError, ValueError, KeyError):
+            self.segments, self._dates = {}, {}
+
+        # Pick up segments which were added or removed while the manifest was not maintained.
+        self.refresh()
+        self._recount_open_segment()
+
+    def _recount_open_segment(self):
+        """Count the rows of the latest segment from its file, its rows since the last save are only in the file."""
+        if not self.segments:
+            return
+        file_name = max(self.segments, key=lambda name: (parse_segment_date(name), name))
+        segment = self._read_segment(file_name)
+        if segment != self.segments[file_name]:
+            self.segments[file_name].update(segment)
+            self._dirty = True
+
+    def _index(self, file_name: str, segment: dict):
+        """Add a segment to the in-memory indexes."""
+        self.segments[file_name] = segment
+        self._dates.setdefault(segment["date"], []).append(file_name)
+
+    def get_segment(self, day: date):
+        """
+        Return the latest segment of the day.
+
+        Args:
+            day (date): The day to look for.
+
+        Returns:
+            str: The file name of the segment, None if there is no segment for the day.
+        """
+        file_names = self._dates.get(day.isoformat())
+        if not file_names or not os.path.exists(os.path.join(self.data_dir, file_names[-1])):
+            # The segment might have been added or removed by someone else, e.g. copied in or cleaned up.
+            self.refresh()
+            file_names = self._dates.get(day.isoformat())
+        return file_names[-1] if file_names else None
+
+    def get_segments(self, day: date) -> list:
+        """
+        Return every segment of the day in order of creation.
+        """
+        return list(self._dates.get(day.isoformat(), []))
+
+    def rows(self, file_name: str) -> int:
+        """
+        Return the number of rows written to the segment.
+        """
+        segment = self.segments.get(file_name)
+        return segment["rows"] if segment else 0
+
+    def add_segment(self, file_name: str):
+        """
+        Register a new segment on rotation and persist the manifest.
+
+        Args:
+            file_name (str): The file name of the segment.
+        """
+        if file_name in self.segments:
+            return
+        segment_date = parse_segment_date(file_name) or datetime.now().date()
+        self._index(file_name, {"date": segment_date.isoformat(), "rows": 0, "first": None, "last": None})
+        self._dirty = True
+        self.save()
+
+    def record(self, file_name: str, timestamp: int):
+        """
+        Count a row written to the segment (in memory, persisted on the next rotation or on close).
+
+        Args:
+            file_name (str): The file name of the segment.
+            timestamp (int): The epoch timestamp of the row.
+        """
+        segment = self.segments[file_name]
+        segment["rows"] += 1
+        if segment["first"] is None:
+            segment["first"] = timestamp
+        segment["last"] = timestamp
+        self._dirty = True
+
+    def _read_segment(self, file_name: str) -> dict:
+        """Count the rows and read the time range of a segment file."""
+        rows, first, last = 0, None, None
+        with open(os.path.join(self.data_dir, file_name), mode="r", newline="") as csv_file:
+            next(csv_file, None)  # Header
+            for line in csv_file:
+                timestamp = line.split(",", 1)[0]
+                if not timestamp.strip().isdigit():
+                    continue
+                rows += 1
+                if first is None:
+                    first = int(timestamp)
+                last = int(timestamp)
+        return {"date": parse_segment_date(file_name).isoformat(), "rows": rows, "first": first, "last": last}
+
+    def refresh(self):
+        """
+        Synchronize the manifest with the directory: index unknown segments and drop deleted ones (in memory,
+        persisted on the next save).
+        """
+        # The data directory doesn't exist before the first segment is written.
+        file_names = {file_name for file_name in os.listdir(self.data_dir) if parse_segment_date(file_name)} if os.path.isdir(self.data_dir) else set()
+
+        segments = {file_name: segment for file_name, segment in self.segments.items() if file_name in file_names}
+        for file_name in sorted(file_names - set(segments), key=lambda name: (parse_segment_date(name), name)):
+            segments[file_name] = self._read_segment(file_name)
+
+        if segments != self.segments:
+            self._dirty = True
+        self.segments, self._dates = {}, {}
+        for file_name in sorted(segments, key=lambda name: (parse_segment_date(name), name)):
+            self._index(file_name, segments[file_name])
+
+    def rebuild(self):
+        """
+        Rebuild the manifest from scratch by reading every segment in the directory.
+        """
+        self.segments, self._dates = {}, {}
+        self.refresh()
+        # The saved manifest is replaced even if the directory is empty now.
+        self._dirty = self._dirty or os.path.exists(self.path)
+        self.save()
+
+    def save(self):
+        """
+        Atomically persist the manifest if it changed since it was saved.
+        """
+        if not self._dirty:
+            return
+        tmp_path = f"{self.path}.tmp"
+        os.makedirs(self.data_dir, exist_ok=True)
+        with open(tmp_path, mode="w", encoding="utf-8") as manifest_file:
+            json.dump({"segments": self.segments}, manifest_file)
+        os.replace(tmp_path, self.path)
+        self._dirty = False
@@ -0,0 +1,238 @@
+"""Collector metrics in the Prometheus text format, served by an optional HTTP endpoint."""
+import math
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds of the latency histograms in seconds.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(labels: tuple, extra: tuple = ()) -> str:
+    """Format (name, value) label pairs as {name="value",...}."""
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    """
+    Base class of the metrics: a value per label set, guarded by a lock.
+    """
+
+    type = None
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._values = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(labels: dict) -> tuple:
+        return tuple(sorted(labels.items()))
+
+    def samples(self) -> list:
+        """Return the (name, labels, value) samples of the metric."""
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+    def render(self) -> str:
+        """Render the metric in the Prometheus text format."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for name, labels, value in self.samples():
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """
+    Monotonically increasing count, e.g. of samples or failures.
+    """
+
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        """Increase the count of the label set."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        """Return the count of the label set."""
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(Metric):
+    """
+    Value which goes up and down, either set explicitly or read from a function on every scrape.
+    """
+
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str):
+        super().__init__(name, documentation)
+        self._functions = {}
+
+    def set(self, value: float, **labels):
+        """Set the value of the label set."""
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, function, **labels):
+        """
+        Read the value from the function on every scrape, e.g. the depth of a buffer.
+        """
+        with self._lock:
+            self._functions[self._key(labels)] = function
+
+    def get(self, **labels) -> float:
+        """Return the current value of the label set."""
+        key = self._key(labels)
+        function = self._functions.get(key)
+        return function() if function is not None else self._values.get(key, 0)
+
+    def samples(self) -> list:
+        with self._lock:
+            values = dict(self._values)
+            functions = dict(self._functions)
+        for key, function in functions.items():
+            values[key] = function()
+        return [(self.name, key, value) for key, value in values.items()]
+
+
+class Histogram(Metric):
+    """
+    Distribution of observed values, e.g. latencies, in cumulative buckets.
+    """
+
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        """Count the value in the first bucket it fits into."""
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for index, upper_bound in enumerate(self.buckets):
+                if value <= upper_bound:
+                    state["counts"][index] += 1
+                    break
+            state["sum"] += value
+            state["count"] += 1
+
+    def get(self, **labels) -> dict:
+        """Return the "count" and "sum" of the observations."""
+        state = self._values.get(self._key(labels), {"count": 0, "sum": 0.0})
+        return {"count": state["count"], "sum": state["sum"]}
+
+    def samples(self) -> list:
+        samples = []
+        with self._lock:
+            for key, state in self._values.items():
+                cumulative = 0
+                for upper_bound, count in zip(self.buckets, state["counts"]):
+                    cumulative += count
+                    samples.append((f"{self.name}_bucket", key + (("le", _format_value(upper_bound)),), cumulative))
+                samples.append((f"{self.name}_sum", key, state["sum"]))
+                samples.append((f"{self.name}_count", key, state["count"]))
+        return samples
+
+
+class Registry:
+    """
+    The metrics of the process.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric: Metric) -> Metric:
+        """Add a metric, it is rendered in the order of registration."""
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str) -> Counter:
+        return self.register(Counter(name, documentation))
+
+    def gauge(self, name: str, documentation: str) -> Gauge:
+        return self.register(Gauge(name, documentation))
+
+    def histogram(self, name: str, documentation: str, buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, buckets))
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text format."""
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+registry = Registry()
+
+fetch_seconds = registry.histogram("collector_fetch_seconds", "Latency of fetching the studio data from the API.")
+segment_write_seconds = registry.histogram("collector_segment_write_seconds", "Time to write the samples of a tick to the segment files.")
+db_write_seconds = registry.histogram("collector_db_write_seconds", "Time to insert and commit a batch of rows.")
+tick_lateness_seconds = registry.histogram("collector_tick_lateness_seconds", "How late a tick started after its scheduled boundary.")
+
+samples_total = registry.counter("collector_samples_total", "Samples collected per studio.")
+fetch_failures_total = registry.counter("collector_fetch_failures_total", "Ticks whose API request failed after all retries.")
+db_failures_total = registry.counter("collector_db_failures_total", "Batches which could not be written to the database.")
+retries_total = registry.counter("collector_http_retries_total", "Retried API requests.")
+payload_drift_total = registry.counter("collector_payload_drift_total", "Changes of the API payload: reordered, added or removed studios, changed fields, invalid records.")
+skipped_ticks_total = registry.counter("collector_skipped_ticks_total", "Boundaries skipped because a tick overran the interval.")
+duplicate_rows_total = registry.counter("collector_duplicate_rows_total", "Rows which were skipped because their timestamp was already in the table, e.g. replays.")
+
+last_sample_timestamp_seconds = registry.gauge("collector_last_sample_timestamp_seconds", "Unix time of the last successful sample per studio.")
+poll_interval_seconds = registry.gauge("collector_poll_interval_seconds", "The current polling interval, adaptive with ADAPTIVE_POLLING.")
+pending_rows = registry.gauge("collector_pending_rows", "Rows buffered or spooled which are not written to the database yet.")
+group_members = registry.gauge("collector_group_members", "Members of the worker group, with WORKER_GROUP.")
+claimed_studios = registry.gauge("collector_claimed_studios", "Studios this member of the worker group samples, with WORKER_GROUP.")
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """
+    Serves the registry on /metrics.
+    """
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes are not logged.
+        pass
+
+
+def start_server(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """
+    Serve the metrics on http://<host>:<port>/metrics from a background thread.
+
+    Args:
+        port (int): The port, 0 picks a free one.
+        host (str, optional): The interface to listen on. Defaults to every interface.
+
+    Returns:
+        ThreadingHTTPServer: The server, call shutdown() to stop it.
+    """
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
@@ -0,0 +1,262 @@
+"""Opening-hours calendar of the studios: precomputed open intervals with public holidays and exceptions."""
+import json
+import bisect
+from datetime import date, datetime, timedelta
+
+from . import constants
+from . import utils
+from . import utils_log
+
+
+def easter_sunday(year: int) -> date:
+    """
+    Return the date of Easter Sunday (anonymous Gregorian algorithm).
+    """
+    a, b, c = year % 19, year // 100, year % 100
+    d, e = b // 4, b % 4
+    g = (b - (b + 8) // 25 + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = c // 4, c % 4
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def public_holidays(year: int) -> dict:
+    """
+    Return the public holidays of Hesse, where the studios are.
+
+    Returns:
+        dict: The name of the holiday per date.
+    """
+    easter = easter_sunday(year)
+    return {
+        date(year, 1, 1): "Neujahr",
+        easter - timedelta(days=2): "Karfreitag",
+        easter + timedelta(days=1): "Ostermontag",
+        date(year, 5, 1): "Tag der Arbeit",
+        easter + timedelta(days=39): "Christi Himmelfahrt",
+        easter + timedelta(days=50): "Pfingstmontag",
+        easter + timedelta(days=60): "Fronleichnam",
+        date(year, 10, 3): "Tag der Deutschen Einheit",
+        date(year, 12, 25): "1. Weihnachtstag",
+        date(year, 12, 26): "2. Weihnachtstag",
+    }
+
+
+def parse_time(value) -> int:
+    """
+    Convert an opening or closing time to minutes after midnight.
+
+    Args:
+        value: A full hour (8), a fraction of an hour (8.5) or "HH:MM" ("08:30"). 24 is the end of the day.
+
+    Returns:
+        int: The minutes after midnight, e.g. 510 for "08:30".
+
+    Raises:
+        ValueError: If the value is not a time.
+    """
+    if isinstance(value, str):
+        hours, _, minutes = value.partition(":")
+        minutes = int(hours) * 60 + int(minutes or 0)
+    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+        minutes = round(value * 60)
+    else:
+        raise ValueError(f"Invalid time: {value!r}.")
+    if not 0 <= minutes <= 24 * 60:
+        raise ValueError(f"Invalid time: {value!r}.")
+    return minutes
+
+
+def parse_hours(hours) -> list:
+    """
+    Convert the hours of a day to (open, close) minutes after midnight.
+
+    Args:
+        hours: {"open": 8, "close": 23}, a list of those for split days, or None if closed.
+
+    Returns:
+        list: The (open, close) minutes. A close before the open is on the following day.
+    """
+    if hours is None:
+        return []
+    if isinstance(hours, dict):
+        hours = [hours]
+    intervals = []
+    for interval in hours:
+        open_minutes, close_minutes = parse_time(interval["open"]), parse_time(interval["close"])
+        if close_minutes == open_minutes:
+            continue
+        if close_minutes < open_minutes:
+            close_minutes += 24 * 60
+        intervals.append((open_minutes, close_minutes))
+    return intervals
+
+
+def load_exceptions(file_path: str = None) -> dict:
+    """
+    Load the exceptions to the opening hours, e.g. special closures or shorter hours on Christmas Eve.
+
+    The file maps a location short title (or "all" for every studio) to the hours per date, null if closed:
+    {"all": {"2023-12-24": {"open": "08:00", "close": "14:00"}}, "ffgr": {"2023-08-14": null}}
+
+    Args:
+        file_path (str, optional): The JSON file. Defaults to OPENING_HOURS_FILE.
+
+    Returns:
+        dict: The hours per date per location short title, empty if there is no (valid) file.
+    """
+    file_path = file_path or constants.OPENING_HOURS_FILE
+    try:
+        with open(file_path, mode="r", encoding="utf-8") as exceptions_file:
+            content = json.load(exceptions_file)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        utils_log.log(f"Could not read the opening hours exceptions {file_path}: {e}", level=utils_log.ERROR)
+        return {}
+
+    exceptions = {}
+    for location_short_title, days in content.items():
+        try:
+            exceptions[location_short_title.lower()] = {
+                date.fromisoformat(day): parse_hours(hours) for day, hours in days.items()
+            }
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            utils_log.log(f"Ignoring the invalid opening hours exceptions of {location_short_title}: {e}", level=utils_log.ERROR)
+    return exceptions
+
+
+def get_exceptions(exceptions: dict, location_short_title: str) -> dict:
+    """
+    Return the exceptions of a studio, its own override the ones of every studio.
+    """
+    return {**exceptions.get(constants.ALL_STUDIOS, {}), **exceptions.get(location_short_title, {})}
+
+
+class OpeningCalendar:
+    """
+    The open intervals of a studio, precomputed for the coming CALENDAR_DAYS days.
+
+    The hours of a day are taken from the exceptions, else the "holiday" hours on public holidays (only if the
+    studio defines them), else the "week_day" or "week_end" hours. Adjacent intervals are merged, a studio which is
+    open around the clock has a single interval. The lookups are binary searches over the sorted intervals, the
+    intervals are precomputed again once a lookup gets close to the end of the precomputed days.
+
+    Example:
+        calendar = OpeningCalendar(constants.STUDIO_MAP["ffgr"]["opening_hours"])
+        if not calendar.is_open(now):
+            sleep_until = calendar.next_opening(now)
+    """
+
+    def __init__(self, opening_hours: dict, exceptions: dict = None, holidays: bool = None, days: int = None):
+        """
+        Args:
+            opening_hours (dict): The studio's opening hours, e.g. {"week_day": {"open": 8, "close": 23}, ...}.
+            exceptions (dict, optional): The (open, close) minutes per date which replace the regular hours.
+            holidays (bool, optional): Apply the holiday hours on public holidays. Defaults to PUBLIC_HOLIDAYS.
+            days (int, optional): How many days are precomputed. Defaults to CALENDAR_DAYS.
+        """
+        self.week_day = parse_hours(opening_hours["week_day"])
+        self.week_end = parse_hours(opening_hours["week_end"])
+        # None without "holiday" hours, the regular hours also apply on public holidays then.
+        self.holiday = parse_hours(opening_hours["holiday"]) if "holiday" in opening_hours else None
+        self.exceptions = exceptions or {}
+        self.holidays = constants.PUBLIC_HOLIDAYS if holidays is None else holidays
+        self.days = days or constants.CALENDAR_DAYS
+
+        self.first_day = None
+        self._start = self._end = None  # The precomputed epoch range.
+        self._opens, self._closes = [], []
+        self._holidays = {}  # year -> public holidays
+
+    def hours(self, day: date) -> list:
+        """
+        Return the (open, close) minutes after midnight of a day.
+        """
+        if day in self.exceptions:
+            return self.exceptions[day]
+        if self.holidays and self.holiday is not None:
+            if day.year not in self._holidays:
+                self._holidays[day.year] = public_holidays(day.year)
+            if day in self._holidays[day.year]:
+                return self.holiday
+        return self.week_day if utils.check_is_week_day(day.weekday()) else self.week_end
+
+    def build(self, first_day: date):
+        """
+        Precompute the open intervals from the day before first_day (its hours can last past midnight).
+        """
+        opens, closes = [], []
+        for offset in range(-1, self.days + 1):
+            day = first_day + timedelta(days=offset)
+            midnight = datetime.combine(day, datetime.min.time())
+            for open_minutes, close_minutes in sorted(self.hours(day)):
+                # Local wall-clock times, the epoch timestamps account for the daylight saving time changes.
+                start = (midnight + timedelta(minutes=open_minutes)).timestamp()
+                end = (midnight + timedelta(minutes=close_minutes)).timestamp()
+                if closes and start <= closes[-1]:
+                    closes[-1] = max(closes[-1], end)
+                else:
+                    opens.append(start)
+                    closes.append(end)
+
+        self.first_day = first_day
+        self._start = datetime.combine(first_day, datetime.min.time()).timestamp()
+        self._end = datetime.combine(first_day + timedelta(days=self.days), datetime.min.time()).timestamp()
+        self._opens, self._closes = opens, closes
+
+    def _lookup(self, now: datetime) -> tuple:
+        """
+        Return the epoch timestamp of now and the index of the last interval opened at or before it.
+        """
+        timestamp = now.timestamp()
+        # At least a day of intervals is ahead of the lookup.
+        if self._start is None or not self._start <= timestamp < self._end - 24 * 60 * 60:
+            self.build(datetime.fromtimestamp(timestamp).date())
+        return timestamp, bisect.bisect_right(self._opens, timestamp) - 1
+
+    def is_open(self, now: datetime) -> bool:
+        """
+        Check if the studio is open at the given time.
+        """
+        timestamp, index = self._lookup(now)
+        return index >= 0 and timestamp < self._closes[index]
+
+    def next_opening(self, now: datetime):
+        """
+        Return the next time the studio is open.
+
+        Returns:
+            datetime: The given time if the studio is open, else the next opening. None if the studio doesn't
+            open within the precomputed days.
+        """
+        timestamp, index = self._lookup(now)
+        if index >= 0 and timestamp < self._closes[index]:
+            return now
+        if index + 1 < len(self._opens):
+            return datetime.fromtimestamp(self._opens[index + 1])
+        return None
+
+    def next_closing(self, now: datetime):
+        """
+        Return the time the current open interval ends, None if the studio is closed.
+        """
+        timestamp, index = self._lookup(now)
+        if index >= 0 and timestamp < self._closes[index]:
+            return datetime.fromtimestamp(self._closes[index])
+        return None
+
+
+def next_opening(calendars, now: datetime):
+    """
+    Return the next time any of the studios is open, None if none opens within the precomputed days.
+
+    Args:
+        calendars: The OpeningCalendar of every studio.
+        now (datetime): The current date and time.
+    """
+    openings = [opening for opening in (calendar.next_opening(now) for calendar in calendars) if opening is not None]
+    return min(openings, default=None)
@@ -0,0 +1,241 @@
+"""Per-stage timing of the ticks and on-demand profiling of the main loop."""
+import os
+import time
+import pstats
+import cProfile
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+
+from . import constants
+from . import utils_log
+
+# The stages of a tick, in the order they run.
+STAGES = ("claim", "fetch", "decode", "studio_lookup", "file_lookup", "segment_write", "db_write", "log")
+
+# The timer of the running tick, copied into the threads of asyncio.to_thread.
+_current_timer = contextvars.ContextVar("stage_timer", default=None)
+
+
+class StageTimer:
+    """
+    Sums the monotonic durations of the stages of a tick.
+
+    A stage can run several times per tick (e.g. once per studio or retry) and in several threads at once.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stopped = None
+        self.stages = {}
+        self.fields = {}  # Additional fields of the record, e.g. the number of samples.
+        self._lock = threading.Lock()
+
+    def add(self, stage_name: str, seconds: float):
+        """Add the duration of a stage."""
+        with self._lock:
+            self.stages[stage_name] = self.stages.get(stage_name, 0.0) + seconds
+
+    def stop(self):
+        """Stop the total time of the tick."""
+        self.stopped = time.perf_counter()
+
+    def to_record(self, now: datetime) -> dict:
+        """
+        Return the structured record of the tick.
+
+        Args:
+            now (datetime): The time the tick started.
+
+        Returns:
+            dict: The "timestamp", the wall "total_ms" of the tick and the "stages_ms" in the order of STAGES.
+            Stages which run concurrently (the file and database writes) overlap, their sum can exceed the total.
+        """
+        with self._lock:
+            stages = dict(self.stages)
+        ordered = [name for name in STAGES if name in stages] + sorted(name for name in stages if name not in STAGES)
+        return {
+            "timestamp": now.isoformat(timespec="seconds"),
+            "total_ms": round(((self.stopped or time.perf_counter()) - self.started) * 1000, 3),
+            "stages_ms": {name: round(stages[name] * 1000, 3) for name in ordered},
+            **self.fields,
+        }
+
+
+@contextmanager
+def stage(stage_name: str):
+    """
+    Time a stage of the running tick. Outside of a tick (e.g. in management commands) this does nothing.
+
+    Example:
+        with profiling.stage("decode"):
+            payload = response.json()
+    """
+    timer = _current_timer.get()
+    if timer is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.add(stage_name, time.perf_counter() - start)
+
+
+class Profiler:
+    """
+    Captures cProfile statistics of the next N ticks once requested, e.g. by a signal.
+
+    The event loop thread is profiled for the whole tick, functions handed to a worker thread are profiled when
+    they are wrapped with profiled(). Afterwards the merged statistics are written to "profile-<time>.prof"
+    (for pstats or snakeviz) and a summary sorted by cumulative time to "profile-<time>.txt".
+    """
+
+    def __init__(self, output_dir: str = None):
+        """
+        Args:
+            output_dir (str, optional): The directory of the profiles. Defaults to the log directory.
+        """
+        self.output_dir = output_dir
+        self._requested = 0
+        self._ticks = 0
+        self._remaining = 0
+        self._profiles = []
+        self._lock = threading.Lock()
+
+    def request(self, ticks: int):
+        """
+        Profile the next ticks. Only sets a flag, safe to call from a signal handler.
+        """
+        self._requested = max(int(ticks), 1)
+
+    @property
+    def active(self) -> bool:
+        return self._remaining > 0
+
+    def begin_tick(self):
+        """
+        Start profiling the tick if profiling is requested or in progress.
+
+        Returns:
+            cProfile.Profile: The profile of the tick, None if the tick is not profiled.
+        """
+        if not self.active and self._requested:
+            self._remaining, self._requested = self._requested, 0
+            self._ticks = 0
+            self._profiles = []
+        if not self.active:
+            return None
+        return self._enable()
+
+    def end_tick(self, profile):
+        """
+        Stop profiling the tick and write the profile once the requested ticks are captured.
+
+        Args:
+            profile (cProfile.Profile): The profile returned by begin_tick.
+
+        Returns:
+            str: The path of the written profile, None while more ticks are captured.
+        """
+        if not self.active:
+            return None
+        if profile is not None:
+            profile.disable()
+        self._ticks += 1
+        self._remaining -= 1
+        if self._remaining > 0:
+            return None
+        try:
+            return self.dump()
+        except OSError as e:
+            utils_log.log(f"Could not write the profile: {e}", level=utils_log.ERROR)
+            return None
+
+    def profiled(self, function):
+        """
+        Wrap a function which runs in a worker thread, so it is profiled while a tick is profiled.
+        """
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            profile = self._enable() if self.active else None
+            try:
+                return function(*args, **kwargs)
+            finally:
+                if profile is not None:
+                    profile.disable()
+        return wrapper
+
+    def _enable(self):
+        """Enable a new profile in the current thread."""
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Python 3.12+ profiles every thread with a single profiler, the one of the tick covers this thread.
+            return None
+        with self._lock:
+            self._profiles.append(profile)
+        return profile
+
+    def dump(self) -> str:
+        """
+        Write the merged statistics of the captured ticks.
+
+        Returns:
+            str: The path of the ".prof" file, None if nothing was captured.
+        """
+        with self._lock:
+            profiles, self._profiles = self._profiles, []
+        if not profiles:
+            # E.g. the process already runs under another profiler.
+            utils_log.log("Could not profile the ticks, another profiler is active.", level=utils_log.WARNING)
+            return None
+        output_dir = self.output_dir or constants.LOCATION_LOG_DIR
+        os.makedirs(output_dir, exist_ok=True)
+        file_path = os.path.join(output_dir, f"profile-{datetime.now().strftime('%Y%m%d-%H%M%S')}.prof")
+
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        stats.dump_stats(file_path)
+        with open(f"{file_path[:-len('.prof')]}.txt", mode="w", encoding="utf-8") as summary:
+            summary.write(f"Profile of {self._ticks} ticks.\n")
+            pstats.Stats(file_path, stream=summary).sort_stats("cumulative").print_stats(40)
+
+        utils_log.log(f"Wrote the profile of {self._ticks} ticks to {file_path}.")
+        return file_path
+
+
+# The profiler of the process, requested by PROFILE_ON_START or SIGUSR1.
+profiler = Profiler()
+
+
+@contextmanager
+def tick(now: datetime, file_path: str = None):
+    """
+    Time the stages of a tick and profile it if profiling is requested.
+
+    The record of the tick is written as a JSON line to "stages.log" once the tick is over, e.g.:
+    {"timestamp":"2023-06-05T10:05:00","total_ms":412.3,"stages_ms":{"fetch":380.1,"decode":2.4,...}}
+
+    Args:
+        now (datetime): The time the tick started.
+        file_path (str, optional): The file of the records. Defaults to "stages.log" in the log directory.
+
+    Yields:
+        StageTimer: The timer of the tick.
+    """
+    timer = StageTimer()
+    token = _current_timer.set(timer)
+    profile = profiler.begin_tick()
+    try:
+        yield timer
+    finally:
+        timer.stop()
+        profiler.end_tick(profile)
+        _current_timer.reset(token)
+        if constants.STAGE_TIMINGS:
+            utils_log.record(timer.to_record(now), file_path or os.path.join(constants.LOCATION_LOG_DIR, "stages.log"))
@@ -0,0 +1,150 @@
+"""Rollup tables of the visitors tables, maintained on ingest."""
+import os
+from datetime import datetime, timedelta
+
+from psycopg2.extras import execute_values
+
+from . import constants
+from . import utils_log
+
+# Rollup table suffix, bucket length in seconds and the SQL expression of the bucket (used to rebuild).
+ROLLUPS = (
+    ("5min", 5 * 60, "date_bin('5 minutes', timestamp, TIMESTAMP '2000-01-01')"),
+    ("hourly", 60 * 60, "date_trunc('hour', timestamp)"),
+    ("daily", 24 * 60 * 60, "date_trunc('day', timestamp)"),
+)
+
+COLUMNS = "(bucket TIMESTAMP PRIMARY KEY, sample_count INT NOT NULL, load_sum BIGINT NOT NULL, load_min INT, load_max INT)"
+
+
+def rollup_table_name(table_name: str, suffix: str) -> str:
+    """
+    Return the name of a rollup table, e.g. "visitors_ffgr_hourly".
+    """
+    return f"{table_name}_{suffix}"
+
+
+def create_rollup_tables(connection, table_name: str) -> bool:
+    """
+    Create the rollup tables of a visitors table if they don't exist.
+
+    Args:
+        connection (psycopg2.extensions.connection): The database connection.
+        table_name (str): The name of the visitors table, e.g. "visitors_ffgr".
+
+    Returns:
+        bool: True if a rollup table was created, its history has to be rebuilt.
+    """
+    created = False
+    with connection.cursor() as cursor:
+        for suffix, _, _ in ROLLUPS:
+            rollup_table = rollup_table_name(table_name, suffix)
+            cursor.execute("SELECT to_regclass(%s)", (rollup_table,))
+            if cursor.fetchone()[0] is None:
+                cursor.execute(f"CREATE TABLE {rollup_table} {COLUMNS}")
+                created = True
+    connection.commit()
+    return created
+
+
+def bucket_start(timestamp, seconds: int) -> datetime:
+    """
+    Return the start of the bucket of the timestamp.
+
+    Args:
+        timestamp (datetime or str): The timestamp, as a datetime or formatted as "%Y-%m-%d %H:%M" like the rows.
+        seconds (int): The length of the bucket, a divisor of a day.
+    """
+    if isinstance(timestamp, str):
+        timestamp = datetime.strptime(timestamp, "%Y-%m-%d %H:%M")
+    seconds_of_day = timestamp.hour * 3600 + timestamp.minute * 60 + timestamp.second
+    return timestamp.replace(microsecond=0) - timedelta(seconds=seconds_of_day % seconds)
+
+
+def aggregate(rows: list, seconds: int) -> list:
+    """
+    Aggregate raw rows into buckets.
+
+    Args:
+        rows (list): The (timestamp, visitor_count) rows. Rows without a visitor count are not counted.
+        seconds (int): The length of a bucket.
+
+    Returns:
+        list: The (bucket, count, sum, min, max) tuples ordered by bucket.
+    """
+    buckets = {}
+    for timestamp, visitor_count in rows:
+        if visitor_count is None:
+            continue
+        bucket = bucket_start(timestamp, seconds)
+        aggregate_row = buckets.get(bucket)
+        if aggregate_row is None:
+            buckets[bucket] = [1, visitor_count, visitor_count, visitor_count]
+        else:
+            aggregate_row[0] += 1
+            aggregate_row[1] += visitor_count
+            aggregate_row[2] = min(aggregate_row[2], visitor_count)
+            aggregate_row[3] = max(aggregate_row[3], visitor_count)
+    # Ordered, so concurrent writers lock the bucket rows in the same order.
+    return [(bucket, *buckets[bucket]) for bucket in sorted(buckets)]
+
+
+def upsert(cursor, table_name: str, rows: list):
+    """
+    Add raw rows to the rollup tables, inside the transaction which inserts them into the visitors table.
+
+    The rows are aggregated per bucket first, so every bucket is upserted once per batch.
+
+    Args:
+        cursor (psycopg2.extensions.cursor): The cursor of the insert transaction.
+        table_name (str): The name of the visitors table.
+        rows (list): The inserted (timestamp, visitor_count) rows.
+    """
+    for suffix, seconds, _ in ROLLUPS:
+        buckets = aggregate(rows, seconds)
+        if not buckets:
+            continue
+        execute_values(
+            cursor,
+            f"INSERT INTO {rollup_table_name(table_name, suffix)} AS rollup (bucket, sample_count, load_sum, load_min, load_max) "
+            "VALUES %s ON CONFLICT (bucket) DO UPDATE SET "
+            "sample_count = rollup.sample_count + EXCLUDED.sample_count, "
+            "load_sum = rollup.load_sum + EXCLUDED.load_sum, "
+            "load_min = LEAST(rollup.load_min, EXCLUDED.load_min), "
+            "load_max = GREATEST(rollup.load_max, EXCLUDED.load_max)",
+            buckets,
+            page_size=len(buckets)
+        )
+
+
+def rebuild(connection, table_name: str):
+    """
+    Rebuild the rollup tables from the whole history of the visitors table.
+
+    Runs in a single transaction which blocks inserts into the visitors table, no row is missed or counted twice.
+
+    Args:
+        connection (psycopg2.extensions.connection): The database connection.
+        table_name (str): The name of the visitors table.
+
+    Raises:
+        psycopg2.Error: If the rollups could not be rebuilt. The transaction is rolled back.
+    """
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f"LOCK TABLE {table_name} IN SHARE MODE")
+            for suffix, _, bucket_expression in ROLLUPS:
+                rollup_table = rollup_table_name(table_name, suffix)
+                cursor.execute(f"CREATE TABLE IF NOT EXISTS {rollup_table} {COLUMNS}")
+                cursor.execute(f"TRUNCATE {rollup_table}")
+                cursor.execute(
+                    f"INSERT INTO {rollup_table} (bucket, sample_count, load_sum, load_min, load_max) "
+                    f"SELECT {bucket_expression}, COUNT(visitor_count), SUM(visitor_count), MIN(visitor_count), MAX(visitor_count) "
+                    f"FROM {table_name} WHERE visitor_count IS NOT NULL GROUP BY 1"
+                )
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+
+    utils_log.log(f"Rebuilt the rollup tables of {table_name}.", os.path.join(constants.LOCATION_LOG_DIR, "db.log"))
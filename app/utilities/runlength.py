@@ -0,0 +1,109 @@
+"""Change-only storage of the samples: a row per change of the load, the regular series is reconstructed on read."""
+import numpy as np
+
+from . import constants
+
+
+class ChangeFilter:
+    """
+    Decides which samples are stored when only the changes of the load are stored.
+
+    A sample is stored when the load of its studio changed since the last stored row, when the last stored row is
+    heartbeat seconds old, or when it is the first sample of the studio. A stored row stands for every sample until
+    the next row, at most heartbeat seconds. Where samples are missing (closed hours, failed requests, skipped ticks)
+    a row without a load is stored at the first missing boundary, so the previous load doesn't cover the gap. A gap
+    row which would share its minute with the sample is left out, the database stores a row per minute and would
+    keep the gap row instead of the sample.
+
+    Example:
+        changes = ChangeFilter(heartbeat=3600)
+        for timestamp, visitor_count in changes.filter("ffgr", now.timestamp(), 59, interval=300):
+            ...
+    """
+
+    def __init__(self, heartbeat: float = None, resolution: float = 60):
+        """
+        Args:
+            heartbeat (float, optional): The longest time between two stored rows of a studio in seconds.
+                Defaults to STORAGE_HEARTBEAT.
+            resolution (float, optional): The resolution of the stored timestamps in seconds. Defaults to a minute.
+        """
+        self.heartbeat = heartbeat if heartbeat is not None else constants.STORAGE_HEARTBEAT
+        self.resolution = resolution
+        self._last = {}  # key -> (timestamp, load) of the last stored row.
+        self._expected = {}  # key -> (timestamp, interval) of the next sample.
+
+        # Statistics.
+        self.observed = 0
+        self.stored = 0
+
+    def filter(self, key, timestamp: float, load, interval: float) -> list:
+        """
+        Return the rows to store for a sample.
+
+        Args:
+            key: The studio, e.g. its location short title.
+            timestamp (float): The epoch timestamp of the sample.
+            load (int): The current load, None if unknown.
+            interval (float): The seconds until the next sample.
+
+        Returns:
+            list: The (timestamp, load) rows to store in chronological order, empty if the load didn't change.
+        """
+        rows = []
+        last = self._last.get(key)
+        expected = self._expected.get(key)
+        if (last is not None and expected is not None and timestamp - expected[0] > expected[1] / 2 and last[1] is not None
+                and expected[0] // self.resolution != timestamp // self.resolution):
+            # The samples after the expected one are missing, end the run of the last stored load.
+            last = (expected[0], None)
+            rows.append(last)
+        # Half an interval of slack, the ticks start slightly after their boundary.
+        if last is None or load != last[1] or timestamp - last[0] >= self.heartbeat - interval / 2:
+            last = (timestamp, load)
+            rows.append(last)
+
+        self._last[key] = last
+        self._expected[key] = (timestamp + interval, interval)
+        self.observed += 1
+        self.stored += len(rows)
+        return rows
+
+
+def expand(timestamps, visitor_counts, step: float = None, heartbeat: float = None, end: float = None) -> tuple:
+    """
+    Reconstruct the regular series of samples from change-only rows.
+
+    Every row is repeated every step seconds until the next row, at most heartbeat seconds. Rows without a load
+    (missing loads and the ends of runs) are reconstructed as gaps.
+
+    Args:
+        timestamps: The timestamps of the stored rows in seconds, sorted and unique.
+        visitor_counts: The loads of the stored rows, negative or NaN if missing.
+        step (float, optional): The interval of the samples in seconds. Defaults to REQUEST_DENSITY.
+        heartbeat (float, optional): The longest time a row stands for in seconds. Defaults to STORAGE_HEARTBEAT.
+        end (float, optional): The timestamp to stop before, e.g. the current time for the ongoing run of the
+            last row. Defaults to the heartbeat after the last row.
+
+    Returns:
+        tuple: The timestamps and visitor counts as NumPy arrays in the dtypes of the input, in chronological order.
+    """
+    step = int(step or constants.REQUEST_DENSITY)
+    heartbeat = int(heartbeat or constants.STORAGE_HEARTBEAT)
+    timestamps = np.asarray(timestamps)
+    visitor_counts = np.asarray(visitor_counts)
+    if len(timestamps) == 0:
+        return timestamps, visitor_counts
+
+    hold_until = timestamps + heartbeat
+    hold_until[:-1] = np.minimum(hold_until[:-1], timestamps[1:])
+    if end is not None:
+        hold_until[-1] = min(hold_until[-1], end)
+
+    loads = visitor_counts.astype(np.float64)
+    missing = np.isnan(loads) | (loads < 0)
+    # Ceiling division, a row stands for at least its own sample.
+    counts = np.where(missing, 0, np.maximum(-((timestamps - hold_until) // step), 0)).astype(np.int64)
+
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(timestamps, counts) + offsets * step, np.repeat(visitor_counts, counts)
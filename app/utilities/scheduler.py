@@ -0,0 +1,172 @@
+"""Scheduling of the sampling ticks on wall-clock aligned boundaries."""
+import os
+import time
+import asyncio
+from collections import namedtuple
+from datetime import datetime
+
+from . import constants
+from . import metrics
+from . import utils_log
+
+# Measurements of a single tick.
+#   scheduled: The wall-clock boundary (epoch seconds) the tick belongs to.
+#   drift: Seconds between the boundary and the wall-clock time the tick started.
+#   lateness: Seconds the event loop woke up after its monotonic deadline.
+#   skipped: Boundaries skipped because the previous tick overran the interval.
+TickStats = namedtuple("TickStats", ["scheduled", "drift", "lateness", "skipped"])
+
+
+def next_aligned_tick(timestamp: float, interval: float) -> float:
+    """
+    Return the first wall-clock boundary after the timestamp which is a multiple of the interval.
+
+    Args:
+        timestamp (float): The epoch timestamp in seconds.
+        interval (float): The interval in seconds, e.g. 300 for the 5-minute grid.
+
+    Returns:
+        float: The epoch timestamp of the next boundary, e.g. 10:05:00 for 10:02:13.
+
+    Note:
+        Boundaries are multiples of the interval since the epoch. For intervals dividing an hour
+        they coincide with the local grid because Europe/Berlin is offset by whole hours.
+    """
+    return (timestamp // interval + 1) * interval
+
+
+async def sleep_until(timestamp: float) -> float:
+    """
+    Sleep until the given wall-clock timestamp.
+
+    Args:
+        timestamp (float): The epoch timestamp to wake up at.
+
+    Returns:
+        float: The monotonic deadline the sleep was aiming for.
+    """
+    deadline = time.monotonic() + max(0.0, timestamp - time.time())
+    await asyncio.sleep(max(0.0, deadline - time.monotonic()))
+    return deadline
+
+
+class AdaptiveInterval:
+    """
+    Chooses the polling interval from the rate of change of the recent samples.
+
+    The interval is the time in which the load is expected to change by target_change visitors: short while the
+    load moves quickly (e.g. the evening peak), long while it is flat (e.g. at night). The rate is the fastest
+    change of any studio since its previous sample, smoothed over the recent ticks. The interval is rounded down
+    to a value dividing an hour, so the ticks stay on a readable wall-clock grid.
+
+    Example:
+        poller = AdaptiveInterval(floor=60, ceiling=900)
+        interval = poller.observe(now, {"ffgr": 59})
+    """
+
+    # Intervals dividing an hour, the samples of all of them line up at the full hour.
+    GRID = (60, 120, 180, 240, 300, 360, 600, 720, 900, 1200, 1800, 3600)
+
+    def __init__(self, floor: float = None, ceiling: float = None, target_change: float = None, initial: float = None, smoothing: float = 0.5):
+        """
+        Args:
+            floor (float, optional): The shortest interval in seconds. Defaults to REQUEST_DENSITY_FLOOR.
+            ceiling (float, optional): The longest interval in seconds. Defaults to REQUEST_DENSITY_CEILING.
+            target_change (float, optional): The change of the load per interval in visitors.
+                Defaults to ADAPTIVE_TARGET_CHANGE.
+            initial (float, optional): The interval until the rate is known. Defaults to REQUEST_DENSITY.
+            smoothing (float, optional): Weight of the latest rate in the moving average, 1 uses only the latest.
+                Defaults to 0.5.
+        """
+        self.floor = floor if floor is not None else constants.REQUEST_DENSITY_FLOOR
+        self.ceiling = max(ceiling if ceiling is not None else constants.REQUEST_DENSITY_CEILING, self.floor)
+        self.target_change = target_change if target_change is not None else constants.ADAPTIVE_TARGET_CHANGE
+        self.smoothing = smoothing
+        self.steps = sorted({self.floor, self.ceiling} | {step for step in self.GRID if self.floor < step < self.ceiling})
+        self.interval = self._clamp(initial if initial is not None else constants.REQUEST_DENSITY)
+
+        self.rate = None  # Visitors per minute.
+        self._previous = {}  # key -> (epoch seconds, load) of the previous sample.
+
+    def _clamp(self, seconds: float) -> float:
+        """Round down to the longest step which is not longer than the seconds."""
+        return max([step for step in self.steps if step <= seconds], default=self.floor)
+
+    def observe(self, now: datetime, loads: dict) -> float:
+        """
+        Update the rate with the samples of a tick and choose the interval until the next tick.
+
+        Args:
+            now (datetime): The time of the tick.
+            loads (dict): The load per studio, None if unknown.
+
+        Returns:
+            float: The interval in seconds.
+        """
+        timestamp = now.timestamp()
+        rates = []
+        for key, load in loads.items():
+            if load is None:
+                continue
+            previous = self._previous.get(key)
+            # A sample from before a closed period says nothing about the current rate.
+            if previous is not None and 0 < timestamp - previous[0] <= 2 * self.ceiling:
+                rates.append(abs(load - previous[1]) / ((timestamp - previous[0]) / 60))
+            self._previous[key] = (timestamp, load)
+
+        if rates:
+            rate = max(rates)
+            self.rate = rate if self.rate is None else self.smoothing * rate + (1 - self.smoothing) * self.rate
+            self.interval = self._clamp(self.target_change / self.rate * 60) if self.rate > 0 else self.ceiling
+        metrics.poll_interval_seconds.set(self.interval)
+        return self.interval
+
+
+async def run_aligned(tick, interval: float, closed_sleep_seconds, log_file_path: str = None, next_interval=None):
+    """
+    Run the tick on every wall-clock aligned boundary of the interval.
+
+    Unlike sleeping for the interval after every tick, the duration of the tick does not push the
+    following ticks off the grid. A tick which overruns the interval skips the missed boundaries.
+
+    Args:
+        tick (coroutine function): Called with the datetime the tick started and its TickStats.
+        interval (float): The interval between ticks in seconds.
+        closed_sleep_seconds (callable): Called with the datetime of a boundary. Returns 0 when the tick
+            should run, otherwise the number of seconds until the studios open again.
+        log_file_path (str, optional): The file to log the tick measurements to. Defaults to "scheduler.log".
+        next_interval (callable, optional): Called after every tick, returns the interval until the next tick,
+            e.g. of an AdaptiveInterval. Defaults to the fixed interval.
+    """
+    if log_file_path is None:
+        log_file_path = os.path.join(constants.LOCATION_LOG_DIR, "scheduler.log")
+
+    scheduled = next_aligned_tick(time.time(), interval)
+    skipped = 0
+
+    while True:
+        deadline = await sleep_until(scheduled)
+        lateness = time.monotonic() - deadline
+        started = time.time()
+        now = datetime.fromtimestamp(started)
+
+        sleep_seconds = closed_sleep_seconds(now)
+        if sleep_seconds > 0:
+            # Hand off to the closed logic: continue on the first boundary once the studios open.
+            # (The sleep time targets a full minute, allow one second of slack.)
+            scheduled = next_aligned_tick(started + sleep_seconds - 1, interval)
+            skipped = 0
+            continue
+
+        stats = TickStats(scheduled=scheduled, drift=started - scheduled, lateness=lateness, skipped=skipped)
+        metrics.tick_lateness_seconds.observe(max(lateness, 0.0))
+        if skipped:
+            metrics.skipped_ticks_total.inc(skipped)
+        utils_log.log(f"Tick {now.strftime('%H:%M:%S')}: drift {stats.drift:.3f}s, lateness {stats.lateness:.3f}s, skipped {stats.skipped}.", log_file_path)
+        await tick(now, stats)
+
+        if next_interval is not None:
+            interval = next_interval()
+        next_scheduled = next_aligned_tick(time.time(), interval)
+        skipped = max(0, int(round((next_scheduled - scheduled) / interval)) - 1)
+        scheduled = next_scheduled
@@ -0,0 +1,155 @@
+"""Durable on-disk queue of rows which are not yet written to the database."""
+import os
+import json
+import time
+import threading
+
+from . import constants
+
+
+class Spool:
+    """
+    Append-only write-ahead spool of pending database rows.
+
+    Every row is appended to "<name>.spool" before it is written to the database, and the byte offset up to which
+    rows were written is checkpointed in "<name>.spool.offset". Rows survive a database outage or a restart and are
+    replayed from the checkpoint. Once every row is acknowledged the spool is truncated.
+
+    Example:
+        spool = Spool()
+        spool.append([("visitors_ffgr", ("2023-06-15 10:30", 59))])
+        rows, end = spool.read(500)
+        ...  # Write the rows to the database.
+        spool.acknowledge(end)
+    """
+
+    def __init__(self, data_dir: str = None, name: str = "pending", fsync_seconds: float = 0.0):
+        """
+        Args:
+            data_dir (str, optional): The directory of the spool. Defaults to LOCATION_DATA_DIR.
+            name (str, optional): The file name of the spool without extension. Defaults to "pending".
+            fsync_seconds (float, optional): Minimum seconds between two fsyncs. Defaults to 0, every append
+                (i.e. every tick) is fsynced once.
+        """
+        data_dir = data_dir or constants.LOCATION_DATA_DIR
+        os.makedirs(data_dir, exist_ok=True)
+        self.path = os.path.join(data_dir, f"{name}.spool")
+        self.offset_path = f"{self.path}.offset"
+        self.fsync_seconds = fsync_seconds
+        self._last_fsync = 0.0
+        self._lock = threading.Lock()
+
+        self._file = open(self.path, mode="ab")
+        self._recover()
+        self.offset = self._read_offset()
+        self.pending = self._count_pending()
+
+    def _recover(self):
+        """
+        Cut off a torn last row, e.g. when the process died in the middle of a write.
+        """
+        size = os.path.getsize(self.path)
+        if size == 0:
+            return
+        with open(self.path, mode="rb") as spool_file:
+            spool_file.seek(max(0, size - 4096))
+            tail = spool_file.read()
+        if tail.endswith(b"\n"):
+            return
+        # Keep everything up to and including the last complete row.
+        self._file.truncate(size - len(tail) + tail.rfind(b"\n") + 1)
+
+    def _read_offset(self) -> int:
+        """Read the acknowledged offset, 0 if there is no (valid) checkpoint."""
+        try:
+            with open(self.offset_path, mode="r") as offset_file:
+                offset = int(offset_file.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+        return offset if offset <= os.path.getsize(self.path) else 0
+
+    def _write_offset(self, offset: int):
+        """Atomically checkpoint the acknowledged offset."""
+        tmp_path = f"{self.offset_path}.tmp"
+        with open(tmp_path, mode="w") as offset_file:
+            offset_file.write(str(offset))
+            offset_file.flush()
+            os.fsync(offset_file.fileno())
+        os.replace(tmp_path, self.offset_path)
+
+    def _count_pending(self) -> int:
+        """Count the rows after the acknowledged offset (once on startup)."""
+        with open(self.path, mode="rb") as spool_file:
+            spool_file.seek(self.offset)
+            return sum(1 for _ in spool_file)
+
+    def append(self, rows: list):
+        """
+        Append rows to the spool and make them durable.
+
+        Args:
+            rows (list): The rows as (table_name, values) tuples.
+        """
+        if not rows:
+            return
+        data = b"".join(json.dumps([table_name, list(values)]).encode("utf-8") + b"\n" for table_name, values in rows)
+        with self._lock:
+            self._file.write(data)
+            self._file.flush()
+            now = time.monotonic()
+            if now - self._last_fsync >= self.fsync_seconds:
+                os.fsync(self._file.fileno())
+                self._last_fsync = now
+            self.pending += len(rows)
+
+    def read(self, max_rows: int) -> tuple:
+        """
+        Read the oldest pending rows.
+
+        Args:
+            max_rows (int): The maximum number of rows to read.
+
+        Returns:
+            tuple: The rows as (table_name, values) tuples and the offset to acknowledge once they are written.
+        """
+        rows = []
+        with self._lock, open(self.path, mode="rb") as spool_file:
+            spool_file.seek(self.offset)
+            end = self.offset
+            while len(rows) < max_rows:
+                line = spool_file.readline()
+                if not line.endswith(b"\n"):
+                    break
+                table_name, values = json.loads(line)
+                rows.append((table_name, tuple(values)))
+                end += len(line)
+        return rows, end
+
+    def acknowledge(self, end: int):
+        """
+        Mark the rows up to the offset as written. Truncates the spool once every row is acknowledged.
+
+        Args:
+            end (int): The offset returned by read.
+        """
+        with self._lock:
+            with open(self.path, mode="rb") as spool_file:
+                spool_file.seek(self.offset)
+                acknowledged = spool_file.read(end - self.offset).count(b"\n")
+            self.pending -= acknowledged
+
+            if end >= os.path.getsize(self.path):
+                # Reset the checkpoint before truncating: a crash in between replays rows instead of losing them.
+                self._write_offset(0)
+                self._file.truncate(0)
+                self.offset = 0
+            else:
+                self._write_offset(end)
+                self.offset = end
+
+    def close(self):
+        """Flush and close the spool."""
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
@@ -0,0 +1,113 @@
+import os
+import shutil
+import tempfile
+from datetime import datetime, timezone
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+import numpy as np
+
+from .. import analytics
+from .. import utils_binary
+from .. import utils_csv
+
+
+class TestAnalytics(TestCase):
+    """
+    Tests related to the vectorized occupancy analytics.
+    """
+
+    def setUp(self):
+        # Monday 05-06-2023 00:00 in local wall-clock seconds.
+        self.monday = int(datetime(2023, 6, 5, tzinfo=timezone.utc).timestamp())
+
+    def test_slot_profile(self, *args):
+        """Test the mean and percentiles per weekday and slot."""
+        # Two Mondays at 10:00 and 10:10 and one Tuesday at 18:00.
+        local_seconds = np.array([
+            self.monday + 10 * 3600,
+            self.monday + 10 * 3600 + 600,
+            self.monday + 7 * analytics.SECONDS_PER_DAY + 10 * 3600,
+            self.monday + analytics.SECONDS_PER_DAY + 18 * 3600,
+            self.monday + analytics.SECONDS_PER_DAY + 18 * 3600 + 300,
+        ])
+        loads = np.array([10, 20, 60, 5, np.nan])
+
+        profile = analytics.slot_profile(local_seconds, loads, slot_seconds=3600, percentiles=(50, 100))
+
+        self.assertEqual(profile["mean"].shape, (7, 24))
+        self.assertEqual(profile["count"][0, 10], 3)
+        self.assertAlmostEqual(profile["mean"][0, 10], 30.0)
+        self.assertEqual(profile["percentiles"][50][0, 10], 20.0)
+        self.assertEqual(profile["percentiles"][100][0, 10], 60.0)
+        self.assertEqual(profile["count"][1, 18], 1, msg="Expect missing loads to be ignored.")
+        self.assertTrue(np.isnan(profile["mean"][2, 10]), msg="Expect NaN for slots without samples.")
+
+        # The percentiles match NumPy per slot.
+        random_seconds = self.monday + np.random.randint(0, 7 * analytics.SECONDS_PER_DAY, 2000)
+        random_loads = np.random.randint(0, 100, 2000).astype(float)
+        profile = analytics.slot_profile(random_seconds, random_loads, slot_seconds=6 * 3600, percentiles=(90,))
+        slot = (random_seconds - self.monday) // (6 * 3600) == 5
+        self.assertAlmostEqual(profile["percentiles"][90][1, 1], np.percentile(random_loads[slot], 90))
+
+    def test_busiest_windows(self, *args):
+        """Test that the windows are ranked by their mean load."""
+        means = np.full((7, 24), np.nan)
+        means[0, 8:12] = [10, 40, 50, 20]
+        means[4, 17:19] = [45, 45]
+        profile = {"mean": means, "slot_seconds": 3600}
+
+        busiest = analytics.busiest_windows(profile, count=2)
+        self.assertEqual(busiest[0], {"weekday": "Monday", "start": "10:00", "end": "11:00", "mean": 50.0})
+        self.assertEqual(busiest[1]["weekday"], "Friday")
+
+        two_hours = analytics.busiest_windows(profile, count=1, window_slots=2)
+        self.assertEqual((two_hours[0]["start"], two_hours[0]["end"], two_hours[0]["mean"]), ("09:00", "11:00", 45.0))
+
+        quietest = analytics.busiest_windows(profile, count=1, quietest=True)
+        self.assertEqual((quietest[0]["weekday"], quietest[0]["start"]), ("Monday", "08:00"))
+
+    def test_day_over_day(self, *args):
+        """Test the daily means and their change compared to the previous day."""
+        local_seconds = np.array([self.monday + 3600, self.monday + 7200, self.monday + analytics.SECONDS_PER_DAY + 3600, self.monday + 3 * analytics.SECONDS_PER_DAY])
+        loads = np.array([10.0, 30.0, 30.0, 5.0])
+
+        result = analytics.day_over_day(local_seconds, loads)
+
+        self.assertEqual([str(day) for day in result["days"]], ["2023-06-05", "2023-06-06", "2023-06-08"])
+        self.assertEqual(result["mean"].tolist(), [20.0, 30.0, 5.0])
+        self.assertEqual(result["peak"].tolist(), [30.0, 30.0, 5.0])
+        self.assertTrue(np.isnan(result["change"][0]))
+        self.assertEqual(result["change"][1], 10.0)
+        self.assertAlmostEqual(result["change_ratio"][1], 0.5)
+        self.assertTrue(np.isnan(result["change"][2]), msg="Expect no change when the previous day has no samples.")
+
+    def test_load_history(self, *args):
+        """Test that the history combines the binary and CSV segments without duplicates."""
+        data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, data_dir)
+
+        writer = utils_binary.BinarySegmentWriter()
+        writer.write(os.path.join(data_dir, "visitors-ffgr-2023-06.bin"), 1686981600, 10)
+        writer.close()
+        utils_csv.write_to_csv(os.path.join(data_dir, "visitors-ffgr-17-06-2023-08-00.csv"), ["timestamp", "visitor_count"], 1686981600, 10)
+        utils_csv.write_to_csv(os.path.join(data_dir, "visitors-ffgr-17-06-2023-08-00.csv"), ["timestamp", "visitor_count"], 1686981900, "")
+
+        local_seconds, loads = analytics.load_history(data_dir, "ffgr")
+
+        self.assertEqual(local_seconds.tolist(), analytics.to_local_seconds([1686981600, 1686981900]).tolist())
+        self.assertEqual(loads[0], 10.0)
+        self.assertTrue(np.isnan(loads[1]), msg="Expect a missing load to be NaN.")
+
+    def test_load_history_from_db(self, *args):
+        """Test that the rows of the table are loaded as arrays."""
+        db_connection = MagicMock()
+        cursor = db_connection.cursor.return_value.__enter__.return_value
+        cursor.fetchall.return_value = [(1686988800, 10), (1686989100, -1)]
+
+        local_seconds, loads = analytics.load_history_from_db(db_connection, "visitors_ffgr")
+
+        self.assertIn("FROM visitors_ffgr", cursor.execute.call_args[0][0])
+        self.assertEqual(local_seconds.tolist(), [1686988800, 1686989100])
+        self.assertEqual(loads[0], 10.0)
+        self.assertTrue(np.isnan(loads[1]))
@@ -0,0 +1,105 @@
+import os
+import shutil
+import tempfile
+from datetime import date
+from unittest import TestCase
+from unittest.mock import patch
+
+from .. import compaction
+from .. import utils_csv
+
+
+@patch("utilities.utils_log.log")
+class TestCompaction(TestCase):
+    """
+    Tests related to the compaction of closed CSV segments.
+    """
+
+    header = ["timestamp", "visitor_count"]
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.data_dir)
+
+    def write_segment(self, file_name: str, rows: list):
+        """Write a CSV segment the same way the collector does."""
+        for timestamp, visitor_count in rows:
+            utils_csv.write_to_csv(os.path.join(self.data_dir, file_name), self.header, timestamp, visitor_count)
+
+    def test_compact_closed_days(self, *args):
+        """Test that closed days are compacted with their footer statistics and today stays untouched."""
+        self.write_segment("visitors-ffgr-17-06-2023-08-00.csv", [(1686981600, 10), (1686981900, 30)])
+        self.write_segment("visitors-ffgr-18-06-2023-08-00.csv", [(1687068000, 20), (1687068300, None)])
+        self.write_segment("visitors-ffgr-19-06-2023-08-00.csv", [(1687154400, 5)])
+
+        compacted_days = compaction.compact(self.data_dir, "ffgr", today=date(2023, 6, 19), remove_sources=True)
+
+        self.assertEqual(compacted_days, 2)
+        self.assertEqual(sorted(os.listdir(self.data_dir)), ["manifest.json", "visitors-ffgr-19-06-2023-08-00.csv", "visitors-ffgr-2023-06.col"])
+
+        file_path = os.path.join(self.data_dir, "visitors-ffgr-2023-06.col")
+        footer = compaction.read_footer(file_path)
+        self.assertEqual((footer["rows"], footer["first"], footer["last"]), (4, 1686981600, 1687068300))
+        self.assertEqual((footer["min"], footer["max"], footer["mean"]), (10, 30, 20.0), msg="Expect the statistics to ignore missing loads.")
+        self.assertEqual(footer["days"], ["2023-06-17", "2023-06-18"])
+
+        timestamps, visitor_counts = compaction.read_columns(file_path)
+        self.assertEqual(timestamps.tolist(), [1686981600, 1686981900, 1687068000, 1687068300])
+        self.assertEqual(visitor_counts.tolist(), [10, 30, 20, compaction.MISSING_LOAD])
+
+    def test_compaction_is_incremental(self, *args):
+        """Test that new closed days are merged into the file of their month."""
+        self.write_segment("visitors-ffgr-17-06-2023-08-00.csv", [(1686981600, 10)])
+        compaction.compact(self.data_dir, "ffgr", today=date(2023, 6, 18))
+
+        self.write_segment("visitors-ffgr-18-06-2023-08-00.csv", [(1687068000, 20)])
+        self.assertEqual(compaction.compact(self.data_dir, "ffgr", today=date(2023, 6, 19)), 1)
+        self.assertEqual(compaction.compact(self.data_dir, "ffgr", today=date(2023, 6, 19)), 0, msg="Expect nothing left to compact.")
+
+        timestamps, visitor_counts = compaction.read_range(self.data_dir, "ffgr")
+        self.assertEqual(visitor_counts.tolist(), [10, 20])
+
+    def test_sources_are_kept(self, *args):
+        """Test that the CSV segments stay for the backfill unless they are removed explicitly."""
+        self.write_segment("visitors-ffgr-17-06-2023-08-00.csv", [(1686981600, 10)])
+        self.assertEqual(compaction.compact(self.data_dir, "ffgr", today=date(2023, 6, 18)), 1)
+        self.assertTrue(os.path.exists(os.path.join(self.data_dir, "visitors-ffgr-17-06-2023-08-00.csv")))
+        self.assertEqual(compaction.compact(self.data_dir, "ffgr", today=date(2023, 6, 18)), 0, msg="Expect unchanged segments to be skipped.")
+
+    def test_late_rows_are_merged(self, *args):
+        """Test that rows appended to an already compacted day are merged without duplicating the others."""
+        self.write_segment("visitors-ffgr-17-06-2023-08-00.csv", [(1686981600, 10)])
+        compaction.compact(self.data_dir, "ffgr", today=date(2023, 6, 18))
+
+        self.write_segment("visitors-ffgr-17-06-2023-08-00.csv", [(1686981900, 30)])
+        self.write_segment("visitors-ffgr-17-06-2023-12-00.csv", [(1686996000, 40)])
+        self.assertEqual(compaction.compact(self.data_dir, "ffgr", today=date(2023, 6, 18), remove_sources=True), 1)
+
+        timestamps, visitor_counts = compaction.read_range(self.data_dir, "ffgr")
+        self.assertEqual(timestamps.tolist(), [1686981600, 1686981900, 1686996000])
+        self.assertEqual(visitor_counts.tolist(), [10, 30, 40])
+        self.assertFalse([file_name for file_name in os.listdir(self.data_dir) if file_name.endswith(".csv")])
+
+    def test_interrupted_compaction(self, *args):
+        """Test that segments left over by an interrupted run are removed without duplicating their samples."""
+        self.write_segment("visitors-ffgr-17-06-2023-08-00.csv", [(1686981600, 10)])
+        with patch("os.remove", side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                compaction.compact(self.data_dir, "ffgr", today=date(2023, 6, 18), remove_sources=True)
+
+        self.assertEqual(compaction.compact(self.data_dir, "ffgr", today=date(2023, 6, 18), remove_sources=True), 0)
+        self.assertFalse(os.path.exists(os.path.join(self.data_dir, "visitors-ffgr-17-06-2023-08-00.csv")))
+        self.assertEqual(compaction.read_footer(os.path.join(self.data_dir, "visitors-ffgr-2023-06.col"))["rows"], 1)
+
+    def test_read_range_skips_files(self, *args):
+        """Test that files outside of the range are selected by their footer and not decompressed."""
+        self.write_segment("visitors-ffgr-17-05-2023-08-00.csv", [(1684303200, 1)])
+        self.write_segment("visitors-ffgr-17-06-2023-08-00.csv", [(1686981600, 2), (1686981900, 3)])
+        compaction.compact(self.data_dir, "ffgr", today=date(2023, 7, 1))
+
+        with patch.object(compaction, "read_columns", wraps=compaction.read_columns) as patched_read_columns:
+            timestamps, visitor_counts = compaction.read_range(self.data_dir, "ffgr", start=1686981900)
+
+        self.assertEqual(patched_read_columns.call_count, 1, msg="Expect only the June file to be read.")
+        self.assertEqual(timestamps.tolist(), [1686981900])
+        self.assertEqual(visitor_counts.tolist(), [3])
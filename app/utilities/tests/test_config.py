@@ -0,0 +1,87 @@
+import os
+import json
+import shutil
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+from .. import config
+from .. import constants
+from .. import utils_csv
+
+
+@patch("utilities.utils_log.log")
+class TestConfig(TestCase):
+    """
+    Tests related to the configuration of a worker.
+    """
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+
+    def test_from_env(self, *args):
+        """Test that the settings are parsed, invalid and missing ones fall back to the defaults."""
+        settings = config.Config.from_env({"REQUEST_DENSITY": "10", "REQUEST_RETRIES": "x", "STORAGE_FORMAT": "BINARY", "DB_TIMESTAMP_INDEX": "hash"})
+
+        self.assertEqual(settings.REQUEST_DENSITY, 600, msg="Expect the minutes in seconds.")
+        self.assertEqual(settings.REQUEST_RETRIES, 3, msg="Expect the default of an invalid value.")
+        self.assertEqual(settings.STORAGE_FORMAT, "binary")
+        self.assertEqual(settings.DB_TIMESTAMP_INDEX, "btree", msg="Expect the default of an unknown choice.")
+        self.assertEqual(settings.REQUEST_READ_TIMEOUT, 15.0)
+        self.assertTrue(settings.DB_ROLLUPS)
+        with self.assertRaises(AttributeError):
+            settings.UNKNOWN_SETTING
+
+    def test_from_file(self, *args):
+        """Test that the settings of the file override the environment."""
+        file_path = os.path.join(self.root, "ffhb.json")
+        with open(file_path, mode="w", encoding="utf-8") as config_file:
+            json.dump({"LOCATION_SHORT_TITLE": "FFHB", "CHANGE_ONLY_STORAGE": True, "DB_FLUSH_ROWS": 50}, config_file)
+
+        settings = config.Config.from_file(file_path, {"LOCATION_SHORT_TITLE": "ffgr", "REQUEST_DENSITY": "1"}, root=self.root)
+
+        self.assertEqual(settings.LOCATION_SHORT_TITLE, "ffhb")
+        self.assertEqual(settings.STUDIO_ID, 2)
+        self.assertEqual(settings.REQUEST_DENSITY, 60, msg="Expect the settings which are not in the file from the environment.")
+        self.assertEqual(settings.DB_FLUSH_ROWS, 50)
+        self.assertFalse(settings.DB_ROLLUPS, msg="Expect change-only storage to disable the rollups.")
+        self.assertEqual(settings.LOCATION_DATA_DIR, os.path.join(self.root, "ffhb", "data"))
+
+    def test_location_short_title_required(self, *args):
+        """Test that a missing location fails on first use instead of on import."""
+        settings = config.Config.from_env({})
+        with self.assertRaises(ValueError):
+            settings.LOCATION_SHORT_TITLE
+        self.assertEqual(settings.REQUEST_DENSITY, 300, msg="Expect the other settings to be usable.")
+
+    def test_studio_contexts(self, *args):
+        """Test that several configurations and studio contexts coexist without creating directories."""
+        first = config.Config.from_env({"LOCATION_SHORT_TITLE": "all"}, root=os.path.join(self.root, "first"))
+        second = config.Config.from_env({"LOCATION_SHORT_TITLE": "ffgr"}, root=os.path.join(self.root, "second"))
+
+        self.assertTrue(first.IS_MULTI_STUDIO)
+        self.assertFalse(second.IS_MULTI_STUDIO)
+        self.assertNotEqual(first.studio("ffgr").data_dir, second.studio("ffgr").data_dir)
+        self.assertIs(first.studio("FFGR"), first.studio("ffgr"), msg="Expect a context per studio.")
+        self.assertEqual((first.studio("ffhb").id, first.studio("ffhb").table_name), (2, "visitors_ffhb"))
+        with self.assertRaises(KeyError):
+            first.studio("unknown")
+        self.assertEqual(os.listdir(self.root), [], msg="Expect no directories before the first write.")
+
+        # The first write creates the data directory.
+        file_path = os.path.join(second.studio("ffgr").data_dir, "visitors.csv")
+        utils_csv.write_to_csv(file_path, ["timestamp", "visitor_count"], 1686823200, 10)
+        self.assertTrue(os.path.isfile(file_path))
+
+    def test_constants_read_the_active_config(self, *args):
+        """Test that constants reads the settings of the active configuration."""
+        previous = config.set_config(config.Config.from_env({"LOCATION_SHORT_TITLE": "ffda", "REQUEST_DENSITY": "2"}, root=self.root))
+        try:
+            self.assertEqual(constants.REQUEST_DENSITY, 120)
+            self.assertEqual(constants.STUDIO_ID, 1)
+            self.assertEqual(constants.get_location_dirs("ffgr")[0], os.path.join(self.root, "ffgr", "data"))
+            with self.assertRaises(AttributeError):
+                constants.UNKNOWN_SETTING
+        finally:
+            config.set_config(previous)
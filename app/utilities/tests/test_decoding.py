@@ -0,0 +1,68 @@
+from unittest import TestCase
+from unittest.mock import patch
+
+from .. import decoding
+from .. import metrics
+
+
+def record(studio_id, current_load, **fields) -> dict:
+    return {"studio_id": studio_id, "current_load": current_load, "name": f"Studio {studio_id}", **fields}
+
+
+@patch("utilities.utils_log.log")
+@patch("builtins.print")
+class TestDecoding(TestCase):
+    """
+    Tests related to the decoding of the studiocapacity responses.
+    """
+
+    def setUp(self):
+        self.decoder = decoding.StudioDecoder(log_file_path="requests.log")
+
+    def drift(self, kind: str) -> float:
+        return metrics.payload_drift_total.get(kind=kind)
+
+    def test_loads(self, *args):
+        """Test that the body is parsed by the available backend and invalid JSON raises a ValueError."""
+        self.assertEqual(decoding.loads(b'[{"studio_id": 3, "current_load": 59}]'), [{"studio_id": 3, "current_load": 59}])
+        with self.assertRaises(ValueError):
+            decoding.loads(b"<html>Maintenance</html>")
+
+    def test_validate_record(self, *args):
+        """Test that only records with an integer studio id and a non-negative load or None are valid."""
+        self.assertEqual(decoding.validate_record(record(3, 59)), (3, 59))
+        self.assertEqual(decoding.validate_record(record("3", None)), (3, None))
+        for invalid in (record(None, 59), record(3, "59"), record(3, -1), record(True, 5), record(3, 1.5), ["3", 59]):
+            self.assertIsNone(decoding.validate_record(invalid), msg=f"Expect {invalid} to be invalid.")
+
+    def test_index_is_independent_of_the_order(self, *args):
+        """Test that a reordered response maps every load to its own studio and is reported."""
+        self.assertEqual(self.decoder.index([record(1, 10), record(2, 20), record(3, 30)]), {1: 10, 2: 20, 3: 30})
+        reorders = self.drift("reorder")
+
+        self.assertEqual(self.decoder.index([record(3, 31), record(1, 11), record(2, 21)]), {1: 11, 2: 21, 3: 31})
+        self.assertEqual(self.drift("reorder"), reorders + 1)
+
+    def test_studios_and_schema_drift(self, *args):
+        """Test that added or removed studios and changed fields are reported."""
+        self.decoder.index([record(1, 10), record(2, 20)])
+        studios, schema = self.drift("studios"), self.drift("schema")
+
+        loads_by_id = self.decoder.index([record(1, 10, max_capacity=150)])
+        self.assertNotIn(2, loads_by_id, msg="Expect a disappeared studio not to be in the index.")
+        self.assertEqual(self.drift("studios"), studios + 1)
+        self.assertEqual(self.drift("schema"), schema + 1)
+
+    def test_invalid_and_duplicate_records(self, *args):
+        """Test that invalid and duplicate records are skipped and counted."""
+        invalid, duplicates = self.drift("invalid"), self.drift("duplicate")
+        loads_by_id = self.decoder.index([record(1, 10), record(1, 99), record(2, "n/a"), "studio"])
+
+        self.assertEqual(loads_by_id, {1: 10}, msg="Expect the first record of a studio to win.")
+        self.assertEqual(self.drift("invalid"), invalid + 2)
+        self.assertEqual(self.drift("duplicate"), duplicates + 1)
+
+    def test_unexpected_payload(self, *args):
+        """Test that a payload which is not a list raises a ValueError."""
+        with self.assertRaises(ValueError):
+            self.decoder.index({"error": "rate limited"})
@@ -0,0 +1,96 @@
+import json
+from unittest import TestCase
+from unittest.mock import patch, MagicMock
+
+import requests
+
+from ..http_client import HttpClient
+
+
+def make_response(status_code: int, payload=None, headers: dict = None):
+    """Create a mocked requests.Response."""
+    response = MagicMock()
+    response.status_code = status_code
+    response.headers = headers or {}
+    response.content = json.dumps(payload).encode("utf-8")
+    if status_code >= 400:
+        response.raise_for_status.side_effect = requests.HTTPError(f"{status_code} Error", response=response)
+    return response
+
+
+@patch("utilities.utils_log.log")
+@patch("builtins.print")
+@patch("time.sleep")
+class TestHttpClient(TestCase):
+    """
+    Tests related to the pooled HTTP client.
+    """
+
+    def setUp(self):
+        self.url = "https://example.com/studiocapacity"
+        self.client = HttpClient(connect_timeout=1, read_timeout=2, retries=3)
+        self.client.session.get = MagicMock()
+
+    def test_get_json_uses_timeouts(self, *args):
+        """Test that every request is sent through the session with the connect and read timeout."""
+        self.client.session.get.return_value = make_response(200, [{"studio_id": 1}])
+
+        self.assertEqual(self.client.get_json(self.url), [{"studio_id": 1}], msg="Expect the parsed JSON body.")
+        self.client.session.get.assert_called_once_with(self.url, headers={}, timeout=(1, 2))
+        self.assertIsNotNone(self.client.last_latency, msg="Expect the latency of the request to be recorded.")
+
+    def test_get_json_retries_server_errors(self, *args):
+        """Test that server errors and timeouts are retried with backoff."""
+        patched_sleep = args[0]
+        self.client.session.get.side_effect = [
+            make_response(503),
+            requests.Timeout("read timeout"),
+            make_response(200, {"data": "example data"}),
+        ]
+
+        self.assertEqual(self.client.get_json(self.url), {"data": "example data"}, msg="Expect the payload once a retry succeeded.")
+        self.assertEqual(patched_sleep.call_count, 2, msg="Expect a backoff before each retry.")
+        self.assertEqual(self.client.retry_count, 2, msg="Expect the retries to be counted.")
+        self.assertEqual(self.client.request_count, 3, msg="Expect the latency of the failed attempts to be recorded.")
+
+    def test_get_json_records_failed_latency(self, *args):
+        """Test that the latency of an attempt which timed out is recorded."""
+        self.client.retries = 0
+        self.client.session.get.side_effect = requests.Timeout("read timeout")
+        with patch("time.perf_counter", side_effect=[10.0, 12.5]):
+            with self.assertRaises(requests.Timeout):
+                self.client.get_json(self.url)
+        self.assertEqual(self.client.last_latency, 2.5)
+
+    def test_get_json_gives_up(self, *args):
+        """Test that the error is raised after all retries, and client errors are not retried."""
+        self.client.session.get.return_value = make_response(503)
+        with self.assertRaises(requests.HTTPError):
+            self.client.get_json(self.url)
+        self.assertEqual(self.client.session.get.call_count, 4, msg="Expect the initial attempt plus 3 retries.")
+
+        self.client.session.get.reset_mock()
+        self.client.session.get.return_value = make_response(404)
+        with self.assertRaises(requests.HTTPError):
+            self.client.get_json(self.url)
+        self.client.session.get.assert_called_once()
+
+    def test_get_json_conditional_request(self, *args):
+        """Test that the ETag is sent back and a 304 response is served from the cache."""
+        self.client.session.get.side_effect = [
+            make_response(200, {"data": "example data"}, headers={"ETag": '"abc"'}),
+            make_response(304),
+        ]
+
+        first = self.client.get_json(self.url)
+        second = self.client.get_json(self.url)
+
+        self.assertEqual(first, second, msg="Expect the cached payload for an unchanged response.")
+        self.assertEqual(self.client.session.get.call_args.kwargs["headers"], {"If-None-Match": '"abc"'})
+
+    def test_backoff_is_bounded(self, *args):
+        """Test that the jittered backoff never exceeds the exponential bound or the maximum."""
+        for attempt in range(10):
+            delay = self.client.backoff(attempt)
+            self.assertGreaterEqual(delay, 0)
+            self.assertLessEqual(delay, min(self.client.backoff_max, self.client.backoff_factor * 2 ** attempt))
@@ -0,0 +1,104 @@
+import os
+import shutil
+import tempfile
+from datetime import date
+from unittest import TestCase
+from unittest.mock import patch
+
+from .. import manifest
+
+
+class TestSegmentManifest(TestCase):
+    """
+    Tests related to the manifest of the daily CSV segments.
+    """
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.data_dir)
+
+    def write_segment(self, file_name: str, rows: list):
+        """Write a segment file with a header and the given (timestamp, visitor_count) rows."""
+        with open(os.path.join(self.data_dir, file_name), "w") as csv_file:
+            csv_file.write("timestamp,visitor_count\n")
+            for timestamp, visitor_count in rows:
+                csv_file.write(f"{timestamp},{visitor_count}\n")
+
+    def test_parse_segment_date(self, *args):
+        """Test that the date is parsed from segment file names and other files are ignored."""
+        self.assertEqual(manifest.parse_segment_date("visitors-ffgr-17-06-2023-20-00.csv"), date(2023, 6, 17))
+        self.assertIsNone(manifest.parse_segment_date("manifest.json"))
+        self.assertIsNone(manifest.parse_segment_date("pending.spool"))
+
+    def test_rebuild_from_directory(self, *args):
+        """Test that existing segments are indexed with their row counts and time ranges."""
+        self.write_segment("visitors-ffgr-17-06-2023-08-00.csv", [(1686981600, 10), (1686981900, 12)])
+        self.write_segment("visitors-ffgr-17-06-2023-20-00.csv", [(1687024800, 30)])
+
+        segment_manifest = manifest.SegmentManifest(self.data_dir)
+
+        self.assertEqual(segment_manifest.get_segment(date(2023, 6, 17)), "visitors-ffgr-17-06-2023-20-00.csv", msg="Expect the latest segment of the day.")
+        self.assertEqual(segment_manifest.get_segments(date(2023, 6, 17)), ["visitors-ffgr-17-06-2023-08-00.csv", "visitors-ffgr-17-06-2023-20-00.csv"])
+        self.assertEqual(segment_manifest.segments["visitors-ffgr-17-06-2023-08-00.csv"], {"date": "2023-06-17", "rows": 2, "first": 1686981600, "last": 1686981900})
+        self.assertIsNone(segment_manifest.get_segment(date(2023, 6, 18)), msg="Expect no segment for another day.")
+
+    def test_incremental_maintenance(self, *args):
+        """Test that added segments and recorded rows are persisted and lookups don't list the directory."""
+        segment_manifest = manifest.SegmentManifest(self.data_dir)
+        self.write_segment("visitors-ffgr-18-06-2023-08-00.csv", [(1687068000, 10), (1687068300, 12)])
+        segment_manifest.add_segment("visitors-ffgr-18-06-2023-08-00.csv")
+        segment_manifest.record("visitors-ffgr-18-06-2023-08-00.csv", 1687068000)
+        segment_manifest.record("visitors-ffgr-18-06-2023-08-00.csv", 1687068300)
+        segment_manifest.save()
+
+        with patch("os.listdir") as patched_listdir:
+            self.assertEqual(segment_manifest.get_segment(date(2023, 6, 18)), "visitors-ffgr-18-06-2023-08-00.csv")
+            patched_listdir.assert_not_called()
+
+        # Loaded again (e.g. after a restart) the counts are kept.
+        reloaded = manifest.SegmentManifest(self.data_dir)
+        self.assertEqual(reloaded.rows("visitors-ffgr-18-06-2023-08-00.csv"), 2)
+        self.assertEqual(reloaded.segments["visitors-ffgr-18-06-2023-08-00.csv"]["last"], 1687068300)
+
+    def test_refresh_on_miss(self, *args):
+        """Test that segments added or deleted by someone else are picked up when a lookup misses."""
+        self.write_segment("visitors-ffgr-17-06-2023-08-00.csv", [(1686981600, 10)])
+        segment_manifest = manifest.SegmentManifest(self.data_dir)
+
+        self.write_segment("visitors-ffgr-19-06-2023-08-00.csv", [(1687154400, 5)])
+        os.remove(os.path.join(self.data_dir, "visitors-ffgr-17-06-2023-08-00.csv"))
+
+        self.assertEqual(segment_manifest.get_segment(date(2023, 6, 19)), "visitors-ffgr-19-06-2023-08-00.csv", msg="Expect the new segment to be found.")
+        self.assertNotIn("visitors-ffgr-17-06-2023-08-00.csv", segment_manifest.segments, msg="Expect the deleted segment to be dropped.")
+
+    def test_lookups_dont_write(self, *args):
+        """Test that loading and looking up never create the data directory or rewrite the manifest."""
+        data_dir = os.path.join(self.data_dir, "ffgr", "data")
+        segment_manifest = manifest.SegmentManifest(data_dir)
+        self.assertIsNone(segment_manifest.get_segment(date(2023, 6, 17)))
+        self.assertFalse(os.path.exists(data_dir), msg="Expect the data directory to be created by the first segment.")
+
+        self.write_segment("visitors-ffgr-17-06-2023-08-00.csv", [(1686981600, 10)])
+        manifest.SegmentManifest(self.data_dir).get_segment(date(2023, 6, 17))
+        self.assertFalse(os.path.exists(os.path.join(self.data_dir, manifest.MANIFEST_FILE_NAME)), msg="Expect a refresh to stay in memory.")
+
+        # Recorded rows are persisted on the next save, e.g. on close.
+        segment_manifest = manifest.SegmentManifest(self.data_dir)
+        self.write_segment("visitors-ffgr-17-06-2023-08-00.csv", [(1686981600, 10), (1686981900, 12)])
+        segment_manifest.record("visitors-ffgr-17-06-2023-08-00.csv", 1686981900)
+        segment_manifest.save()
+        self.assertEqual(manifest.SegmentManifest(self.data_dir).rows("visitors-ffgr-17-06-2023-08-00.csv"), 2)
+
+    def test_recount_open_segment(self, *args):
+        """Test that rows written after the last save (e.g. before a crash) are counted from the open segment."""
+        self.write_segment("visitors-ffgr-17-06-2023-08-00.csv", [(1686981600, 10), (1686981900, 12)])
+        self.write_segment("visitors-ffgr-18-06-2023-08-00.csv", [(1687068000, 20)])
+        manifest.SegmentManifest(self.data_dir).rebuild()
+
+        self.write_segment("visitors-ffgr-18-06-2023-08-00.csv", [(1687068000, 20), (1687068300, 21), (1687068600, 22)])
+        with patch.object(manifest.SegmentManifest, "_read_segment", autospec=True, side_effect=manifest.SegmentManifest._read_segment) as patched_read:
+            reloaded = manifest.SegmentManifest(self.data_dir)
+
+        self.assertEqual(reloaded.segments["visitors-ffgr-18-06-2023-08-00.csv"], {"date": "2023-06-18", "rows": 3, "first": 1687068000, "last": 1687068600})
+        self.assertEqual(patched_read.call_count, 1, msg="Expect only the open segment to be read.")
+
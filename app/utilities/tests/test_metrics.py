@@ -0,0 +1,67 @@
+import urllib.error
+import urllib.request
+from unittest import TestCase
+
+from .. import metrics
+
+
+class TestMetrics(TestCase):
+    """
+    Tests related to the Prometheus metrics.
+    """
+
+    def setUp(self):
+        self.registry = metrics.Registry()
+
+    def test_counter_and_gauge(self, *args):
+        """Test that counters and gauges are rendered per label set."""
+        counter = self.registry.counter("test_samples_total", "Samples.")
+        counter.inc(studio="ffgr")
+        counter.inc(2, studio="ffgr")
+        gauge = self.registry.gauge("test_pending_rows", "Pending rows.")
+        pending = [3]
+        gauge.set_function(lambda: pending[0])
+        pending[0] = 5
+
+        rendered = self.registry.render()
+
+        self.assertIn("# TYPE test_samples_total counter\n", rendered)
+        self.assertIn('test_samples_total{studio="ffgr"} 3\n', rendered)
+        self.assertIn("test_pending_rows 5\n", rendered, msg="Expect the gauge function to be read on render.")
+
+    def test_histogram(self, *args):
+        """Test that the histogram buckets are cumulative and carry the sum and count."""
+        histogram = self.registry.histogram("test_fetch_seconds", "Fetch latency.", buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.7, 3.0):
+            histogram.observe(value)
+
+        rendered = self.registry.render()
+
+        self.assertIn('test_fetch_seconds_bucket{le="0.1"} 1\n', rendered)
+        self.assertIn('test_fetch_seconds_bucket{le="1"} 3\n', rendered)
+        self.assertIn('test_fetch_seconds_bucket{le="+Inf"} 4\n', rendered)
+        self.assertIn("test_fetch_seconds_sum 4.25\n", rendered)
+        self.assertIn("test_fetch_seconds_count 4\n", rendered)
+
+    def test_label_values_are_escaped(self, *args):
+        """Test that quotes in label values don't break the format."""
+        counter = self.registry.counter("test_total", "Test.")
+        counter.inc(reason='say "hi"')
+        self.assertIn('test_total{reason="say \\"hi\\""} 1', self.registry.render())
+
+    def test_server(self, *args):
+        """Test that the endpoint serves the process registry on /metrics only."""
+        metrics.samples_total.inc(studio="test")
+        server = metrics.start_server(0, host="127.0.0.1")
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+
+        with urllib.request.urlopen(f"{url}/metrics", timeout=5) as response:
+            body = response.read().decode("utf-8")
+            self.assertTrue(response.headers["Content-Type"].startswith("text/plain; version=0.0.4"))
+        self.assertIn('collector_samples_total{studio="test"}', body)
+        self.assertIn("# TYPE collector_fetch_seconds histogram", body)
+
+        with self.assertRaises(urllib.error.HTTPError):
+            urllib.request.urlopen(f"{url}/other", timeout=5)
@@ -0,0 +1,152 @@
+import os
+import json
+import shutil
+import tempfile
+from datetime import date, datetime
+from unittest import TestCase
+from unittest.mock import patch
+
+from .. import constants
+from .. import opening_hours
+
+WEEK = {"week_day": {"open": 8, "close": 23}, "week_end": {"open": 8, "close": 21}}
+AROUND_THE_CLOCK = {"week_day": {"open": 0, "close": 24}, "week_end": {"open": 0, "close": 24}}
+
+
+@patch("utilities.utils_log.log")
+class TestOpeningHours(TestCase):
+    """
+    Tests related to the opening-hours calendar.
+    """
+
+    def test_parse_time(self, *args):
+        """Test full hours, fractions of an hour and "HH:MM"."""
+        self.assertEqual(opening_hours.parse_time(8), 480)
+        self.assertEqual(opening_hours.parse_time(8.5), 510)
+        self.assertEqual(opening_hours.parse_time("08:30"), 510)
+        self.assertEqual(opening_hours.parse_time(24), 1440)
+        for value in (25, "x", None, True):
+            with self.assertRaises(ValueError):
+                opening_hours.parse_time(value)
+
+    def test_public_holidays(self, *args):
+        """Test the movable holidays, which depend on Easter."""
+        self.assertEqual(opening_hours.easter_sunday(2023), date(2023, 4, 9))
+        self.assertEqual(opening_hours.easter_sunday(2024), date(2024, 3, 31))
+        self.assertEqual(opening_hours.easter_sunday(2025), date(2025, 4, 20))
+        holidays = opening_hours.public_holidays(2023)
+        self.assertEqual(holidays[date(2023, 6, 8)], "Fronleichnam")
+        self.assertEqual(len(holidays), 10)
+
+    def test_is_open_week_day(self, *args):
+        """Test the opening hours on a weekday, the closing hour is not open."""
+        calendar = opening_hours.OpeningCalendar(WEEK)
+        # Thursday.
+        for hour, result in [(7, False), (8, True), (22, True), (23, False)]:
+            self.assertEqual(calendar.is_open(datetime(2023, 6, 15, hour)), result, msg=f"Expect the studio to be {'open' if result else 'closed'} at {hour}.")
+
+    def test_is_open_week_end(self, *args):
+        """Test the opening hours on a weekend."""
+        calendar = opening_hours.OpeningCalendar(WEEK)
+        # Saturday.
+        for hour, result in [(7, False), (8, True), (20, True), (21, False)]:
+            self.assertEqual(calendar.is_open(datetime(2023, 6, 17, hour)), result, msg=f"Expect the studio to be {'open' if result else 'closed'} at {hour}.")
+
+    def test_around_the_clock(self, *args):
+        """Test that a studio which is always open has a single merged interval."""
+        calendar = opening_hours.OpeningCalendar(AROUND_THE_CLOCK, days=7)
+        for hour in (0, 12, 23):
+            self.assertTrue(calendar.is_open(datetime(2023, 6, 15, hour)))
+        self.assertEqual(len(calendar._opens), 1, msg="Expect the days to be merged.")
+
+    def test_next_opening(self, *args):
+        """Test the time until the next opening, today and tomorrow."""
+        calendar = opening_hours.OpeningCalendar(WEEK)
+        for now, seconds in [
+            (datetime(2023, 6, 15, 23, 34, 35), 30325),
+            (datetime(2023, 6, 16, 3, 40, 55), 15545),
+            (datetime(2023, 6, 16, 5, 29, 20), 9040),
+        ]:
+            self.assertEqual((calendar.next_opening(now) - now).total_seconds(), seconds)
+
+        now = datetime(2023, 6, 15, 10)
+        self.assertEqual(calendar.next_opening(now), now, msg="Expect an open studio to be open now.")
+        self.assertEqual(calendar.next_closing(now), datetime(2023, 6, 15, 23))
+
+    def test_holidays(self, *args):
+        """Test that the holiday hours apply on public holidays, only for studios which define them."""
+        # Monday 25-12-2023, after the weekend closing time.
+        now = datetime(2023, 12, 25, 22)
+        holiday_week = {**WEEK, "holiday": {"open": 8, "close": 21}}
+        self.assertFalse(opening_hours.OpeningCalendar(holiday_week).is_open(now))
+        self.assertTrue(opening_hours.OpeningCalendar(holiday_week, holidays=False).is_open(now))
+        self.assertTrue(opening_hours.OpeningCalendar(WEEK).is_open(now), msg="Expect the week day hours without holiday hours.")
+        self.assertFalse(opening_hours.OpeningCalendar({**WEEK, "holiday": None}).is_open(datetime(2023, 12, 25, 12)), msg="Expect a closed holiday.")
+
+    def test_exceptions(self, *args):
+        """Test special closures, half hours and split days."""
+        calendar = opening_hours.OpeningCalendar(WEEK, exceptions={
+            date(2023, 6, 15): opening_hours.parse_hours(None),
+            date(2023, 6, 16): opening_hours.parse_hours([{"open": "08:30", "close": "12:00"}, {"open": 14, "close": 20.5}]),
+        })
+
+        self.assertFalse(calendar.is_open(datetime(2023, 6, 15, 12)), msg="Expect the studio to be closed on the closure.")
+        self.assertEqual(calendar.next_opening(datetime(2023, 6, 15, 12)), datetime(2023, 6, 16, 8, 30))
+        self.assertFalse(calendar.is_open(datetime(2023, 6, 16, 13)))
+        self.assertEqual(calendar.next_opening(datetime(2023, 6, 16, 13)), datetime(2023, 6, 16, 14))
+        self.assertEqual(calendar.next_closing(datetime(2023, 6, 16, 14)), datetime(2023, 6, 16, 20, 30))
+
+    def test_past_midnight(self, *args):
+        """Test hours which close on the following day."""
+        calendar = opening_hours.OpeningCalendar({"week_day": {"open": 18, "close": 2}, "week_end": None}, holidays=False)
+        # Thursday night into Friday.
+        self.assertTrue(calendar.is_open(datetime(2023, 6, 16, 1)))
+        self.assertFalse(calendar.is_open(datetime(2023, 6, 16, 2)))
+        # Friday night into the weekend.
+        self.assertTrue(calendar.is_open(datetime(2023, 6, 17, 1)))
+        self.assertEqual(calendar.next_opening(datetime(2023, 6, 17, 3)), datetime(2023, 6, 19, 18))
+
+    def test_rebuilds_ahead(self, *args):
+        """Test that the intervals are precomputed again once the lookups reach the end."""
+        calendar = opening_hours.OpeningCalendar(WEEK, days=2)
+        calendar.is_open(datetime(2023, 6, 15, 12))
+        self.assertEqual(calendar.first_day, date(2023, 6, 15))
+
+        self.assertTrue(calendar.is_open(datetime(2023, 6, 20, 12)))
+        self.assertEqual(calendar.first_day, date(2023, 6, 20))
+        # Closed until the precomputed days are over.
+        closed = opening_hours.OpeningCalendar({"week_day": None, "week_end": None}, days=2)
+        self.assertIsNone(closed.next_opening(datetime(2023, 6, 15)))
+
+    def test_next_opening_of_studios(self, *args):
+        """Test that the earliest opening of several studios is used."""
+        calendars = [
+            opening_hours.OpeningCalendar(WEEK),
+            opening_hours.OpeningCalendar({"week_day": {"open": "06:30", "close": 22}, "week_end": {"open": 9, "close": 20}}),
+        ]
+        self.assertEqual(opening_hours.next_opening(calendars, datetime(2023, 6, 15, 23)), datetime(2023, 6, 16, 6, 30))
+        self.assertIsNone(opening_hours.next_opening([], datetime(2023, 6, 15, 23)))
+
+    def test_load_exceptions(self, *args):
+        """Test that the exceptions of a studio override the ones of every studio."""
+        config_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, config_dir)
+        file_path = os.path.join(config_dir, "opening_hours.json")
+        with open(file_path, mode="w", encoding="utf-8") as config_file:
+            json.dump({
+                "all": {"2023-12-24": {"open": "08:00", "close": "14:00"}, "2023-12-31": None},
+                "FFGR": {"2023-12-24": None},
+                "ffhb": {"2023-12-24": {"open": "x"}},
+            }, config_file)
+
+        exceptions = opening_hours.load_exceptions(file_path)
+
+        self.assertEqual(opening_hours.get_exceptions(exceptions, "ffgr"), {date(2023, 12, 24): [], date(2023, 12, 31): []})
+        self.assertEqual(opening_hours.get_exceptions(exceptions, "ffda")[date(2023, 12, 24)], [(480, 840)])
+        self.assertNotIn("ffhb", exceptions, msg="Expect invalid exceptions to be ignored.")
+        self.assertEqual(opening_hours.load_exceptions(os.path.join(config_dir, "missing.json")), {})
+
+    def test_studio_map(self, *args):
+        """Test that the opening hours of every studio are valid."""
+        for studio in constants.STUDIO_MAP.values():
+            opening_hours.OpeningCalendar(studio["opening_hours"]).is_open(datetime(2023, 6, 15, 12))
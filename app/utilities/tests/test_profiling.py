@@ -0,0 +1,110 @@
+import os
+import json
+import time
+import pstats
+import asyncio
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+from datetime import datetime
+
+from .. import profiling
+from .. import utils_log
+
+
+def busy_function():
+    """A function which shows up in the profile."""
+    return sum(i * i for i in range(1000))
+
+
+@patch("builtins.print")
+class TestProfiling(TestCase):
+    """
+    Tests related to the per-stage timings and the on-demand profiling.
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.stages_file_path = os.path.join(self.temp_dir.name, "stages.log")
+        self.now = datetime(year=2023, month=6, day=5, hour=10, minute=5)
+
+    def read_records(self) -> list:
+        utils_log.flush()
+        with open(self.stages_file_path, encoding="utf-8") as file:
+            return [json.loads(line) for line in file]
+
+    def test_stage_outside_of_a_tick(self, *args):
+        """Test that stages outside of a tick are not timed."""
+        with profiling.stage("fetch"):
+            pass
+        self.assertIsNone(profiling._current_timer.get())
+
+    def test_tick_record(self, *args):
+        """Test that a tick writes a JSON line with the summed stages in the order they run."""
+        with profiling.tick(self.now, self.stages_file_path) as timer:
+            with profiling.stage("db_write"):
+                time.sleep(0.01)
+            for _ in range(2):
+                with profiling.stage("fetch"):
+                    time.sleep(0.01)
+            # Worker group mode claims the studios before the fetch.
+            with profiling.stage("claim"):
+                pass
+            timer.fields["samples"] = 2
+
+        record, = self.read_records()
+        self.assertEqual(record["timestamp"], "2023-06-05T10:05:00")
+        self.assertEqual(list(record["stages_ms"]), ["claim", "fetch", "db_write"], msg="Expect the stages in the order of STAGES.")
+        self.assertGreaterEqual(record["stages_ms"]["fetch"], 20, msg="Expect repeated stages to be summed.")
+        self.assertGreaterEqual(record["total_ms"], 30)
+        self.assertEqual(record["samples"], 2)
+
+    def test_stages_in_threads(self, *args):
+        """Test that stages running in asyncio.to_thread are timed on the tick."""
+        def write():
+            with profiling.stage("segment_write"):
+                time.sleep(0.01)
+
+        async def tick():
+            with profiling.tick(self.now, self.stages_file_path):
+                await asyncio.gather(asyncio.to_thread(write), asyncio.to_thread(write))
+
+        asyncio.run(tick())
+
+        record, = self.read_records()
+        self.assertGreaterEqual(record["stages_ms"]["segment_write"], 20)
+
+    def test_profile_requested_ticks(self, *args):
+        """Test that a request profiles the next ticks, including the functions of worker threads."""
+        profiler = profiling.Profiler(output_dir=self.temp_dir.name)
+        profiler.request(2)
+
+        async def run_ticks():
+            for _ in range(3):
+                profile = profiler.begin_tick()
+                await asyncio.to_thread(profiler.profiled(busy_function))
+                profiler.end_tick(profile)
+
+        with patch.object(profiling, "profiler", profiler):
+            asyncio.run(run_ticks())
+        utils_log.flush()
+
+        profiles = [file_name for file_name in os.listdir(self.temp_dir.name) if file_name.endswith(".prof")]
+        self.assertEqual(len(profiles), 1, msg="Expect a single profile of the requested ticks.")
+        self.assertFalse(profiler.active, msg="Expect the third tick not to be profiled.")
+
+        stats = pstats.Stats(os.path.join(self.temp_dir.name, profiles[0]))
+        function_names = {function_name for _, _, function_name in stats.stats}
+        self.assertIn("busy_function", function_names)
+
+        summary_path = os.path.join(self.temp_dir.name, profiles[0].replace(".prof", ".txt"))
+        with open(summary_path, encoding="utf-8") as summary:
+            self.assertTrue(summary.readline().startswith("Profile of 2 ticks."))
+
+    def test_no_profile_without_request(self, *args):
+        """Test that ticks are not profiled unless requested."""
+        profiler = profiling.Profiler(output_dir=self.temp_dir.name)
+        self.assertIsNone(profiler.begin_tick())
+        self.assertIsNone(profiler.end_tick(None))
+        self.assertEqual(os.listdir(self.temp_dir.name), [])
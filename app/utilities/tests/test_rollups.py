@@ -0,0 +1,83 @@
+from unittest import TestCase
+from unittest.mock import patch, MagicMock
+from datetime import datetime
+
+from .. import rollups
+from .. import utils_db
+
+
+@patch("utilities.utils_log.log")
+@patch("builtins.print")
+class TestRollups(TestCase):
+    """
+    Tests related to the rollup tables of the visitors tables.
+    """
+
+    def test_bucket_start(self, *args):
+        """Test that timestamps are floored to the start of their bucket."""
+        self.assertEqual(rollups.bucket_start("2023-06-15 10:34", 300), datetime(2023, 6, 15, 10, 30))
+        self.assertEqual(rollups.bucket_start(datetime(2023, 6, 15, 10, 34, 12), 3600), datetime(2023, 6, 15, 10, 0))
+        self.assertEqual(rollups.bucket_start("2023-06-15 23:59", 86400), datetime(2023, 6, 15))
+
+    def test_aggregate(self, *args):
+        """Test that count, sum, min and max are aggregated per bucket in order."""
+        rows = [("2023-06-15 11:05", 30), ("2023-06-15 10:30", 10), ("2023-06-15 10:35", 20), ("2023-06-15 10:40", None)]
+
+        self.assertEqual(rollups.aggregate(rows, 3600), [
+            (datetime(2023, 6, 15, 10, 0), 2, 30, 10, 20),
+            (datetime(2023, 6, 15, 11, 0), 1, 30, 30, 30),
+        ])
+        self.assertEqual(rollups.aggregate(rows, 86400), [(datetime(2023, 6, 15), 3, 60, 10, 30)], msg="Expect rows without a load to be skipped.")
+
+    @patch("utilities.rollups.execute_values")
+    def test_upsert(self, patched_execute_values, *args):
+        """Test that every rollup table is upserted once with the aggregated buckets."""
+        cursor = MagicMock()
+        rollups.upsert(cursor, "visitors_ffgr", [("2023-06-15 10:30", 10), ("2023-06-15 10:35", 20)])
+
+        self.assertEqual(patched_execute_values.call_count, 3)
+        queries = [call.args[1] for call in patched_execute_values.call_args_list]
+        self.assertTrue(queries[0].startswith("INSERT INTO visitors_ffgr_5min AS rollup"))
+        self.assertIn("ON CONFLICT (bucket) DO UPDATE SET sample_count = rollup.sample_count + EXCLUDED.sample_count", queries[1])
+        self.assertEqual(patched_execute_values.call_args_list[1].args[2], [(datetime(2023, 6, 15, 10, 0), 2, 30, 10, 20)])
+
+    @patch("utilities.rollups.execute_values")
+    @patch("utilities.utils_db.execute_values")
+    def test_batch_writer_maintains_rollups(self, patched_insert, patched_upsert, *args):
+        """Test that the rollups are upserted in the transaction of the raw insert."""
+        connection = MagicMock()
+        connection.closed = 0
+        # The rows returned by the insert, the ones which were not in the table yet.
+        patched_insert.return_value = [(datetime(2023, 6, 15, 10, 30), 10)]
+        writer = utils_db.BatchWriter(connection, max_rows=100, max_age=0, rollups=True)
+        writer.add("visitors_ffgr", ("2023-06-15 10:30", 10))
+        writer.flush()
+
+        cursor = connection.cursor.return_value.__enter__.return_value
+        self.assertIs(patched_upsert.call_args.args[0], cursor, msg="Expect the rollups to share the cursor of the insert.")
+        self.assertEqual(patched_upsert.call_count, 3)
+        connection.commit.assert_called_once()
+
+    def test_rebuild(self, *args):
+        """Test that the rebuild recomputes every rollup table while inserts are blocked."""
+        connection = MagicMock()
+        cursor = connection.cursor.return_value.__enter__.return_value
+
+        rollups.rebuild(connection, "visitors_ffgr")
+
+        queries = [call.args[0] for call in cursor.execute.call_args_list]
+        self.assertEqual(queries[0], "LOCK TABLE visitors_ffgr IN SHARE MODE")
+        self.assertIn("TRUNCATE visitors_ffgr_daily", queries)
+        self.assertTrue(any("date_trunc('hour', timestamp)" in query and query.startswith("INSERT INTO visitors_ffgr_hourly") for query in queries))
+        connection.commit.assert_called_once()
+
+    def test_create_rollup_tables(self, *args):
+        """Test that only missing rollup tables are created and reported."""
+        connection = MagicMock()
+        cursor = connection.cursor.return_value.__enter__.return_value
+        cursor.fetchone.side_effect = [("visitors_ffgr_5min",), (None,), ("visitors_ffgr_daily",)]
+
+        self.assertTrue(rollups.create_rollup_tables(connection, "visitors_ffgr"))
+        created = [call.args[0] for call in cursor.execute.call_args_list if call.args[0].startswith("CREATE")]
+        self.assertEqual(len(created), 1)
+        self.assertTrue(created[0].startswith("CREATE TABLE visitors_ffgr_hourly"))
@@ -0,0 +1,93 @@
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+import numpy as np
+
+from .. import analytics
+from .. import runlength
+
+
+class TestRunLength(TestCase):
+    """
+    Tests related to the change-only storage of the samples.
+    """
+
+    def setUp(self):
+        # 15-06-2023 10:00:00 UTC.
+        self.start = 1686823200
+
+    def test_filter_stores_changes(self, *args):
+        """Test that only the first sample and the changes of the load are stored."""
+        changes = runlength.ChangeFilter(heartbeat=3600)
+        stored = [changes.filter("ffgr", self.start + i * 300, load, 300) for i, load in enumerate([10, 10, 12, 12, 12, 10])]
+
+        self.assertEqual(stored, [[(self.start, 10)], [], [(self.start + 600, 12)], [], [], [(self.start + 1500, 10)]])
+        self.assertEqual((changes.observed, changes.stored), (6, 3))
+
+    def test_filter_heartbeat(self, *args):
+        """Test that an unchanged load is stored again once the last stored row is a heartbeat old."""
+        changes = runlength.ChangeFilter(heartbeat=900)
+        # The ticks start slightly after their boundary.
+        stored = [changes.filter("ffgr", self.start + i * 300 + 0.2, 10, 300) for i in range(7)]
+
+        self.assertEqual([len(rows) for rows in stored], [1, 0, 0, 1, 0, 0, 1], msg="Expect a row every 15 minutes.")
+
+    def test_filter_ends_runs_at_gaps(self, *args):
+        """Test that the first missing sample ends the run of the last stored load."""
+        changes = runlength.ChangeFilter(heartbeat=3600)
+        changes.filter("ffgr", self.start, 10, 300)
+        changes.filter("ffgr", self.start + 300, 10, 300)
+
+        rows = changes.filter("ffgr", self.start + 1800, 10, 300)
+
+        self.assertEqual(rows, [(self.start + 600, None), (self.start + 1800, 10)])
+        self.assertEqual(changes.filter("ffhb", self.start + 1800, 10, 300), [(self.start + 1800, 10)], msg="Expect the studios to be independent.")
+
+    def test_filter_late_tick(self, *args):
+        """Test that a late tick doesn't store a gap row in the minute of its sample, the database keeps one row per minute."""
+        changes = runlength.ChangeFilter(heartbeat=3600)
+        changes.filter("ffgr", self.start, 50, 60)
+
+        # 45 seconds late: more than half of the interval, but in the minute of the expected sample.
+        self.assertEqual(changes.filter("ffgr", self.start + 105, 52, 60), [(self.start + 105, 52)])
+        self.assertEqual(changes.filter("ffgr", self.start + 165, 52, 60), [])
+
+    def test_expand(self, *args):
+        """Test that the rows are repeated until the next row or the heartbeat."""
+        timestamps, visitor_counts = runlength.expand(
+            np.array([0, 900, 1200, 1500]), np.array([10, 12, -1, 5], dtype=np.int16), step=300, heartbeat=600, end=2100
+        )
+
+        self.assertEqual(timestamps.tolist(), [0, 300, 900, 1500, 1800])
+        self.assertEqual(visitor_counts.tolist(), [10, 10, 12, 5, 5])
+        self.assertEqual(visitor_counts.dtype, np.int16, msg="Expect the dtype of the stored loads.")
+
+    def test_round_trip(self, *args):
+        """Test that the reconstructed series equals the sampled one."""
+        loads = [10, 10, 10, 11, None, None, 11, 11, 11, 11, 11, 11, 11, 11, 11, 11, 11, 9]
+        sampled = [(self.start + i * 300, load) for i, load in enumerate(loads)]
+        # Closed for an hour, e.g. a failed fetch, then open again.
+        sampled += [(self.start + 7200 + i * 300, load) for i, load in enumerate([9, 9, 4])]
+
+        changes = runlength.ChangeFilter(heartbeat=1800)
+        rows = [row for timestamp, load in sampled for row in changes.filter("ffgr", timestamp, load, 300)]
+        self.assertLess(len(rows), len(sampled))
+
+        timestamps, visitor_counts = runlength.expand(
+            np.array([timestamp for timestamp, _ in rows]),
+            np.array([-1 if load is None else load for _, load in rows]),
+            step=300, heartbeat=1800, end=sampled[-1][0] + 300
+        )
+        expected = [(timestamp, load) for timestamp, load in sampled if load is not None]
+        self.assertEqual(list(zip(timestamps.tolist(), visitor_counts.tolist())), expected)
+
+    def test_load_history_from_db(self, *args):
+        """Test that the analytics reconstruct the change-only history."""
+        db_connection = MagicMock()
+        cursor = db_connection.cursor.return_value.__enter__.return_value
+        cursor.fetchall.return_value = [(1686988800, 10), (1686989400, 12), (1686989700, -1)]
+
+        local_seconds, loads = analytics.load_history_from_db(db_connection, "visitors_ffgr", change_only=True)
+
+        self.assertEqual(local_seconds.tolist(), [1686988800, 1686989100, 1686989400])
+        self.assertEqual(loads.tolist(), [10.0, 10.0, 12.0])
@@ -0,0 +1,146 @@
+import asyncio
+from unittest import TestCase
+from unittest.mock import patch
+from datetime import datetime, timedelta
+
+from .. import scheduler
+
+
+class StopScheduler(Exception):
+    """Raised by the test ticks to leave the endless scheduling loop."""
+
+
+@patch("utilities.utils_log.log")
+@patch("builtins.print")
+class TestScheduler(TestCase):
+    """
+    Tests related to the wall-clock aligned scheduler.
+    """
+
+    def test_next_aligned_tick(self, *args):
+        """Test that the next tick is the following multiple of the interval."""
+        now = datetime(year=2023, month=6, day=15, hour=10, minute=2, second=13).timestamp()
+        expected = datetime(year=2023, month=6, day=15, hour=10, minute=5).timestamp()
+        self.assertEqual(scheduler.next_aligned_tick(now, 300), expected, msg="Expect 10:02:13 to be aligned to 10:05:00.")
+
+        # A timestamp exactly on the boundary schedules the following boundary.
+        self.assertEqual(scheduler.next_aligned_tick(expected, 300), expected + 300, msg="Expect a boundary to be followed by the next one.")
+
+    def test_run_aligned_does_not_drift(self, *args):
+        """Test that slow ticks stay on the grid and report their drift and lateness."""
+        interval = 0.05
+        ticks = []
+
+        async def tick(now, stats):
+            ticks.append(stats)
+            await asyncio.sleep(interval / 2)  # Simulate the cost of the work.
+            if len(ticks) == 3:
+                raise StopScheduler()
+
+        with self.assertRaises(StopScheduler):
+            asyncio.run(scheduler.run_aligned(tick, interval, closed_sleep_seconds=lambda now: 0))
+
+        for previous, current in zip(ticks, ticks[1:]):
+            self.assertAlmostEqual(current.scheduled - previous.scheduled, interval, places=6, msg="Expect consecutive ticks exactly one interval apart.")
+        for stats in ticks:
+            self.assertGreaterEqual(stats.lateness, 0, msg="Expect the lateness to be measured.")
+            self.assertLess(abs(stats.drift), interval, msg="Expect the tick to start close to its boundary.")
+            self.assertEqual(stats.skipped, 0, msg="Expect no skipped boundaries when the work fits into the interval.")
+
+    def test_run_aligned_skips_overrun_boundaries(self, *args):
+        """Test that a tick which overruns the interval skips the missed boundaries."""
+        interval = 0.05
+        ticks = []
+
+        async def tick(now, stats):
+            ticks.append(stats)
+            if len(ticks) == 1:
+                await asyncio.sleep(interval * 2.5)
+            else:
+                raise StopScheduler()
+
+        with self.assertRaises(StopScheduler):
+            asyncio.run(scheduler.run_aligned(tick, interval, closed_sleep_seconds=lambda now: 0))
+
+        self.assertEqual(ticks[1].skipped, 2, msg="Expect the two missed boundaries to be reported.")
+
+    def test_run_aligned_hands_off_while_closed(self, *args):
+        """Test that no tick runs while the studios are closed."""
+        interval = 0.05
+        calls = []
+        ticks = []
+
+        def closed_sleep_seconds(now):
+            calls.append(now)
+            return interval if len(calls) == 1 else 0
+
+        async def tick(now, stats):
+            ticks.append(stats)
+            raise StopScheduler()
+
+        with self.assertRaises(StopScheduler):
+            asyncio.run(scheduler.run_aligned(tick, interval, closed_sleep_seconds=closed_sleep_seconds))
+
+        self.assertEqual(len(calls), 2, msg="Expect the closed check to run on every boundary.")
+        self.assertEqual(len(ticks), 1, msg="Expect the tick to run once the studios are open.")
+
+    def test_run_aligned_follows_next_interval(self, *args):
+        """Test that the interval returned after a tick schedules the following tick."""
+        intervals = [0.05, 0.1]
+        ticks = []
+
+        async def tick(now, stats):
+            ticks.append(stats)
+            if len(ticks) == 3:
+                raise StopScheduler()
+
+        with self.assertRaises(StopScheduler):
+            asyncio.run(scheduler.run_aligned(tick, 0.05, closed_sleep_seconds=lambda now: 0, next_interval=lambda: intervals[min(len(ticks), 2) - 1]))
+
+        self.assertAlmostEqual(ticks[1].scheduled - ticks[0].scheduled, 0.05, places=6, msg="Expect the first interval after the first tick.")
+        # The following tick is on the next boundary of the changed interval.
+        self.assertAlmostEqual(ticks[2].scheduled / 0.1, round(ticks[2].scheduled / 0.1), places=3, msg="Expect the tick on the grid of the changed interval.")
+        self.assertLessEqual(ticks[2].scheduled - ticks[1].scheduled, 0.1 + 1e-6, msg="Expect no boundary of the changed interval to be passed over.")
+        self.assertEqual(ticks[2].skipped, 0, msg="Expect a longer interval not to count as skipped boundaries.")
+
+
+@patch("utilities.utils_log.log")
+class TestAdaptiveInterval(TestCase):
+    """
+    Tests related to the adaptive polling interval.
+    """
+
+    def setUp(self):
+        self.start = datetime(year=2023, month=6, day=15, hour=18)
+
+    def observe(self, poller, minutes, loads):
+        return poller.observe(self.start + timedelta(minutes=minutes), loads)
+
+    def test_steps_divide_an_hour(self, *args):
+        """Test that the steps stay between the floor and the ceiling."""
+        poller = scheduler.AdaptiveInterval(floor=60, ceiling=900, target_change=3, initial=300)
+        self.assertEqual(poller.steps, [60, 120, 180, 240, 300, 360, 600, 720, 900], msg="Expect the steps of the grid within the bounds.")
+        self.assertEqual(poller.interval, 300, msg="Expect the initial interval until the rate is known.")
+
+    def test_flat_load_polls_at_ceiling(self, *args):
+        """Test that an unchanged load stretches the interval to the ceiling."""
+        poller = scheduler.AdaptiveInterval(floor=60, ceiling=900, target_change=3, initial=300)
+        self.assertEqual(self.observe(poller, 0, {"ffgr": 20}), 300, msg="Expect the initial interval after the first sample.")
+        self.assertEqual(self.observe(poller, 5, {"ffgr": 20}), 900, msg="Expect the ceiling for a flat load.")
+
+    def test_fast_change_polls_more_often(self, *args):
+        """Test that the fastest changing studio chooses the interval, rounded down to the grid."""
+        poller = scheduler.AdaptiveInterval(floor=60, ceiling=900, target_change=3, initial=300, smoothing=1)
+        self.observe(poller, 0, {"ffgr": 20, "ffhb": 30})
+        # ffhb changes by 1 visitor per minute, 3 visitors take 3 minutes.
+        self.assertEqual(self.observe(poller, 5, {"ffgr": 21, "ffhb": 35}), 180, msg="Expect the interval of the fastest studio.")
+        # 2.5 visitors per minute, 72 seconds are rounded down to the floor.
+        self.assertEqual(self.observe(poller, 7, {"ffgr": 21, "ffhb": 30}), 60, msg="Expect the interval to be rounded down to the grid.")
+        self.assertEqual(self.observe(poller, 8, {"ffgr": None, "ffhb": 30}), 900, msg="Expect unknown loads to be ignored.")
+
+    def test_gap_is_ignored(self, *args):
+        """Test that a sample from before a closed period doesn't count as a change."""
+        poller = scheduler.AdaptiveInterval(floor=60, ceiling=900, target_change=3, initial=300)
+        self.observe(poller, 0, {"ffgr": 80})
+        self.assertEqual(self.observe(poller, 10 * 60, {"ffgr": 0}), 300, msg="Expect the interval to stay until a rate is known.")
+        self.assertIsNone(poller.rate, msg="Expect no rate from samples hours apart.")
@@ -0,0 +1,71 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from ..spool import Spool
+
+
+class TestSpool(TestCase):
+    """
+    Tests related to the durable spool of pending rows.
+    """
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.data_dir)
+        self.rows = [
+            ("visitors_ffgr", ("2023-06-15 10:30", 59)),
+            ("visitors_ffda", ("2023-06-15 10:30", 20)),
+            ("visitors_ffgr", ("2023-06-15 10:35", None)),
+        ]
+
+    def test_append_read_acknowledge(self, *args):
+        """Test that rows are read in order and acknowledged rows are not read again."""
+        spool = Spool(self.data_dir)
+        spool.append(self.rows)
+        self.assertEqual(spool.pending, 3, msg="Expect 3 pending rows.")
+
+        rows, end = spool.read(2)
+        self.assertEqual(rows, self.rows[:2], msg="Expect the oldest rows first.")
+        spool.acknowledge(end)
+        self.assertEqual(spool.pending, 1, msg="Expect 1 pending row after acknowledging 2.")
+
+        rows, end = spool.read(2)
+        self.assertEqual(rows, self.rows[2:], msg="Expect the remaining row.")
+        spool.acknowledge(end)
+
+        self.assertEqual(spool.pending, 0, msg="Expect no pending rows.")
+        self.assertEqual(os.path.getsize(spool.path), 0, msg="Expect the spool to be truncated once everything is acknowledged.")
+        self.assertEqual(spool.read(2), ([], 0), msg="Expect nothing to read.")
+        spool.close()
+
+    def test_replay_after_restart(self, *args):
+        """Test that unacknowledged rows are replayed after a restart."""
+        spool = Spool(self.data_dir)
+        spool.append(self.rows)
+        _, end = spool.read(1)
+        spool.acknowledge(end)
+        spool.close()
+
+        spool = Spool(self.data_dir)
+        self.assertEqual(spool.pending, 2, msg="Expect the unacknowledged rows to be pending after a restart.")
+        rows, _ = spool.read(10)
+        self.assertEqual(rows, self.rows[1:], msg="Expect to continue after the checkpoint.")
+        spool.close()
+
+    def test_recover_torn_row(self, *args):
+        """Test that a row which was only partially written before a crash is cut off."""
+        spool = Spool(self.data_dir)
+        spool.append(self.rows[:1])
+        spool.close()
+
+        with open(spool.path, mode="ab") as spool_file:
+            spool_file.write(b'["visitors_ffgr", ["2023-06')
+
+        spool = Spool(self.data_dir)
+        self.assertEqual(spool.pending, 1, msg="Expect only the complete row to be pending.")
+        spool.append(self.rows[1:2])
+        rows, _ = spool.read(10)
+        self.assertEqual(rows, self.rows[:2], msg="Expect the torn row to be dropped.")
+        spool.close()
@@ -1,12 +1,16 @@
 import unittest
 import os
 import shutil
+import tempfile
 from unittest.mock import patch
 from datetime import datetime
 import time
+import requests
 
+from .. import config
 from .. import constants
 from .. import utils
+from .. import utils_csv
 
 
 @patch("utilities.utils_log.log")
@@ -21,7 +25,12 @@ class TestUtilities(unittest.TestCase):
         Set up before every test by performing some initial setup work.
         """
         self.assertion_count = 0  # Initialize assertion count
-        self.opening_hours = constants.OPENING_HOURS
+
+        # The studio directories are created in a temporary root instead of the repository.
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        previous = config.set_config(config.Config.from_env(root=root))
+        self.addCleanup(config.set_config, previous)
 
         # Check if the './data' and './logs' folders inside the studio short name dir. exist
         if not os.path.exists(constants.LOCATION_DATA_DIR):
@@ -35,11 +44,27 @@ class TestUtilities(unittest.TestCase):
         Test case for the fetch_data function.
         """
         URL = os.getenv("API_URL")
-        with patch("requests.get") as mock_get:
-            mock_get.return_value.json.return_value = {"data": "example data"}
+        with patch("requests.Session.get") as mock_get:
+            mock_get.return_value.status_code = 200
+            mock_get.return_value.headers = {}
+            mock_get.return_value.content = b'{"data": "example data"}'
             res_json = utils.fetch_data(URL)
         self.assertEqual(res_json, {"data": "example data"}, msg="Expect that the fetch_data method returns the parsed json data from the body.")
 
+    @patch("time.sleep")
+    def test_fetch_data_http_error(self, *args):
+        """
+        Test case for the fetch_data function when the request keeps failing.
+        """
+        URL = os.getenv("API_URL")
+        with patch("requests.Session.get") as mock_get:
+            mock_get.return_value.status_code = 404
+            mock_get.return_value.headers = {}
+            mock_get.return_value.raise_for_status.side_effect = requests.HTTPError("404 Client Error")
+            res_json = utils.fetch_data(URL)
+        self.assertIsNone(res_json, msg="Expect that fetch_data returns None instead of parsing an error response.")
+        mock_get.return_value.json.assert_not_called()
+
     def test_check_is_week_day(self, *args):
         """
         Test case to check if the current day is a week day (Monday to Friday).
@@ -108,57 +133,20 @@ class TestUtilities(unittest.TestCase):
         log_message = f"Did not find an existing file for day: {day}, month: {month}, {year}, create a new file."
         patched_log.assert_called_with(log_message)
 
-    def test_check_if_in_opening_hours_week_day(self, *args):
-        """
-        Test case to check if the current time is within the opening hours of the Griesheim gym on weekdays.
-        """
-        open_hour = self.opening_hours["week_day"].get("open")
-        close_hour = self.opening_hours["week_day"].get("close")
-        hours = [open_hour - 1, open_hour, close_hour, close_hour + 1]
-        results = [False, True, False, False]
-        is_week_day = True
-
-        for (hour, result) in zip(hours, results):
-            res = utils.check_if_in_opening_hours(hour, is_week_day=is_week_day)
-            self.assertEqual(res, result, msg="Expect that 'check_if_in_opening_hours' returns the correct values if we're in the opening hours on a weekday.")
-            self.assertion_count += 1
+    def test_visitors_file_of_other_studio(self, *args):
+        """Test that file names and lookups can target another studio's data directory (multi-studio mode)."""
+        now = datetime.now().replace(year=1980)  # Demo year.
+        data_dir, log_dir = constants.get_location_dirs("ffhb")
+        self.assertEqual((data_dir, log_dir), (os.path.join(constants.PATH_TO_ROOT, "ffhb", "data"), os.path.join(constants.PATH_TO_ROOT, "ffhb", "logs")), msg="Expect the directories of the studio.")
 
-        self.assertEqual(self.assertion_count, len(hours), msg=f"Expect {len(hours)} assertions made.")
+        visitor_file_name = utils.construct_visitor_file_name(now, "ffhb")
+        self.assertTrue(visitor_file_name.startswith("visitors-ffhb-"), msg="Expect the studio's short title in the file name.")
 
-    def test_check_if_in_opening_hours_week_end(self, *args):
-        """Test case for checking if the current hour is within the opening hours of the Griesheim gym on weekends."""
-        open_hour = self.opening_hours["week_end"].get("open")
-        close_hour = self.opening_hours["week_end"].get("close")
-        hours = [open_hour - 1, open_hour, close_hour, close_hour + 1]
-        results = [False, True, False, False]
-        is_week_day = False
+        # The data directory is created on the first write.
+        visitor_file_path = os.path.join(data_dir, visitor_file_name)
+        utils_csv.write_to_csv(visitor_file_path, ["timestamp", "visitor_count"], 0, 0)
 
-        for (hour, result) in zip(hours, results):
-            res = utils.check_if_in_opening_hours(hour, is_week_day=is_week_day)
-            self.assertEqual(res, result, msg="Expect that 'check_if_in_opening_hours' returns the correct values if we're in the opening hours on a weekend.")
-            self.assertion_count += 1
+        result = utils.get_today_visitors_file_name_if_it_does_exist(now.year, now.month, now.day, data_dir)
+        self.assertEqual(result, visitor_file_name, msg="Expect to find the file in the provided data directory.")
 
-        self.assertEqual(self.assertion_count, len(hours), msg=f"Expect {len(hours)} assertions made.")
-
-    def test_calculate_sleep_time_in_seconds_for_tomorrow(self, *args):
-        """
-        Test case for the calculate_sleep_time_in_seconds function.
-        Checks if it returns the correct amount of seconds until the opening time tomorrow.
-        """
-        current_time = datetime(year=2023, month=6, day=15, hour=23, minute=34, second=35)
-        amount_of_seconds = utils.calculate_sleep_time_in_seconds(current_time, 8)
-
-        self.assertEqual(amount_of_seconds, 30325, msg="Expect that 'calculate_sleep_time_in_seconds' returns the correct amount of seconds until the opening time tomorrow.")
-
-    def test_calculate_sleep_time_in_seconds_for_today(self, *args):
-        # today
-        current_time = datetime(year=2023, month=6, day=16, hour=3, minute=40, second=55)
-        amount_of_seconds = utils.calculate_sleep_time_in_seconds(current_time, 8)
-
-        self.assertEqual(amount_of_seconds, 15545, msg="Expect that 'calculate_sleep_time_in_seconds' returns the correct amount of seconds until the opening time today.")
-
-        # 5:29 AM and 20 seconds
-        current_time = datetime(year=2023, month=6, day=16, hour=5, minute=29, second=20)
-
-        amount_of_seconds = utils.calculate_sleep_time_in_seconds(current_time, 8)
-        self.assertEqual(amount_of_seconds, 9040, msg="Expect that 'calculate_sleep_time_in_seconds' returns the correct amount of seconds until the opening time today.")
+        os.remove(visitor_file_path)
@@ -0,0 +1,98 @@
+import os
+import shutil
+import tempfile
+from datetime import datetime
+from unittest import TestCase
+
+import numpy as np
+
+from .. import utils_binary
+
+
+class TestBinaryUtils(TestCase):
+    """
+    Tests related to the fixed-width binary sample format.
+    """
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.data_dir)
+
+    def test_construct_binary_file_name(self, *args):
+        """Test that binary segments are named by month."""
+        file_name = utils_binary.construct_binary_file_name(datetime(2023, 6, 17, 20, 0), "ffgr")
+        self.assertEqual(file_name, "visitors-ffgr-2023-06.bin")
+
+    def test_write_and_read_segment(self, *args):
+        """Test that written samples are read back as memory-mapped arrays."""
+        file_path = os.path.join(self.data_dir, "visitors-ffgr-2023-06.bin")
+        writer = utils_binary.BinarySegmentWriter(flush_rows=1)
+        writer.write(file_path, 1686817800, 59)
+        writer.write(file_path, 1686818100, None)
+
+        # Flushed after every row: readable while the segment is still open.
+        timestamps, visitor_counts = utils_binary.read_segment(file_path)
+        self.assertEqual(timestamps.tolist(), [1686817800, 1686818100])
+        self.assertEqual(visitor_counts.tolist(), [59, utils_binary.MISSING_LOAD], msg="Expect a missing load to be stored as MISSING_LOAD.")
+        self.assertIsInstance(timestamps.base, np.memmap, msg="Expect a view into the mapped file instead of a copy.")
+        writer.close()
+
+        self.assertEqual(os.path.getsize(file_path), utils_binary.HEADER.size + 2 * utils_binary.RECORD.size)
+
+    def test_torn_record_is_ignored(self, *args):
+        """Test that a partially written record is skipped by the reader and cut off by the writer."""
+        file_path = os.path.join(self.data_dir, "visitors-ffgr-2023-06.bin")
+        writer = utils_binary.BinarySegmentWriter()
+        writer.write(file_path, 1686817800, 59)
+        writer.close()
+        with open(file_path, "ab") as binary_file:
+            binary_file.write(b"\x01\x02\x03")
+
+        timestamps, _ = utils_binary.read_segment(file_path)
+        self.assertEqual(len(timestamps), 1, msg="Expect the torn record to be ignored.")
+
+        writer.write(file_path, 1686818100, 60)
+        writer.close()
+        timestamps, visitor_counts = utils_binary.read_segment(file_path)
+        self.assertEqual(timestamps.tolist(), [1686817800, 1686818100])
+        self.assertEqual(visitor_counts.tolist(), [59, 60])
+
+    def test_torn_header_is_rewritten(self, *args):
+        """Test that a segment whose header was only partially written is started again."""
+        file_path = os.path.join(self.data_dir, "visitors-ffgr-2023-06.bin")
+        with open(file_path, "wb") as binary_file:
+            binary_file.write(utils_binary.HEADER.pack(utils_binary.MAGIC, utils_binary.VERSION, utils_binary.RECORD.size)[:5])
+
+        writer = utils_binary.BinarySegmentWriter()
+        writer.write(file_path, 1686817800, 59)
+        writer.close()
+
+        timestamps, visitor_counts = utils_binary.read_segment(file_path)
+        self.assertEqual(timestamps.tolist(), [1686817800])
+        self.assertEqual(visitor_counts.tolist(), [59])
+
+    def test_invalid_segment(self, *args):
+        """Test that a file which isn't a binary segment is rejected."""
+        file_path = os.path.join(self.data_dir, "visitors-ffgr-2023-06.bin")
+        with open(file_path, "wb") as binary_file:
+            binary_file.write(b"timestamp,visitor_count\n")
+
+        with self.assertRaises(ValueError):
+            utils_binary.read_segment(file_path)
+
+    def test_load_history(self, *args):
+        """Test that the history spans the monthly segments in order and can be limited to a range."""
+        writer = utils_binary.BinarySegmentWriter()
+        for timestamp, visitor_count in [(1688162400, 3), (1685570400, 1), (1685570700, 2)]:
+            date = datetime.fromtimestamp(timestamp)
+            writer.write(os.path.join(self.data_dir, utils_binary.construct_binary_file_name(date, "ffgr")), timestamp, visitor_count)
+        writer.close()
+
+        timestamps, visitor_counts = utils_binary.load_history(self.data_dir, "ffgr")
+        self.assertEqual(visitor_counts.tolist(), [1, 2, 3], msg="Expect the months in chronological order.")
+
+        timestamps, visitor_counts = utils_binary.load_history(self.data_dir, "ffgr", start=1685570700, end=1688162400)
+        self.assertEqual(timestamps.tolist(), [1685570700])
+
+        timestamps, _ = utils_binary.load_history(self.data_dir, "ffhb")
+        self.assertEqual(len(timestamps), 0, msg="Expect no samples for a location without segments.")
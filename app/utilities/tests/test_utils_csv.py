@@ -2,7 +2,10 @@ from unittest import TestCase
 from unittest.mock import MagicMock, patch
 import os
 import csv
+import shutil
+import tempfile
 from datetime import datetime
+from .. import config
 from .. import constants
 
 from .. import utils_csv
@@ -15,6 +18,13 @@ class TestCSVUtils(TestCase):
     Tests related to CSV tools.
     """
 
+    def setUp(self):
+        # The segments are written to a temporary root instead of the repository.
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        previous = config.set_config(config.Config.from_env(root=root))
+        self.addCleanup(config.set_config, previous)
+
     def test_write_to_csv(self, *args):
         """
         Test case for write_to_csv function.
@@ -36,3 +46,53 @@ class TestCSVUtils(TestCase):
             self.assertEqual(int(data[1][1]), 50, msg="The visitor count should be 50.")
 
         os.remove(custom_file_path)
+
+    def test_segment_writer(self, *args):
+        """
+        Test that the segment writer keeps the file open, writes the header once and rotates segments.
+        """
+        first_path = os.path.join(constants.LOCATION_DATA_DIR, "test-segment-1.csv")
+        second_path = os.path.join(constants.LOCATION_DATA_DIR, "test-segment-2.csv")
+        header = ["timestamp", "visitor_count"]
+
+        writer = utils_csv.CSVSegmentWriter(header, flush_rows=1)
+        with patch("builtins.open", wraps=open) as patched_open:
+            writer.write(first_path, 1000, 50)
+            writer.write(first_path, 1300, 51)
+            self.assertEqual(patched_open.call_count, 1, msg="Expect the segment to be opened only once.")
+
+            # Flushed after every row: readable while the segment is still open.
+            with open(first_path, "r") as csv_file:
+                self.assertEqual(list(csv.reader(csv_file)), [header, ["1000", "50"], ["1300", "51"]])
+
+            writer.write(second_path, 1600, 52)
+        writer.close()
+
+        # Re-opening an existing segment doesn't repeat the header.
+        writer = utils_csv.CSVSegmentWriter(header)
+        writer.write(first_path, 1900, 53)
+        writer.close()
+
+        with open(first_path, "r") as csv_file:
+            self.assertEqual(list(csv.reader(csv_file)), [header, ["1000", "50"], ["1300", "51"], ["1900", "53"]])
+        with open(second_path, "r") as csv_file:
+            self.assertEqual(list(csv.reader(csv_file)), [header, ["1600", "52"]])
+
+        os.remove(first_path)
+        os.remove(second_path)
+
+    def test_segment_writer_flush_policy(self, *args):
+        """
+        Test that rows are buffered until the row count policy triggers a flush.
+        """
+        file_path = os.path.join(constants.LOCATION_DATA_DIR, "test-segment-policy.csv")
+        writer = utils_csv.CSVSegmentWriter(["timestamp", "visitor_count"], flush_rows=3, flush_seconds=0)
+
+        writer.write(file_path, 1000, 50)
+        self.assertEqual(os.path.getsize(file_path), 0, msg="Expect the header and row to be buffered.")
+
+        writer.write(file_path, 1300, 51)
+        self.assertGreater(os.path.getsize(file_path), 0, msg="Expect a flush after 3 rows (header included).")
+
+        writer.close()
+        os.remove(file_path)
@@ -1,7 +1,11 @@
 from unittest import TestCase
 from unittest.mock import patch, MagicMock
 import os
+import shutil
+import tempfile
+from datetime import datetime
 from .. import utils_db
+from ..spool import Spool
 
 
 @patch("utilities.utils_log.log")
@@ -10,69 +14,6 @@ class TestDBUtils(TestCase):
     """Tests related to DB tools"""
 
     # --------------------- FOR DATABASE --------------------- #
-    def test_create_table_if_not_exists(self, *args):
-        """
-        Test if the create_table_if_not_exists method constructs a correct query to execute.
-
-        Args:
-            *args: Variable arguments passed to the test method.
-
-        Raises:
-            AssertionError: If the execute method was not called with the correct arguments or
-                            if the connection commit method was not called.
-
-        """
-        # Create mock cursor and connection
-        mock_cursor = MagicMock()
-        mock_connection = MagicMock()
-
-        # Mock the connection.cursor method to return a mocked context manager.
-        mock_connection.cursor.return_value.__enter__.return_value = mock_cursor
-
-        table_name = "visitors-FFGR"
-        fields = "(timestamp TIMESTAMP, visitor_count INT)"
-        utils_db.create_table_if_not_exists(connection=mock_connection, table_name=table_name, fields=fields)
-
-        # Check if the execute method was called with the correct arguments
-        expected_query = f"CREATE TABLE IF NOT EXISTS {table_name}{fields}"
-        mock_cursor.execute.assert_called_once_with(expected_query)
-
-        # Check if connection commit method was called
-        mock_connection.commit.assert_called_once()
-
-
-    def test_save_to_db(self, *args):
-        """
-        Check if the save_to_db method creates the correct query for the cursor to execute.
-
-        Args:
-            *args: Variable arguments passed to the test method.
-
-        Raises:
-            AssertionError: If the execute method was not called with the correct query and values or
-                            if the connection commit method was not called.
-
-        """
-        mock_cursor = MagicMock()
-        mock_connection = MagicMock()
-
-        # connection.cursor() returns us a context manager.
-        mock_connection.cursor.return_value.__enter__.return_value = mock_cursor
-        table_name = "visitors"
-        timestamp = 1000
-        visitor_count = 59
-
-        fields = "(timestamp TIMESTAMP, visitor_count INT)"
-        utils_db.save_to_db(connection=mock_connection, fields=fields, table_name=table_name, values=(timestamp, visitor_count))
-        expected_query = f"INSERT INTO {table_name} {fields} VALUES(%s, %s)"
-
-        # Check if cursor.execute has correct constructed query in order to insert
-        mock_cursor.execute.assert_called_once_with(expected_query, (timestamp, visitor_count))
-
-        # Check if connection.commit() was called once.
-        mock_connection.commit.assert_called_once()
-    
-    
     def test_check_if_database_exists_true(self, *args):
         """
         Test if a specific database already exists when it does exist.
@@ -107,13 +48,13 @@ class TestDBUtils(TestCase):
         does_exist = utils_db.check_if_database_exists(db_connection=mocked_connection, db_name=db_name)
 
         # Set up the expected query
-        expected_query = f"SELECT datname FROM pg_database WHERE datname = '{db_name.replace('-', '_')}';"
+        expected_query = "SELECT datname FROM pg_database WHERE datname = %s;"
 
         # Check if the cursor was called to create a cursor
         mocked_cursor.assert_called_once()
 
         # Check if the query was executed on the cursor
-        mocked_cursor.return_value.execute.assert_called_once_with(expected_query)
+        mocked_cursor.return_value.execute.assert_called_once_with(expected_query, (db_name.replace('-', '_'),))
 
         # Check if the result was fetched from the cursor
         mocked_cursor.return_value.fetchone.assert_called_once()
@@ -123,3 +64,144 @@ class TestDBUtils(TestCase):
 
         # Assert that the database existence is correctly identified as True
         self.assertTrue(does_exist, msg="Assert database existence correctly identified as True")
+
+
+@patch("utilities.utils_log.log")
+@patch("builtins.print")
+@patch("utilities.utils_db.execute_values")
+class TestBatchWriter(TestCase):
+    """Tests related to the batched database writer"""
+
+    def setUp(self):
+        self.mock_cursor = MagicMock()
+        # Every row of a batch of two is inserted.
+        self.mock_cursor.rowcount = 2
+        self.mock_connection = MagicMock()
+        self.mock_connection.closed = 0
+        self.mock_connection.cursor.return_value.__enter__.return_value = self.mock_cursor
+
+    def test_flush_on_row_count(self, *args):
+        """Test that rows are buffered until the row count limit and then written in one transaction."""
+        patched_execute_values = args[0]
+        writer = utils_db.BatchWriter(self.mock_connection, max_rows=3, max_age=3600)
+
+        writer.add("visitors_ffgr", ("2023-06-15 10:30", 59))
+        writer.add("visitors_ffda", ("2023-06-15 10:30", 20))
+        patched_execute_values.assert_not_called()
+        self.mock_connection.commit.assert_not_called()
+        self.assertEqual(writer.pending, 2, msg="Expect the rows to be buffered.")
+
+        writer.add("visitors_ffgr", ("2023-06-15 10:35", 61))
+
+        # One multi-row INSERT per table, committed once.
+        patched_execute_values.assert_any_call(
+            self.mock_cursor,
+            "INSERT INTO visitors_ffgr (timestamp, visitor_count) VALUES %s ON CONFLICT DO NOTHING",
+            [("2023-06-15 10:30", 59), ("2023-06-15 10:35", 61)],
+            page_size=2
+        )
+        self.assertEqual(patched_execute_values.call_count, 2, msg="Expect one INSERT per table.")
+        self.mock_connection.commit.assert_called_once()
+        self.assertEqual(writer.pending, 0, msg="Expect the buffer to be empty after flushing.")
+        self.assertEqual(writer.rows_written, 3, msg="Expect the written rows to be counted.")
+
+    def test_replayed_rows_are_skipped(self, *args):
+        """Test that rows whose timestamp is already in the table are skipped and not added to the rollups."""
+        patched_execute_values = args[0]
+        patched_execute_values.return_value = [(datetime(2023, 6, 15, 10, 35), 61)]
+        writer = utils_db.BatchWriter(self.mock_connection, max_rows=100, max_age=0, rollups=True)
+
+        with patch("utilities.rollups.upsert") as patched_upsert:
+            writer.add_rows([("visitors_ffgr", ("2023-06-15 10:30", 59)), ("visitors_ffgr", ("2023-06-15 10:35", 61))])
+            writer.flush()
+
+        query = patched_execute_values.call_args.args[1]
+        self.assertTrue(query.endswith("ON CONFLICT DO NOTHING RETURNING timestamp, visitor_count"))
+        self.assertTrue(patched_execute_values.call_args.kwargs["fetch"])
+        patched_upsert.assert_called_once_with(self.mock_cursor, "visitors_ffgr", [(datetime(2023, 6, 15, 10, 35), 61)])
+        self.assertEqual((writer.rows_written, writer.rows_skipped), (2, 1))
+
+    def test_prepare_before_first_write(self, *args):
+        """Test that the tables are prepared once, on the first connection which reaches the database."""
+        prepare = MagicMock(side_effect=[Exception("connection refused"), None])
+        writer = utils_db.BatchWriter(self.mock_connection, max_rows=100, max_age=0, prepare=prepare)
+
+        # The database is down on startup.
+        with self.assertRaises(Exception):
+            writer.prepare_tables()
+        writer.add("visitors_ffgr", ("2023-06-15 10:30", 59))
+        self.assertEqual(writer.pending, 1)
+
+        writer.add("visitors_ffgr", ("2023-06-15 10:35", 61))
+        writer.flush()
+        writer.add("visitors_ffgr", ("2023-06-15 10:40", 62))
+        writer.flush()
+
+        self.assertEqual(prepare.call_count, 2, msg="Expect the tables to be prepared once after the failed attempt.")
+        prepare.assert_called_with(self.mock_connection)
+        self.assertEqual(writer.pending, 0)
+
+    def test_flush_if_due(self, *args):
+        """Test that the age limit triggers a flush and an empty buffer is not committed."""
+        writer = utils_db.BatchWriter(self.mock_connection, max_rows=100, max_age=0)
+
+        writer.flush_if_due()
+        self.mock_connection.commit.assert_not_called()
+
+        writer.add("visitors_ffgr", ("2023-06-15 10:30", 59))
+        writer.flush_if_due()
+        self.mock_connection.commit.assert_called_once()
+
+        writer = utils_db.BatchWriter(self.mock_connection, max_rows=100, max_age=3600)
+        writer.add("visitors_ffgr", ("2023-06-15 10:30", 59))
+        writer.flush_if_due()
+        self.assertEqual(writer.pending, 1, msg="Expect young rows to stay buffered.")
+
+        # Flushed on shutdown.
+        writer.close()
+        self.assertEqual(writer.pending, 0, msg="Expect close to flush the remaining rows.")
+
+    def test_flush_failure_keeps_rows(self, *args):
+        """Test that a failed flush is rolled back and the rows stay buffered."""
+        patched_execute_values = args[0]
+        patched_execute_values.side_effect = Exception("connection lost")
+        writer = utils_db.BatchWriter(self.mock_connection, max_rows=100, max_age=0)
+        writer.add("visitors_ffgr", ("2023-06-15 10:30", 59))
+
+        with self.assertRaises(Exception):
+            writer.flush()
+
+        self.mock_connection.rollback.assert_called_once()
+        self.assertEqual(writer.pending, 1, msg="Expect the rows to be kept for the next flush.")
+
+    def test_spooled_rows_survive_outage(self, *args):
+        """Test that spooled rows stay on disk during an outage and are replayed in batches after a restart."""
+        patched_execute_values = args[0]
+        data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, data_dir)
+
+        # Every flush checks out a connection from the pool.
+        mock_pool = MagicMock()
+        mock_pool.connection.return_value.__enter__.return_value = self.mock_connection
+
+        writer = utils_db.BatchWriter(max_rows=2, max_age=0, spool=Spool(data_dir), pool=mock_pool)
+
+        # The database goes away.
+        patched_execute_values.side_effect = Exception("server closed the connection unexpectedly")
+        with self.assertRaises(Exception):
+            writer.add_rows([("visitors_ffgr", ("2023-06-15 10:30", 59)), ("visitors_ffgr", ("2023-06-15 10:35", 61))])
+        self.assertEqual(writer.pending, 2, msg="Expect the rows to stay in the spool.")
+
+        # The process restarts and the database is back: the rows are replayed from disk.
+        writer.spool.close()
+        patched_execute_values.side_effect = None
+        patched_execute_values.reset_mock()
+        writer = utils_db.BatchWriter(max_rows=2, max_age=0, spool=Spool(data_dir), pool=mock_pool)
+        writer.add("visitors_ffda", ("2023-06-15 10:40", 20))
+        writer.flush_if_due()
+
+        self.assertEqual(writer.pending, 0, msg="Expect every row to be written.")
+        self.assertEqual(writer.rows_written, 3, msg="Expect the spooled rows and the new row to be written.")
+        self.assertEqual(patched_execute_values.call_count, 2, msg="Expect two batches of at most 2 rows.")
+        self.assertEqual(os.path.getsize(writer.spool.path), 0, msg="Expect the spool to be truncated once everything is written.")
+        writer.spool.close()
@@ -1,7 +1,11 @@
 import os
+import gzip
+import shutil
+import tempfile
 from unittest import TestCase
 from unittest.mock import patch
 
+from .. import config
 from .. import constants
 from .. import utils_log
 
@@ -20,8 +24,9 @@ class TestLogUtils(TestCase):
         custom_log_file_path = os.path.join(constants.LOCATION_LOG_DIR, "error.log")
         error_message = "Error."
 
-        # Call the log function with custom log file path
+        # Call the log function with custom log file path and wait for the writer thread
         utils_log.log(error_message, custom_log_file_path)
+        utils_log.flush()
 
         # Check if log writes to file
         self.assertTrue(os.path.exists(custom_log_file_path), msg="Expect that the log file was created.")
@@ -43,8 +48,9 @@ class TestLogUtils(TestCase):
         # Set up
         log_message = "Error."
 
-        # Call the log function without specifying log file path
+        # Call the log function without specifying log file path and wait for the writer thread
         utils_log.log(log_message)
+        utils_log.flush()
 
         # Check if the error log file is not created
         self.assertFalse(os.path.exists(os.path.join(constants.LOCATION_LOG_DIR, "error.log")), msg="Expect that the error file was not created when not log_file_path was provided.")
@@ -57,3 +63,120 @@ class TestLogUtils(TestCase):
     # - Each test case verifies a specific aspect of the log function's behavior.
     # - Test case 1 checks if the log function writes the error message to the specified custom log file path.
     # - Test case 2 checks if the log function creates the error log file when no file path is provided.
+
+
+class TestQueueLogger(TestCase):
+    """
+    Tests related to the queue-based background logger.
+    """
+
+    def setUp(self):
+        self.log_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.log_dir)
+        self.log_file_path = os.path.join(self.log_dir, "test.log")
+
+    def create_logger(self, **kwargs):
+        """Create a logger which doesn't print to the console."""
+        logger = utils_log.QueueLogger(console=False, **kwargs)
+        self.addCleanup(logger.close)
+        return logger
+
+    def read_log(self) -> list:
+        with open(self.log_file_path, "r") as log_file:
+            return log_file.read().splitlines()
+
+    def test_levels(self, *args):
+        """Test that messages below the level are dropped and other levels are named."""
+        logger = self.create_logger(level=utils_log.INFO)
+        logger.log("Details.", self.log_file_path, level=utils_log.DEBUG)
+        logger.log("Fetched.", self.log_file_path)
+        logger.log("Failed.", self.log_file_path, level=utils_log.ERROR)
+        logger.flush()
+
+        lines = self.read_log()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[0].startswith("Timestamp ") and lines[0].endswith(": Fetched."), msg="Expect the format of INFO messages to be unchanged.")
+        self.assertTrue(lines[1].endswith(": ERROR: Failed."))
+
+    def test_rate_limit(self, *args):
+        """Test that similar messages beyond the limit are suppressed and summarized after the window."""
+        logger = self.create_logger(rate_limit=2, rate_window=3600)
+        for attempt in range(5):
+            logger.log(f"Request attempt {attempt} failed.", self.log_file_path)
+        logger.log("Request failed for good.", self.log_file_path, level=utils_log.ERROR)
+        logger.flush()
+        self.assertEqual(len(self.read_log()), 3, msg="Expect two similar messages and the error.")
+
+        # The next window starts with a summary of the suppressed messages.
+        logger.rate_limiter.window = 0
+        logger.log("Request attempt 6 failed.", self.log_file_path)
+        logger.flush()
+        self.assertIn("Suppressed 3 messages similar to: Request attempt 6 failed.", self.read_log()[-2])
+
+    def test_rate_limit_prunes_windows(self, *args):
+        """Test that the windows of messages which are not logged anymore are dropped."""
+        limiter = utils_log._RateLimiter(limit=1, window=60)
+        with patch("time.monotonic", return_value=0):
+            limiter.check("Fetched studio 1.", self.log_file_path, 1)
+            limiter.check("Skipped the tick.", self.log_file_path, 1)
+            limiter.check("Skipped the tick.", self.log_file_path, 1)
+        with patch("time.monotonic", return_value=90):
+            limiter.check("Closed.", self.log_file_path, 1)
+        self.assertEqual(len(limiter._windows), 2, msg="Expect the window with suppressed messages to be kept for its summary.")
+
+        with patch("time.monotonic", return_value=180):
+            limiter.check("Closed.", self.log_file_path, 1)
+        self.assertEqual(len(limiter._windows), 1)
+
+    def test_sampling(self, *args):
+        """Test that only every n-th similar message is logged."""
+        logger = self.create_logger()
+        for load in range(10):
+            logger.log(f"Current load: {load}.", self.log_file_path, sample=5)
+        logger.flush()
+
+        lines = self.read_log()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[1].endswith("Current load: 5."))
+
+    def test_record(self, *args):
+        """Test that records are written as plain JSON lines and are not rate limited."""
+        logger = self.create_logger(rate_limit=1)
+        for tick in range(3):
+            logger.record({"tick": tick, "stages_ms": {"fetch": 1.5}}, self.log_file_path)
+        logger.flush()
+
+        self.assertEqual(self.read_log(), [f'{{"tick":{tick},"stages_ms":{{"fetch":1.5}}}}' for tick in range(3)])
+
+    def test_rotation(self, *args):
+        """Test that a full log file is compressed and only the newest backups are kept."""
+        logger = self.create_logger(max_bytes=200, backup_count=2, rate_limit=1000)
+        for index in range(30):
+            logger.log(f"Message number {index:04d}.", self.log_file_path)
+        logger.flush()
+
+        backups = sorted(file_name for file_name in os.listdir(self.log_dir) if file_name.endswith(".gz"))
+        self.assertEqual(len(backups), 2, msg="Expect the oldest backups to be removed.")
+        self.assertLessEqual(os.path.getsize(self.log_file_path), 200)
+        with gzip.open(os.path.join(self.log_dir, backups[-1]), "rt") as backup:
+            self.assertIn("Message number", backup.read())
+
+    def test_full_queue_drops_messages(self, *args):
+        """Test that the caller is never blocked by a full queue."""
+        logger = self.create_logger(queue_size=1, rate_limit=1000)
+        with patch.object(logger, "_ensure_thread"):
+            # Without a writer thread the queue stays full.
+            logger.log("First.", self.log_file_path)
+            logger.log("Second.", self.log_file_path)
+        self.assertEqual(logger.dropped, 1)
+        logger.flush()
+
+    def test_settings_of_the_active_config(self, *args):
+        """Test that the settings are read from the active configuration when the logger is first used."""
+        logger = self.create_logger()
+        previous = config.set_config(config.Config({"LOG_LEVEL": "warning", "LOG_RATE_LIMIT": "1", "LOG_QUEUE_SIZE": "oops"}))
+        self.addCleanup(config.set_config, previous)
+
+        logger.log("Fetched.", self.log_file_path)
+        self.assertEqual((logger.level, logger.rate_limiter.limit), (utils_log.WARNING, 1))
+        self.assertEqual(logger._queue.maxsize, 10000, msg="Expect the default of an invalid value.")
@@ -1,10 +1,27 @@
 import os
+import time
 import requests
-from datetime import datetime
+from datetime import date, datetime
 from . import constants
+from . import manifest
+from . import metrics
 from . import utils_log
+from .http_client import HttpClient
 
-def fetch_data(url: str) -> dict:
+# Shared client, keeps the connection to the API alive between ticks.
+http_client = None
+
+
+def get_http_client() -> HttpClient:
+    """
+    Return the shared HTTP client and create it on first use.
+    """
+    global http_client
+    if http_client is None:
+        http_client = HttpClient()
+    return http_client
+
+def fetch_data(url: str):
     """
     Make an API request to fetch studio data.
 
@@ -12,17 +29,22 @@ def fetch_data(url: str) -> dict:
         url (str): The URL of the API endpoint.
 
     Returns:
-        dict: The JSON response from the API.
-
-    Raises:
-        requests.HTTPError: If an HTTP error occurs during the request.
+        The JSON response from the API, or None if the request failed after all retries.
     """
+    client = get_http_client()
+    log_file_path = os.path.join(constants.LOCATION_LOG_DIR, "requests.log")
+    start = time.perf_counter()
     try:
-        response = requests.get(url=url, headers={'Accept': 'application/json'})
-        response.raise_for_status()
-    except requests.HTTPError as e:
-        utils_log.log(file_path=os.path.join(constants.LOCATION_LOG_DIR, "requests.log"), message=str(e))
-    return response.json()
+        response_json = client.get_json(url)
+    except (requests.RequestException, ValueError) as e:
+        metrics.fetch_failures_total.inc()
+        utils_log.log(file_path=log_file_path, message=str(e))
+        return None
+    finally:
+        metrics.fetch_seconds.observe(time.perf_counter() - start)
+
+    utils_log.log(file_path=log_file_path, message=f"Fetched {url} in {client.last_latency * 1000:.1f} ms.")
+    return response_json
 
 def check_is_week_day(current_day: int) -> bool:
     """
@@ -40,58 +62,39 @@ def check_is_week_day(current_day: int) -> bool:
 
     return 0 <= current_day <= 4
 
-def check_if_in_opening_hours(current_time: int, is_week_day: bool) -> bool:
+def get_today_visitors_file_name_if_it_does_exist(year: int, month: int, day: int, data_dir: str = None):
     """
-    Check if the current time falls within the opening hours of the studio.
+    Check if a visitors file for the provided day exists in the data directory.
+
+    The lookup goes through the manifest of the data directory instead of listing the directory.
 
     Args:
-        current_time (int): The current time represented as an integer (24-hour format).
-        is_week_day (bool): A boolean indicating whether it is a weekday or weekend.
+        year (int): The year to look for.
+        month (int): The month to look for.
+        day (int): The day to look for.
+        data_dir (str, optional): The directory to search. Defaults to the tracked studio's data directory.
 
     Returns:
-        bool: True if the current time falls within the opening hours, False otherwise.
+        str: The file name of the latest segment of the day, None if there is none.
     """
-    opening_hours = constants.OPENING_HOURS["week_day" if is_week_day else "week_end"]
-    studio_open = opening_hours.get("open")
-    studio_close = opening_hours.get("close")
-
-    return studio_open <= current_time < studio_close
+    file_name = manifest.get_manifest(data_dir).get_segment(date(year, month, day))
+    if file_name is not None:
+        utils_log.log(f"Found an existing file, continue writing there: {file_name}.")
+        return file_name
 
-def get_today_visitors_file_name_if_it_does_exist(year: int, month: int, day: int):
-    """
-    Check if the visitors file for the provided month and day exists in the current directory.
-    """
-    # e.g. fixed pattern: 
-    # day: index 14 start
-    # visitors-FFGR-17-06-2023-20-00.csv
+    # No match found
     day = f"0{day}" if day < 10 else str(day)
     month = f"0{month}" if month < 10 else str(month)
-    year = str(year)
-
-    file_names = os.listdir(constants.LOCATION_DATA_DIR)
-    for file_name in file_names:
-        # (16 not included)
-        split_file_name = file_name.split("-")
-
-        file_name_day = split_file_name[2]
-        file_name_month = split_file_name[3]
-        file_name_year = split_file_name[4]
-
-        utils_log.log(file_name)
-        if file_name_day == day and file_name_month == month and file_name_year == year:
-            utils_log.log(f"Found an existing file, continue writing there: {file_name}.")
-            return file_name
-
-    # No match found
     utils_log.log(f"Did not find an existing file for day: {day}, month: {month}, {year}, create a new file.")
     return None 
 
-def construct_visitor_file_name(date: datetime) -> str:
+def construct_visitor_file_name(date: datetime, location_short_title: str = None) -> str:
     """
     Construct a file name for storing visitor data.
 
     Args:
         date (datetime): The current date and time.
+        location_short_title (str, optional): The studio's short title. Defaults to the tracked studio.
 
     Returns:
         str: The constructed file name.
@@ -99,41 +102,4 @@ def construct_visitor_file_name(date: datetime) -> str:
     timestamp = date.strftime("%d-%m-%Y-%H-%M")
 
     # Generate a new filename with the timestamp
-    return f"visitors-{constants.LOCATION_SHORT_TITLE}-{timestamp}.csv"
-
-def calculate_sleep_time_in_seconds(date: datetime, opening_hour: int):
-    """
-    Calculate the number of seconds to sleep until the next day's opening time.
-
-    Args:
-        date (datetime): The current date and time.
-        opening_hour (int): The hour representing the opening time of the next day.
-
-    Returns:
-        int: The number of seconds to sleep until the next day's opening time.
-    """
-    # Determine if it is tomorrow based on the current time and the opening hour
-    tomorrow = date.hour >= opening_hour
-
-    # Calculate the number of hours to sleep until the next day's opening time
-    hours_to_sleep = opening_hour + (24 - (date.hour + 1))
-    if not tomorrow:
-        # If it's not tomorrow, adjust the hours to sleep
-        # Calculate the time until it is opening hours
-        # e.g. opens at 8am, and it is not 3:34 am 
-        # 8 - 4 =  hours until 7:34
-        hours_to_sleep = opening_hour - (date.hour + 1)
-    
-    # Calculate the number of minutes to sleep, accounting for the missing minutes in the previous calculation
-    minutes_to_sleep = 60 - (date.minute + 1)
-    
-    # Calculate the total number of minutes to sleep
-    total_minutes_to_sleep = (hours_to_sleep * 60) + minutes_to_sleep
-    
-    # Calculate the number of seconds to sleep, accounting for the missing seconds in the previous calculation
-    seconds_to_sleep = 60 - date.second
-
-    # Convert the total minutes to sleep to seconds
-    sleep_time_in_seconds = (total_minutes_to_sleep * 60) + seconds_to_sleep
-    
-    return sleep_time_in_seconds
+    return f"visitors-{location_short_title or constants.LOCATION_SHORT_TITLE}-{timestamp}.csv"
@@ -0,0 +1,218 @@
+"""Utilities related to the fixed-width binary sample format."""
+import os
+import time
+import struct
+from datetime import datetime
+
+import numpy as np
+
+from . import constants
+
+# File header: magic, format version and record size in bytes.
+MAGIC = b"FFVS"
+VERSION = 1
+HEADER = struct.Struct("<4sHH")
+
+# One sample: epoch timestamp (int64) and visitor count (int16), little endian and packed.
+RECORD = struct.Struct("<qh")
+DTYPE = np.dtype([("timestamp", "<i8"), ("visitor_count", "<i2")])
+
+# Stored for samples without a load, e.g. when the API omitted the field.
+MISSING_LOAD = -1
+
+
+def construct_binary_file_name(date: datetime, location_short_title: str = None) -> str:
+    """
+    Construct the file name of the binary segment of a month.
+
+    Args:
+        date (datetime): Any date within the month.
+        location_short_title (str, optional): The location short title. Defaults to LOCATION_SHORT_TITLE.
+
+    Returns:
+        str: The file name, e.g. "visitors-ffgr-2023-06.bin".
+    """
+    location_short_title = location_short_title or constants.LOCATION_SHORT_TITLE
+    return f"visitors-{location_short_title}-{date.year}-{date.month:02d}.bin"
+
+
+def read_header(file_path: str) -> int:
+    """
+    Validate the header of a binary segment and return the number of complete records.
+
+    Args:
+        file_path (str): The path to the segment.
+
+    Returns:
+        int: The number of complete records, a torn trailing record is ignored.
+
+    Raises:
+        ValueError: If the file is not a binary segment of a supported version.
+    """
+    with open(file_path, mode="rb") as binary_file:
+        header = binary_file.read(HEADER.size)
+    if len(header) != HEADER.size:
+        raise ValueError(f"{file_path} is too short to be a binary segment.")
+
+    magic, version, record_size = HEADER.unpack(header)
+    if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+        raise ValueError(f"{file_path} is not a binary segment of version {VERSION}.")
+    return (os.path.getsize(file_path) - HEADER.size) // RECORD.size
+
+
+def read_segment(file_path: str) -> tuple:
+    """
+    Memory-map a binary segment.
+
+    The returned arrays are read-only views into the mapped file, nothing is parsed or copied.
+
+    Args:
+        file_path (str): The path to the segment.
+
+    Returns:
+        tuple: The timestamps (int64) and visitor counts (int16) as NumPy arrays.
+
+    Raises:
+        ValueError: If the file is not a binary segment of a supported version.
+    """
+    count = read_header(file_path)
+    if count == 0:
+        # An empty file region cannot be mapped.
+        return np.empty(0, dtype=DTYPE["timestamp"]), np.empty(0, dtype=DTYPE["visitor_count"])
+
+    records = np.memmap(file_path, dtype=DTYPE, mode="r", offset=HEADER.size, shape=(count,))
+    return records["timestamp"], records["visitor_count"]
+
+
+def load_history(data_dir: str = None, location_short_title: str = None, start: int = None, end: int = None) -> tuple:
+    """
+    Load the samples of every binary segment of a location, optionally limited to a time range.
+
+    Args:
+        data_dir (str, optional): The data directory. Defaults to LOCATION_DATA_DIR.
+        location_short_title (str, optional): The location short title. Defaults to LOCATION_SHORT_TITLE.
+        start (int, optional): The first epoch timestamp to include.
+        end (int, optional): The epoch timestamp to stop before.
+
+    Returns:
+        tuple: The timestamps and visitor counts as NumPy arrays in chronological order.
+    """
+    data_dir = data_dir or constants.LOCATION_DATA_DIR
+    prefix = f"visitors-{location_short_title or constants.LOCATION_SHORT_TITLE}-"
+
+    # "yyyy-mm" in the file names sorts chronologically.
+    if not os.path.isdir(data_dir):
+        # Nothing was written yet.
+        return np.empty(0, dtype="<i8"), np.empty(0, dtype="<i2")
+    file_names = sorted(file_name for file_name in os.listdir(data_dir) if file_name.startswith(prefix) and file_name.endswith(".bin"))
+
+    timestamps, visitor_counts = [], []
+    for file_name in file_names:
+        segment_timestamps, segment_visitor_counts = read_segment(os.path.join(data_dir, file_name))
+        if start is not None or end is not None:
+            # Samples are appended in order, so the range is found by binary search.
+            lower = np.searchsorted(segment_timestamps, start, side="left") if start is not None else 0
+            upper = np.searchsorted(segment_timestamps, end, side="left") if end is not None else len(segment_timestamps)
+            segment_timestamps, segment_visitor_counts = segment_timestamps[lower:upper], segment_visitor_counts[lower:upper]
+        timestamps.append(segment_timestamps)
+        visitor_counts.append(segment_visitor_counts)
+
+    if not timestamps:
+        return np.empty(0, dtype=DTYPE["timestamp"]), np.empty(0, dtype=DTYPE["visitor_count"])
+    if len(timestamps) == 1:
+        return timestamps[0], visitor_counts[0]
+    return np.concatenate(timestamps), np.concatenate(visitor_counts)
+
+
+class BinarySegmentWriter:
+    """
+    Long-lived writer which appends fixed-width records to the binary segment of the month.
+
+    Has the same interface as CSVSegmentWriter. A record is 10 bytes and needs no formatting, the segment can be
+    read with read_segment without parsing.
+
+    Example:
+        writer = BinarySegmentWriter()
+        writer.write(file_path, 1686817800, 59)
+        ...
+        writer.close()
+    """
+
+    def __init__(self, flush_rows: int = None, flush_seconds: float = None):
+        """
+        Args:
+            flush_rows (int, optional): Flush after this many rows. Defaults to CSV_FLUSH_ROWS.
+            flush_seconds (float, optional): Flush once the oldest unflushed row is this old (checked on write).
+                Defaults to CSV_FLUSH_SECONDS, 0 disables the time policy.
+        """
+        self.flush_rows = flush_rows if flush_rows is not None else constants.CSV_FLUSH_ROWS
+        self.flush_seconds = flush_seconds if flush_seconds is not None else constants.CSV_FLUSH_SECONDS
+
+        self.file_path = None
+        self._file = None
+        self._unflushed = 0
+        self._oldest_unflushed = None
+
+    def rotate(self, file_path: str):
+        """
+        Close the current segment and open the given one for appending.
+
+        Args:
+            file_path (str): The path to the new segment.
+
+        Raises:
+            ValueError: If the existing file is not a binary segment of a supported version.
+        """
+        self.close()
+        os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+        self._file = open(file_path, mode="ab")
+        self.file_path = file_path
+
+        if self._file.tell() < HEADER.size:
+            # A new segment, or a torn header when the process died while creating it.
+            self._file.truncate(0)
+            self._file.write(HEADER.pack(MAGIC, VERSION, RECORD.size))
+            self._unflushed += 1
+        else:
+            # Cut off a torn record, e.g. when the process died in the middle of a write.
+            count = read_header(file_path)
+            self._file.truncate(HEADER.size + count * RECORD.size)
+
+    def write(self, file_path: str, timestamp: int, visitor_count: int):
+        """
+        Append a sample, rotating to the given segment first if it is not the open one.
+
+        Args:
+            file_path (str): The path to the segment.
+            timestamp (int): The epoch timestamp.
+            visitor_count (int): The visitor count, None is stored as MISSING_LOAD.
+        """
+        if file_path != self.file_path:
+            self.rotate(file_path)
+
+        self._file.write(RECORD.pack(timestamp, MISSING_LOAD if visitor_count is None else visitor_count))
+        self._unflushed += 1
+        now = time.monotonic()
+        if self._oldest_unflushed is None:
+            self._oldest_unflushed = now
+
+        if self._unflushed >= self.flush_rows or (self.flush_seconds and now - self._oldest_unflushed >= self.flush_seconds):
+            self.flush()
+
+    def flush(self):
+        """
+        Flush the buffered records of the open segment.
+        """
+        if self._file is not None:
+            self._file.flush()
+        self._unflushed = 0
+        self._oldest_unflushed = None
+
+    def close(self):
+        """
+        Flush and close the open segment.
+        """
+        if self._file is not None:
+            self.flush()
+            self._file.close()
+        self._file = self.file_path = None
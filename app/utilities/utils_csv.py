@@ -1,6 +1,8 @@
 """Utilities related to working with CSV I/O operations."""
 import os
 import csv
+import time
+from . import constants
 
 
 def write_to_csv(file_path: str, header: list, *args):
@@ -16,9 +18,99 @@ def write_to_csv(file_path: str, header: list, *args):
         The CSV file is opened in append mode.
 
     """
+    os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
     with open(file_path, mode="a", newline='') as csv_file:
         csv_writer = csv.writer(csv_file, delimiter=',')
         if os.path.getsize(filename=file_path) == 0:
             csv_writer.writerow(header)
         csv_writer.writerow(args)
 
+
+class CSVSegmentWriter:
+    """
+    Long-lived writer which keeps the current CSV segment open between rows.
+
+    Whether the segment needs a header is decided once when it is opened and tracked in memory afterwards, so
+    writing a row costs no open/stat/close calls. The segment is flushed every flush_rows rows or once the
+    oldest unflushed row is flush_seconds old, and rotated when rows are written to another file.
+
+    Example:
+        writer = CSVSegmentWriter(["timestamp", "visitor_count"])
+        writer.write(file_path, 1686817800, 59)
+        ...
+        writer.close()
+    """
+
+    def __init__(self, header: list, flush_rows: int = None, flush_seconds: float = None):
+        """
+        Args:
+            header (list): The header row of every segment.
+            flush_rows (int, optional): Flush after this many rows. Defaults to CSV_FLUSH_ROWS.
+            flush_seconds (float, optional): Flush once the oldest unflushed row is this old (checked on write).
+                Defaults to CSV_FLUSH_SECONDS, 0 disables the time policy.
+        """
+        self.header = header
+        self.flush_rows = flush_rows if flush_rows is not None else constants.CSV_FLUSH_ROWS
+        self.flush_seconds = flush_seconds if flush_seconds is not None else constants.CSV_FLUSH_SECONDS
+
+        self.file_path = None
+        self._file = None
+        self._csv_writer = None
+        self._unflushed = 0
+        self._oldest_unflushed = None
+
+    def rotate(self, file_path: str):
+        """
+        Close the current segment and open the given one in append mode.
+
+        Args:
+            file_path (str): The path to the new segment.
+        """
+        self.close()
+        os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+        self._file = open(file_path, mode="a", newline='')
+        self._csv_writer = csv.writer(self._file, delimiter=',')
+        self.file_path = file_path
+
+        # Decide once whether the header is needed (new or empty segment).
+        if self._file.tell() == 0:
+            self._csv_writer.writerow(self.header)
+            self._unflushed += 1
+
+    def write(self, file_path: str, *args):
+        """
+        Write a row, rotating to the given segment first if it is not the open one.
+
+        Args:
+            file_path (str): The path to the segment.
+            *args: The values of the row.
+        """
+        if file_path != self.file_path:
+            self.rotate(file_path)
+
+        self._csv_writer.writerow(args)
+        self._unflushed += 1
+        now = time.monotonic()
+        if self._oldest_unflushed is None:
+            self._oldest_unflushed = now
+
+        if self._unflushed >= self.flush_rows or (self.flush_seconds and now - self._oldest_unflushed >= self.flush_seconds):
+            self.flush()
+
+    def flush(self):
+        """
+        Flush the buffered rows of the open segment.
+        """
+        if self._file is not None:
+            self._file.flush()
+        self._unflushed = 0
+        self._oldest_unflushed = None
+
+    def close(self):
+        """
+        Flush and close the open segment.
+        """
+        if self._file is not None:
+            self.flush()
+            self._file.close()
+        self._file = self._csv_writer = self.file_path = None
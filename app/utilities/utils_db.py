@@ -1,56 +1,14 @@
 import os
+import time
+import threading
+from psycopg2.extras import execute_values
 from . import utils_log
 from . import constants
+from . import metrics
+from . import rollups
 
 """Utilities related to working with PostgreSQL database."""
 
-def create_table_if_not_exists(connection, table_name, fields):
-    """
-    Create a table with the specified table name and fields.
-
-    Args:
-        connection (psycopg2.extensions.connection): The database connection.
-        table_name (str): The name of the table to create.
-        fields (str): The fields and their data types for the table.
-
-    Example:
-        create_table_if_not_exists(connection, 'employee', '''
-            (
-                EmployeeID int, 
-                name varchar(40) NOT NULL, 
-                salary int, 
-                dept_id varchar(30)
-            )
-        ''')
-    """
-    with connection.cursor() as cursor:
-        query = f'''CREATE TABLE IF NOT EXISTS {table_name}{fields}'''
-        cursor.execute(query)
-        utils_log.log("Creating a new table if it doesn't exist.", os.path.join(constants.LOCATION_LOG_DIR, "db.log"))
-        connection.commit()
-
-def save_to_db(connection, table_name, fields, values):
-    """
-    Save entries to the specified table with the given values.
-
-    Args:
-        connection (psycopg2.extensions.connection): The database connection.
-        table_name (str): The name of the table to insert the values into.
-        values (tuple): The values to be inserted into the table.
-
-    Example:
-        save_to_db(connection, 'employee', (1, "John", 50000, 'D1'))
-    """
-    # Use a context manager to automatically close the cursor after execution
-    with connection.cursor() as cursor:
-        # Note: 
-        # When you pass an integer value as a parameter using %s in a formatted string and then save it to the database,
-        # the integer value will be properly stored in the corresponding integer column in the database.
-        query = f"INSERT INTO {table_name} {fields} VALUES(%s, %s)"
-        cursor.execute(query, values)
-        connection.commit()
-        utils_log.log(f"Successfully saved data into {table_name} with fields: '${fields}'.", os.path.join(constants.LOCATION_LOG_DIR, "db.log"))
-
 def check_if_database_exists(db_connection, db_name: str) -> bool:
     """
     Check if the specific database already exists in the PostgreSQL instance.
@@ -60,14 +18,14 @@ def check_if_database_exists(db_connection, db_name: str) -> bool:
     :return: True if the database exists, False otherwise.
     """
     
-    # Construct the query to check if the database exists
-    query = f"SELECT datname FROM pg_database WHERE datname = '{db_name.replace('-', '_')}';"
+    # Construct the query to check if the database exists, the name is passed as a parameter
+    query = "SELECT datname FROM pg_database WHERE datname = %s;"
     
     # Create a cursor object to execute the query
     cursor = db_connection.cursor()
     
     # Execute the query
-    cursor.execute(query)
+    cursor.execute(query, (db_name.replace('-', '_'),))
     
     # Fetch the result (one row)
     db_does_exist = cursor.fetchone()
@@ -77,3 +35,242 @@ def check_if_database_exists(db_connection, db_name: str) -> bool:
     
     # Return True if a row is fetched (database exists), False otherwise
     return True if db_does_exist else False
+
+
+class BatchWriter:
+    """
+    Buffer rows and write them to the database in batches instead of committing every row.
+
+    Rows are grouped per table and written with one multi-row INSERT (execute_values) per table, all in a single
+    transaction, once DB_FLUSH_ROWS rows are buffered or the oldest row is DB_FLUSH_SECONDS old.
+
+    With a spool the rows are buffered on disk instead of in memory: they survive a database outage or a restart
+    and are replayed in batches of DB_FLUSH_ROWS rows once the database is reachable again. With a connection pool
+    every flush checks out a live connection, so a database restart is recovered from transparently.
+
+    With rollups the rollup tables of every table are upserted in the same transaction as the raw rows.
+
+    With prepare the tables are created (or migrated) on the first connection, so the worker can start spooling
+    while the database is down.
+
+    Rows are inserted with ON CONFLICT DO NOTHING, a timestamp which is already in the table (e.g. a batch which
+    was committed but not acknowledged in the spool before a crash) is skipped. With rollups only the inserted rows
+    are added, so replays don't count a sample twice.
+
+    Example:
+        writer = BatchWriter(pool=pool, spool=Spool())
+        writer.add("visitors_ffgr", ("2023-06-15 10:30", 59))
+        writer.flush_if_due()
+        ...
+        writer.close()  # Flush the remaining rows on shutdown.
+    """
+
+    def __init__(self, connection=None, fields: str = "(timestamp, visitor_count)", max_rows: int = None, max_age: float = None,
+                 spool=None, pool=None, rollups: bool = False, prepare=None):
+        """
+        Args:
+            connection (psycopg2.extensions.connection, optional): The database connection, if no pool is used.
+            fields (str, optional): The columns the rows are inserted into. Defaults to "(timestamp, visitor_count)".
+            max_rows (int, optional): Flush once this many rows are buffered. Defaults to DB_FLUSH_ROWS.
+            max_age (float, optional): Flush once the oldest row is this many seconds old. Defaults to DB_FLUSH_SECONDS.
+            spool (spool.Spool, optional): Durable buffer of the rows. Defaults to an in-memory buffer.
+            pool (db_connect.ConnectionPool, optional): The pool to check out a connection from for every flush.
+            rollups (bool, optional): Maintain the rollup tables of the (timestamp, visitor_count) rows. Defaults to False.
+            prepare (callable, optional): Creates or migrates the tables on a connection, called once before the
+                first write. Defaults to none, the tables exist.
+        """
+        self.connection = connection
+        self.fields = fields
+        self.max_rows = max_rows if max_rows is not None else constants.DB_FLUSH_ROWS
+        self.max_age = max_age if max_age is not None else constants.DB_FLUSH_SECONDS
+        self.spool = spool
+        self.pool = pool
+        self.rollups = rollups
+        self.prepare = prepare
+        self._prepared = prepare is None
+        self.log_file_path = os.path.join(constants.LOCATION_LOG_DIR, "db.log")
+
+        self._rows = {}  # table_name -> buffered rows
+        self._row_count = 0
+        self._oldest = None  # Monotonic time of the oldest buffered row.
+        self._queries = {}  # table_name -> INSERT statement, built once per table.
+        self._lock = threading.Lock()
+
+        # Rows left over in the spool (e.g. from before a restart) are replayed on the first flush.
+        if self.spool is not None and self.spool.pending:
+            self._oldest = time.monotonic()
+
+        # Throughput statistics.
+        self.rows_written = 0
+        self.rows_skipped = 0  # Rows whose timestamp was already in the table.
+        self.flush_count = 0
+        self.flush_seconds = 0.0
+
+    @property
+    def pending(self) -> int:
+        """The number of buffered rows."""
+        return self.spool.pending if self.spool is not None else self._row_count
+
+    @property
+    def rows_per_second(self) -> float:
+        """The number of rows written per second spent flushing."""
+        return self.rows_written / self.flush_seconds if self.flush_seconds else 0.0
+
+    def add(self, table_name: str, values: tuple):
+        """
+        Buffer a row and flush if the row count limit is reached.
+
+        Args:
+            table_name (str): The name of the table to insert the values into.
+            values (tuple): The values to be inserted into the table.
+        """
+        self.add_rows([(table_name, values)])
+
+    def add_rows(self, rows: list):
+        """
+        Buffer several rows at once (a single write to the spool) and flush if the row count limit is reached.
+
+        Args:
+            rows (list): The rows as (table_name, values) tuples.
+        """
+        with self._lock:
+            if self.spool is not None:
+                self.spool.append(rows)
+            else:
+                for table_name, values in rows:
+                    self._rows.setdefault(table_name, []).append(values)
+                self._row_count += len(rows)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+        if self.pending >= self.max_rows:
+            self.flush()
+
+    def flush_if_due(self):
+        """
+        Flush if the oldest buffered row reached the maximum age.
+        """
+        if self._oldest is not None and time.monotonic() - self._oldest >= self.max_age:
+            self.flush()
+
+    def _query(self, table_name: str) -> str:
+        """Return the (cached) INSERT statement of the table."""
+        query = self._queries.get(table_name)
+        if query is None:
+            query = f"INSERT INTO {table_name} {self.fields} VALUES %s ON CONFLICT DO NOTHING"
+            if self.rollups:
+                # Only the inserted rows are added to the rollups.
+                query += " RETURNING timestamp, visitor_count"
+            self._queries[table_name] = query
+        return query
+
+    def _prepare_with(self, connection):
+        """Prepare the tables on the connection unless that already succeeded."""
+        if not self._prepared:
+            self.prepare(connection)
+            self._prepared = True
+
+    def prepare_tables(self):
+        """
+        Prepare the tables now instead of before the first write, e.g. on startup.
+
+        Raises:
+            psycopg2.Error: If the database is not reachable. The tables are prepared before the next write.
+        """
+        with self._lock:
+            if self.pool is not None:
+                with self.pool.connection() as connection:
+                    self._prepare_with(connection)
+            else:
+                self._prepare_with(self.connection)
+
+    def _write(self, rows_per_table: dict) -> int:
+        """
+        Write the rows of every table in a single transaction.
+
+        Raises:
+            psycopg2.Error: If the rows could not be written. The transaction is rolled back.
+        """
+        if self.pool is not None:
+            with self.pool.connection() as connection:
+                return self._write_with(connection, rows_per_table)
+        return self._write_with(self.connection, rows_per_table)
+
+    def _write_with(self, connection, rows_per_table: dict) -> int:
+        """Write the rows of every table in a single transaction on the given connection."""
+        # The database might have been unreachable on startup.
+        self._prepare_with(connection)
+
+        start = time.perf_counter()
+        inserted = 0
+        try:
+            with connection.cursor() as cursor:
+                for table_name, rows in rows_per_table.items():
+                    # A single page, so the row count covers the whole batch.
+                    if self.rollups:
+                        inserted_rows = execute_values(cursor, self._query(table_name), rows, page_size=len(rows), fetch=True)
+                        rollups.upsert(cursor, table_name, inserted_rows)
+                        inserted += len(inserted_rows)
+                    else:
+                        execute_values(cursor, self._query(table_name), rows, page_size=len(rows))
+                        inserted += cursor.rowcount
+            connection.commit()
+        except Exception:
+            metrics.db_failures_total.inc()
+            if not connection.closed:
+                connection.rollback()
+            raise
+
+        row_count = sum(len(rows) for rows in rows_per_table.values())
+        seconds = time.perf_counter() - start
+        metrics.db_write_seconds.observe(seconds)
+        self.flush_seconds += seconds
+        self.rows_written += row_count
+        self.rows_skipped += row_count - inserted
+        if row_count > inserted:
+            metrics.duplicate_rows_total.inc(row_count - inserted)
+        self.flush_count += 1
+        return row_count
+
+    def flush(self) -> int:
+        """
+        Write every buffered row to the database, spooled rows in batches of max_rows.
+
+        Returns:
+            int: The number of rows written.
+
+        Raises:
+            psycopg2.Error: If the rows could not be written. The transaction is rolled back and the rows stay buffered.
+        """
+        with self._lock:
+            row_count, table_names, skipped = 0, set(), self.rows_skipped
+
+            if self.spool is None:
+                if self._row_count:
+                    row_count = self._write(self._rows)
+                    table_names.update(self._rows)
+                    self._rows, self._row_count = {}, 0
+            else:
+                while True:
+                    rows, end = self.spool.read(self.max_rows)
+                    if not rows:
+                        break
+                    rows_per_table = {}
+                    for table_name, values in rows:
+                        rows_per_table.setdefault(table_name, []).append(values)
+                    row_count += self._write(rows_per_table)
+                    table_names.update(rows_per_table)
+                    self.spool.acknowledge(end)
+
+            self._oldest = None
+
+        if row_count:
+            skipped = self.rows_skipped - skipped
+            duplicates = f", {skipped} were already saved" if skipped else ""
+            utils_log.log(f"Successfully saved {row_count} rows into {len(table_names)} tables ({self.rows_per_second:.0f} rows/s{duplicates}).", self.log_file_path)
+        return row_count
+
+    def close(self):
+        """
+        Flush the remaining rows, e.g. on shutdown.
+        """
+        self.flush()
@@ -1,25 +1,332 @@
+"""Logging through a bounded queue and a background writer thread, with rate limiting and log rotation."""
+import os
+import re
+import gzip
+import json
+import time
+import queue
+import atexit
+import shutil
+import threading
 from datetime import datetime
 
-def log(message: str, file_path: str = None):
+from . import config
+
+DEBUG, INFO, WARNING, ERROR = 10, 20, 30, 40
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR"}
+
+
+def log(message: str, file_path: str = None, level: int = INFO, sample: int = 1):
     """
-    Write a log message to a file or print it to the console.
+    Write a log message to a file and print it to the console.
+
+    The message is handed over to a background thread, the caller never waits for the disk. Similar messages beyond
+    the rate limit are suppressed and summarized once the window is over, errors are never suppressed.
 
     Args:
-        file_path (str): The path to the log file. If None, the message will be printed to the console.
         message (str): The log message to write.
+        file_path (str, optional): The path to the log file. If None, the message is only printed to the console.
+        level (int, optional): DEBUG, INFO, WARNING or ERROR. Messages below LOG_LEVEL are dropped. Defaults to INFO.
+        sample (int, optional): Only log every n-th of the similar messages, e.g. for messages of every tick.
+            Defaults to 1, every message.
+    """
+    logger.log(message, file_path, level, sample)
+
+
+def record(fields: dict, file_path: str):
+    """
+    Write a structured record as a JSON line, e.g. the timings of a tick.
+
+    Records go through the same background writer as the messages but are neither rate limited nor printed.
+
+    Args:
+        fields (dict): The JSON serializable fields of the record.
+        file_path (str): The path to the file of the records.
+    """
+    logger.record(fields, file_path)
+
+
+def flush():
+    """
+    Wait until every queued message is written and flushed to disk.
+    """
+    logger.flush()
+
+
+class _RateLimiter:
+    """
+    Counts similar messages (the same text with any numbers) per file within a time window.
+    """
+
+    NUMBERS = re.compile(r"\d+")
+
+    def __init__(self, limit: int, window: float):
+        self.limit = limit
+        self.window = window
+        self._windows = {}  # (file_path, pattern) -> [window start, seen, suppressed, sampled]
+        self._lock = threading.Lock()
+
+    def check(self, message: str, file_path: str, sample: int) -> tuple:
+        """
+        Decide whether a message is logged.
+
+        Returns:
+            tuple: Whether to log the message, and the number of similar messages suppressed in the last window.
+        """
+        key = (file_path, self.NUMBERS.sub("#", message))
+        now = time.monotonic()
+        with self._lock:
+            state = self._windows.get(key)
+            suppressed = 0
+            if state is None or now - state[0] >= self.window:
+                suppressed = state[2] if state else 0
+                sampled = state[3] if state else 0
+                self._prune(now)
+                state = self._windows[key] = [now, 0, 0, sampled]
+
+            state[3] += 1
+            if sample > 1 and (state[3] - 1) % sample:
+                return False, suppressed
+            state[1] += 1
+            if state[1] > self.limit:
+                state[2] += 1
+                return False, suppressed
+            return True, suppressed
+
+
+    def _prune(self, now: float):
+        """Drop the expired windows, one with suppressed messages is kept for another window to report them."""
+        self._windows = {
+            key: state for key, state in self._windows.items()
+            if now - state[0] < (2 * self.window if state[2] else self.window)
+        }
+
+
+class _LogFile:
+    """
+    An open log file which is rotated by size and day and compressed on rotation.
+    """
+
+    def __init__(self, path: str, max_bytes: int, backup_count: int, rotate_daily: bool):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.rotate_daily = rotate_daily
+        self._open()
+
+    def _open(self):
+        # The log directory is created on the first write.
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._file = open(self.path, mode="a", encoding="utf-8")
+        self.size = self._file.tell()
+        # The day of an existing file is the day it was last written.
+        self.day = datetime.fromtimestamp(os.path.getmtime(self.path)).date() if self.size else datetime.now().date()
+
+    def write(self, line: str, now: datetime):
+        if self.size and (self.size + len(line) > self.max_bytes or (self.rotate_daily and now.date() != self.day)):
+            self.rotate()
+        self._file.write(line)
+        self.size += len(line)
+
+    def rotate(self):
+        """Compress the current file to "<path>.<timestamp>.gz" and remove the oldest backups."""
+        self._file.close()
+        rotated_path = f"{self.path}.{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}"
+        os.replace(self.path, rotated_path)
+        with open(rotated_path, mode="rb") as source, gzip.open(f"{rotated_path}.gz", mode="wb") as target:
+            shutil.copyfileobj(source, target)
+        os.remove(rotated_path)
+
+        directory, name = os.path.split(self.path)
+        backups = sorted(file_name for file_name in os.listdir(directory or ".") if file_name.startswith(f"{name}.") and file_name.endswith(".gz"))
+        for file_name in backups[:max(0, len(backups) - self.backup_count)]:
+            os.remove(os.path.join(directory, file_name))
+        self._open()
+
+    def reopen_if_removed(self):
+        """Reopen the file if it was removed or rotated by someone else, e.g. logrotate."""
+        if not os.path.exists(self.path):
+            self._file.close()
+            self._open()
+
+    def flush(self):
+        self._file.flush()
 
-    Note:
-        If file_path is provided, the log file is opened in append mode and the log message is written to the file.
-        If file_path is None, the log message is printed to the console.
+    def close(self):
+        self._file.close()
+
+
+class QueueLogger:
     """
+    Logger which hands the messages over to a background writer thread through a bounded queue.
+
+    The writer thread keeps the log files open, writes every queued message and flushes once the queue is drained.
+    If the queue is full (e.g. the disk stalls) messages are dropped and counted instead of blocking the caller.
+
+    Example:
+        logger = QueueLogger()
+        logger.log("Fetched the data.", "requests.log")
+        logger.flush()
+    """
+
+    def __init__(self, level: int = None, queue_size: int = None, max_bytes: int = None, backup_count: int = None,
+                 rotate_daily: bool = None, rate_limit: int = None, rate_window: float = None, console: bool = True):
+        """
+        Args:
+            level (int, optional): The minimum level. Defaults to LOG_LEVEL.
+            queue_size (int, optional): The maximum number of queued messages. Defaults to LOG_QUEUE_SIZE.
+            max_bytes (int, optional): Rotate a log file once it exceeds this size. Defaults to LOG_MAX_BYTES.
+            backup_count (int, optional): How many rotated files are kept. Defaults to LOG_BACKUP_COUNT.
+            rotate_daily (bool, optional): Also rotate on the first message of a new day. Defaults to LOG_ROTATE_DAILY.
+            rate_limit (int, optional): Similar messages per window. Defaults to LOG_RATE_LIMIT.
+            rate_window (float, optional): The rate limit window in seconds. Defaults to LOG_RATE_WINDOW.
+            console (bool, optional): Also print the messages to the console. Defaults to True.
+        """
+        # Resolved from the active configuration when the writer starts, see _configure.
+        self._settings = {
+            "level": level, "queue_size": queue_size, "max_bytes": max_bytes, "backup_count": backup_count,
+            "rotate_daily": rotate_daily, "rate_limit": rate_limit, "rate_window": rate_window,
+        }
+        self.console = console
+        self.level = self.max_bytes = self.backup_count = self.rotate_daily = None
+        self.rate_limiter = None
+        self._queue = None
+        self._files = {}
+        self._checked_files = set()  # Files which were checked for removal in the current batch.
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+        # Statistics.
+        self.dropped = 0
+
+    def log(self, message: str, file_path: str = None, level: int = INFO, sample: int = 1):
+        """
+        Queue a log message, see utils_log.log.
+        """
+        self._configure()
+        if level < self.level:
+            return
+
+        now = datetime.now()
+        if level < ERROR:
+            logged, suppressed = self.rate_limiter.check(message, file_path, sample)
+            if suppressed:
+                self._put(now, WARNING, f"Suppressed {suppressed} messages similar to: {message}", file_path)
+            if not logged:
+                return
+        self._put(now, level, message, file_path)
+
+    def record(self, fields: dict, file_path: str):
+        """
+        Queue a structured record, see utils_log.record.
+        """
+        self._configure()
+        self._put(datetime.now(), None, json.dumps(fields, separators=(",", ":")), file_path)
+
+    def _configure(self):
+        """Resolve the settings which were not passed from the active configuration, once on first use."""
+        if self._queue is not None:
+            return
+        with self._thread_lock:
+            if self._queue is not None:
+                return
+            settings = config.get_config()
+
+            def resolve(name: str, setting: str):
+                value = self._settings[name]
+                return value if value is not None else getattr(settings, setting)
+
+            self.level = self._settings["level"]
+            if self.level is None:
+                self.level = {name: level for level, name in LEVEL_NAMES.items()}[settings.LOG_LEVEL.upper()]
+            self.max_bytes = resolve("max_bytes", "LOG_MAX_BYTES")
+            self.backup_count = resolve("backup_count", "LOG_BACKUP_COUNT")
+            self.rotate_daily = resolve("rotate_daily", "LOG_ROTATE_DAILY")
+            self.rate_limiter = _RateLimiter(resolve("rate_limit", "LOG_RATE_LIMIT"), resolve("rate_window", "LOG_RATE_WINDOW"))
+            # Set last, it marks the logger as configured.
+            self._queue = queue.Queue(maxsize=resolve("queue_size", "LOG_QUEUE_SIZE"))
+
+    def _put(self, now: datetime, level: int, message: str, file_path: str):
+        """Hand a message over to the writer thread, drop it if the queue is full."""
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait((now, level, message, file_path))
+        except queue.Full:
+            self.dropped += 1
+
+    def _ensure_thread(self):
+        """Start the writer thread on first use (and again after a fork)."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        """Write the queued messages, flush the files whenever the queue is drained."""
+        while True:
+            record = self._queue.get()
+            try:
+                if record is not None:
+                    self._write(*record)
+                if self._queue.empty():
+                    for log_file in self._files.values():
+                        log_file.flush()
+                    self._checked_files.clear()
+            except Exception as e:
+                # The writer must survive e.g. a full disk, the message is lost.
+                self.dropped += 1
+                print(f"Could not write the log message: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _write(self, now: datetime, level: int, message: str, file_path: str):
+        """Format and write a single message, a record (level None) is written as it is."""
+        if level is None:
+            self._get_file(file_path).write(f"{message}\n", now)
+            return
+
+        level_name = "" if level == INFO else f"{LEVEL_NAMES.get(level, level)}: "
+        log_message = f"Timestamp {now.strftime('%d-%m-%Y-%H-%M')}: {level_name}{message}"
+
+        if file_path is not None:
+            self._get_file(file_path).write(f"{log_message}\n", now)
+
+        if self.console:
+            print(log_message)
+
+    def _get_file(self, file_path: str) -> _LogFile:
+        """Return the open log file, open it on first use."""
+        log_file = self._files.get(file_path)
+        if log_file is None:
+            log_file = self._files[file_path] = _LogFile(file_path, self.max_bytes, self.backup_count, self.rotate_daily)
+            self._checked_files.add(file_path)
+        elif file_path not in self._checked_files:
+            # One stat per file and batch instead of per message.
+            log_file.reopen_if_removed()
+            self._checked_files.add(file_path)
+        return log_file
+
+    def flush(self):
+        """
+        Wait until every queued message is written and flushed to disk.
+        """
+        if self._thread is None:
+            return
+        self._queue.put(None)  # Makes the writer flush even if the queue was empty.
+        self._queue.join()
 
-    timestamp = datetime.now().strftime('%d-%m-%Y-%H-%M')
-    log_message = f"Timestamp {timestamp}: {message}"
+    def close(self):
+        """
+        Flush and close the open log files.
+        """
+        self.flush()
+        for log_file in list(self._files.values()):
+            log_file.close()
+        self._files = {}
 
-    if file_path is not None:
-        with open(file_path, mode="a", encoding="utf-8") as file:
-            file.write(log_message)
-            file.write("\n")
 
-    print(log_message)
-    print("_" * 50)
+logger = QueueLogger()
+atexit.register(logger.flush)
@@ -6,6 +6,7 @@ create_directories() {
     "$PWD/app/data/ffgr/data" "$PWD/app/logs/ffgr/logs"
     "$PWD/app/data/ffda/data" "$PWD/app/logs/ffda/logs"
     "$PWD/app/data/ffhb/data" "$PWD/app/logs/ffhb/logs"
+    "$PWD/app/logs/all/logs"
     "$PWD/grafana_data"  "$PWD/postgres"
   )
   # Create every directory in the list inside the container.
@@ -23,6 +24,7 @@ clean_dev_environment() {
     "$PWD/app/data/ffgr" "$PWD/app/logs/ffgr"
     "$PWD/app/data/ffda" "$PWD/app/logs/ffda"
     "$PWD/app/data/ffhb" "$PWD/app/logs/ffhb"
+    "$PWD/app/logs/all"
     "$PWD/grafana_data/" "$PWD/postgres/"
   )
 